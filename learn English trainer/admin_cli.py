@@ -0,0 +1,318 @@
+# Headless batch tools of adminka: the same operations as the Tk window, for thousands of rows at once.
+# Input is a CSV file (with a header line) or a JSONL file (one JSON object per line):
+#   python admin_cli.py import --table general_words words.csv            (column: word)
+#   python admin_cli.py retranslate --table general_words fixes.jsonl     (columns: id_nr, native_lang)
+#   python admin_cli.py image --table general_words pictures.csv          (columns: id_nr, filename)
+#   python admin_cli.py pronounce --table general_words sounds.csv        (columns: id_nr, text)
+# Every batch is one transaction; --dry-run checks the input and reports what would change.
+
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import db_pool
+import media
+import adminka
+
+# Columns every record of an operation must have
+REQUIRED_FIELDS = {
+    "import": ("word",),
+    "retranslate": ("id_nr", "native_lang"),
+    "image": ("id_nr", "filename"),
+    "pronounce": ("id_nr", "text"),
+}
+
+
+class BatchReport:
+    """
+    Counts the records of a batch run and prints the progress.
+
+    Attributes:
+    operation (str): The name of the operation.
+    total (int): The number of records read.
+    done (int): The number of records changed (or that would change in a dry run).
+    skipped (int): The number of records that needed no change.
+    failed (list): The (record number, reason) pairs of the records that failed.
+    """
+    def __init__(self, operation, total):
+        self.operation = operation
+        self.total = total
+        self.done = 0
+        self.skipped = 0
+        self.failed = []
+        self.started = time.perf_counter()
+
+    def fail(self, number, reason):
+        """
+        Records a failed record.
+
+        Parameters:
+        number (int): The record number in the input file (1 is the first record).
+        reason (str): Why the record failed.
+        """
+        self.failed.append((number, reason))
+
+    def progress(self):
+        """
+        Prints how many records have been processed so far.
+        """
+        processed = self.done + self.skipped + len(self.failed)
+        rate = processed / max(time.perf_counter() - self.started, 1e-9)
+        print(f"{self.operation}: {processed}/{self.total} records, {self.done} done, "
+              f"{self.skipped} skipped, {len(self.failed)} failed ({rate:.1f} records/s)")
+
+    def summary(self, dry_run=False):
+        """
+        Prints the result of the run and the failed records.
+
+        Parameters:
+        dry_run (bool): The run changed nothing.
+        """
+        verb = "would change" if dry_run else "changed"
+        print(f"{self.operation}: {self.done} {verb}, {self.skipped} skipped, {len(self.failed)} failed "
+              f"in {time.perf_counter() - self.started:.1f}s")
+        for number, reason in self.failed:
+            print(f"  record {number}: {reason}")
+
+
+def read_records(path):
+    """
+    Reads the records of a CSV or JSONL file.
+
+    Parameters:
+    path (str): The path to the input file (.jsonl/.json lines or .csv).
+
+    Returns:
+    list: The records as dictionaries.
+    """
+    with open(path, encoding="utf-8-sig", newline="") as open_file:
+        if path.lower().endswith((".jsonl", ".json")):
+            return [json.loads(line) for line in open_file if line.strip()]
+        return list(csv.DictReader(open_file))
+
+
+def validate(operation, records, report):
+    """
+    Drops the records without the required fields or with a bad ID number.
+
+    Parameters:
+    operation (str): The name of the operation.
+    records (list): The records read from the input file.
+    report (BatchReport): The report to record the failures in.
+
+    Returns:
+    list: The (record number, record) pairs of the valid records.
+    """
+    valid = []
+    for number, record in enumerate(records, start=1):
+        missing = [field for field in REQUIRED_FIELDS[operation] if not str(record.get(field) or "").strip()]
+        if missing:
+            report.fail(number, f"missing {', '.join(missing)}")
+            continue
+        if "id_nr" in record:
+            try:
+                record["id_nr"] = int(record["id_nr"])
+            except (TypeError, ValueError):
+                report.fail(number, f"bad id_nr {record['id_nr']!r}")
+                continue
+        valid.append((number, record))
+    return valid
+
+
+def existing_ids(cur, table_name, ids):
+    """
+    Finds which ID numbers of a batch are in the table with one query.
+
+    Parameters:
+    cur (sqlite3.Cursor): A cursor object.
+    table_name (str): The name of the table to work with.
+    ids (list): The ID numbers to look up.
+
+    Returns:
+    set: The ID numbers found.
+    """
+    if not ids:
+        return set()
+    placeholders = ", ".join("?" * len(ids))
+    cur.execute(f"SELECT id_nr FROM {table_name} WHERE id_nr IN ({placeholders})", list(ids))
+    return {row[0] for row in cur.fetchall()}
+
+
+def run_import(db, cur, conn, table_name, batch, report, dry_run):
+    """
+    Adds the new words of a batch, translated and pronounced in parallel.
+
+    Parameters:
+    db (adminka.db_sql): The database operations.
+    cur (sqlite3.Cursor): A cursor object.
+    conn (sqlite3.Connection): A connection object.
+    table_name (str): The name of the table to work with.
+    batch (list): The (record number, record) pairs of the batch.
+    report (BatchReport): The report of the run.
+    dry_run (bool): Only count the words that would be added.
+
+    Returns:
+    int: The number of words added (or that would be added in a dry run).
+    """
+    words = [record["word"].strip() for number, record in batch]
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,))
+    if cur.fetchone():
+        new_words = db.new_words_only(cur, table_name, words)
+    else:
+        new_words = list(dict.fromkeys(words))  # dry run of a new table: every word is new
+    report.skipped += len(words) - len(new_words)
+    if dry_run:
+        return len(new_words)
+    rows, failed_words = db.prepare_rows(new_words)
+    variants = db.make_media_variants(conn, rows)
+    added = db.write_rows(cur, table_name, rows)
+    media.add_variants(conn, variants)
+    numbers = {record["word"].strip(): number for number, record in batch}
+    for word in failed_words:
+        report.fail(numbers[word], f"{word} could not be translated")
+    return added
+
+
+def run_updates(operation, db, cur, conn, table_name, batch, report, dry_run):
+    """
+    Applies the changes of a batch to existing words. The pronunciations of a batch
+    are generated in parallel before the rows are written.
+
+    Parameters:
+    operation (str): "retranslate", "image" or "pronounce".
+    db (adminka.db_sql): The database operations.
+    cur (sqlite3.Cursor): A cursor object.
+    conn (sqlite3.Connection): A connection object.
+    table_name (str): The name of the table to work with.
+    batch (list): The (record number, record) pairs of the batch.
+    report (BatchReport): The report of the run.
+    dry_run (bool): Only check the records.
+
+    Returns:
+    int: The number of words changed (or that would change in a dry run).
+    """
+    found = existing_ids(cur, table_name, [record["id_nr"] for number, record in batch])
+    ready = []
+    for number, record in batch:
+        if record["id_nr"] not in found:
+            report.fail(number, f"no word with id_nr={record['id_nr']}")
+        elif operation == "image" and not os.path.exists(f"images/{record['filename']}.png"):
+            report.fail(number, f"no picture images/{record['filename']}.png")
+        else:
+            ready.append((number, record))
+    if dry_run:
+        return len(ready)
+
+    changed = 0
+    if operation == "image":
+        # Every picture is resized before the first row of the batch is changed
+        prepared = [db.prepare_image(conn, record["filename"]) for number, record in ready]
+        for (number, record), picture in zip(ready, prepared):
+            if picture is not None and db.change_image(conn, cur, table_name, record["id_nr"], record["filename"],
+                                                       commit=False, prepared=picture):
+                changed += 1
+            else:
+                report.fail(number, "the picture could not be stored")
+        return changed
+
+    text_field, lang = ("native_lang", "ru") if operation == "retranslate" else ("text", "en")
+    pipeline = adminka.get_pipeline()
+    with ThreadPoolExecutor(max_workers=pipeline.max_workers) as executor:
+        sounds = list(executor.map(lambda item: db.get_tts_audio(item[1][text_field], lang=lang), ready))
+    # Every pronunciation is transcoded before the first row of the batch is changed
+    prepared = db.prepare_sounds(conn, sounds)
+    for (number, record), sound, stored in zip(ready, sounds, prepared):
+        if sound is None:
+            report.fail(number, f"no pronunciation for {record[text_field]!r}")
+        elif operation == "retranslate":
+            if db.change_ru_translation(conn, cur, table_name, record["id_nr"], record["native_lang"],
+                                        commit=False, prepared=stored):
+                changed += 1
+            else:
+                report.fail(number, "the translation could not be stored")
+        else:
+            db.replace_change_en_pron(conn, cur, table_name, record["id_nr"], record["text"],
+                                      commit=False, prepared=stored)
+            changed += 1
+    return changed
+
+
+def run(operation, db, conn, records, batch_size, dry_run=False):
+    """
+    Runs an operation over the records batch by batch, one transaction per batch.
+
+    Parameters:
+    operation (str): "import", "retranslate", "image" or "pronounce".
+    db (adminka.db_sql): The database operations of the table.
+    conn (sqlite3.Connection): A connection object.
+    records (list): The records read from the input file.
+    batch_size (int): The number of records per transaction.
+    dry_run (bool): Check the records and report, change nothing.
+
+    Returns:
+    BatchReport: The report of the run.
+    """
+    cur = conn.cursor()
+    table_name = db.table_name
+    report = BatchReport(operation, len(records))
+    if operation == "import" and not dry_run:
+        db.create_table(cur, conn, table_name)
+    valid = validate(operation, records, report)
+    for start in range(0, len(valid), batch_size):
+        batch = valid[start:start + batch_size]
+        skipped, failed = report.skipped, len(report.failed)
+        try:
+            if operation == "import":
+                done = run_import(db, cur, conn, table_name, batch, report, dry_run)
+            else:
+                done = run_updates(operation, db, cur, conn, table_name, batch, report, dry_run)
+            if not dry_run:
+                conn.commit()
+            report.done += done  # only what the commit stored
+        except Exception as e:
+            conn.rollback()
+            # Every record of the batch is counted once, as failed
+            report.skipped, report.failed[failed:] = skipped, []
+            for number, record in batch:
+                report.fail(number, f"batch rolled back: {e}")
+        report.progress()
+    report.summary(dry_run)
+    return report
+
+
+def main():
+    """
+    Command line entry point of the batch tools.
+    """
+    parser = argparse.ArgumentParser(description="Batch changes of the word tables without the Tk window")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    helps = {
+        "import": "add new words (column: word)",
+        "retranslate": "replace translations and their pronunciation (columns: id_nr, native_lang)",
+        "image": "replace pictures with images/<filename>.png (columns: id_nr, filename)",
+        "pronounce": "replace English pronunciations (columns: id_nr, text)",
+    }
+    for command, help_text in helps.items():
+        command_parser = subparsers.add_parser(command, help=help_text)
+        command_parser.add_argument("input", help="CSV file with a header line, or JSONL file")
+        command_parser.add_argument("--table", required=True, help="the word table to change")
+        command_parser.add_argument("--db", help="path to the data base (default is the one adminka uses)")
+        command_parser.add_argument("--batch-size", type=int, default=adminka.nmb_of_wrds,
+                                    help="records per transaction")
+        command_parser.add_argument("--dry-run", action="store_true", help="check the input, change nothing")
+    args = parser.parse_args()
+
+    db = adminka.db_sql(adminka.db_name, args.batch_size, args.table)
+    if args.db:
+        conn = db_pool.connect(args.db)
+    else:
+        path, cur, conn = db.setup_base()
+    report = run(args.command, db, conn, read_records(args.input), args.batch_size, args.dry_run)
+    conn.close()
+    raise SystemExit(1 if report.failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,23 @@
 # Works with PYTHON 3.12 and googletrans==4.0.0-rc1
 # google allows to process <250 words at one launch
 
-import sqlite3
 import os
+import locale
 from datetime import datetime
-from googletrans import Translator
-from gtts import gTTS
-import io
-from tkinter import *
-import tkinter as tk
 import paths_info
-
-# Current date and time
-currant_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-# Initialize the translator
-translator = Translator()
-
-# User's data
-user_name_1 = paths_info.user_1
-user_name_2 = paths_info.user_2
-user_name_3 = paths_info.user_3
+import db_pool
+import media
+import media_store
+import progress
+import ingest
+import provider_cache
+import audio_variants
+import image_variants
+import search
+import word_cache
+
+# The translation and pronunciation pipeline, created on first use (see get_pipeline)
+pipeline = None
 
 # DB setup data
 db_name = paths_info.data_base_name
@@ -34,6 +31,31 @@ folder_for_images_path = paths_info.images_folder_path
 # TEXT folder path
 folder_for_texts_path = paths_info.texts_folder_path
 
+def get_pipeline():
+    """
+    Creates the translation and pronunciation pipeline on first use (providers are set in paths_info),
+    results already received once are taken from the provider cache.
+
+    Returns:
+    ingest.IngestPipeline: The shared pipeline.
+    """
+    global pipeline
+    if pipeline is None:
+        pipeline = ingest.IngestPipeline(cache=provider_cache.ProviderCache())
+    return pipeline
+
+def words_file_for(table_name):
+    """
+    Builds the path of the initial words file of a table.
+
+    Parameters:
+    table_name (str): The name of the table.
+
+    Returns:
+    str: The path to the initial words file.
+    """
+    return f"{folder_for_texts_path}\\{table_name}.txt"
+
 def pick_up_table():
     """
     Chooses a table from the database based on user input.
@@ -50,12 +72,6 @@ def pick_up_table():
         user_input = 0
     return tables[user_input]
 
-# Select the table based on user input
-table_name = pick_up_table()
-
-# Path to the initial words file
-initial_words_file = f"{folder_for_texts_path}\\{table_name}.txt"
-
 class db_sql:
     """
     A class to handle database operations.
@@ -64,18 +80,12 @@ class db_sql:
     db_name (str): The name of the database file.
     nmb_of_wrds (int): The number of words to process at once.
     table_name (str): The name of the table to work with.
-    user_name_1 (str): The first user's column name.
-    user_name_2 (str): The second user's column name.
-    user_name_3 (str): The third user's column name.
     initial_words_file (str): The path to the initial words file.
     """
-    def __init__(self, db_name, nmb_of_wrds):
+    def __init__(self, db_name, nmb_of_wrds, table_name, initial_words_file=None):
         self.table_name = table_name
-        self.user_name_1 = user_name_1
-        self.user_name_2 = user_name_2
-        self.user_name_3 = user_name_3
         self.nmb_of_wrds = nmb_of_wrds
-        self.initial_words_file = initial_words_file
+        self.initial_words_file = initial_words_file or words_file_for(table_name)
         self.db_name = db_name
 
     def read_words_file(self, nmb_of_wrds):
@@ -106,35 +116,174 @@ class db_sql:
         tuple: A tuple containing the path to the database, a cursor object, and a connection object.
         """
         path = os.path.dirname(os.path.abspath(__file__))
-        conn = sqlite3.connect(path + '/' + self.db_name)
+        conn = db_pool.connect(path + '/' + self.db_name)
         cur = conn.cursor()
         return path, cur, conn
 
-    def setup_table(self, li_from_file, cur, conn, table_name):
+    def iter_word_chunks(self, chunk_size, start_offset=0, start_line=0):
         """
-        Adds new rows to the existing User table in the database.
+        Streams the initial words file in chunks, starting from a byte offset.
+
+        Parameters:
+        chunk_size (int): The number of words per chunk.
+        start_offset (int): The byte offset to start reading from.
+        start_line (int): The line number of the start offset.
+
+        Yields:
+        tuple: A list of words, and the byte offset and line number right after the chunk.
+        """
+        encoding = locale.getpreferredencoding(False)  # the same encoding as read_words_file
+        offset, line_no = start_offset, start_line
+        chunk = []
+        with open(self.initial_words_file, 'rb') as open_file:
+            open_file.seek(start_offset)
+            for raw_line in iter(open_file.readline, b''):
+                offset += len(raw_line)
+                line_no += 1
+                line = raw_line.decode(encoding)
+                if not line.strip():  # Skip empty lines
+                    continue
+                chunk.append(line.rstrip())
+                if len(chunk) >= chunk_size:
+                    yield chunk, offset, line_no
+                    chunk = []
+        if chunk:
+            yield chunk, offset, line_no
+
+    def load_checkpoint(self, cur, table_name):
+        """
+        Reads where the last import of the initial words file into a table stopped.
+
+        Parameters:
+        cur (sqlite3.Cursor): A cursor object.
+        table_name (str): The name of the table to work with.
+
+        Returns:
+        tuple: The byte offset and the line number to resume from ((0, 0) for a new import).
+        """
+        cur.execute("""CREATE TABLE IF NOT EXISTS import_checkpoints (
+            table_name TEXT,
+            file_path TEXT,
+            byte_offset INTEGER,
+            line_no INTEGER,
+            updated_at TEXT,
+            PRIMARY KEY (table_name, file_path))""")
+        cur.execute("""CREATE TABLE IF NOT EXISTS import_failures (
+            table_name TEXT,
+            file_path TEXT,
+            word TEXT,
+            line_no INTEGER,
+            failed_at TEXT,
+            PRIMARY KEY (table_name, file_path, word))""")
+        cur.execute("SELECT byte_offset, line_no FROM import_checkpoints WHERE table_name = ? AND file_path = ?",
+                    (table_name, self.initial_words_file))
+        row = cur.fetchone()
+        return (row[0], row[1]) if row else (0, 0)
+
+    def save_checkpoint(self, cur, table_name, byte_offset, line_no):
+        """
+        Records how far the initial words file has been imported. The caller commits.
+
+        Parameters:
+        cur (sqlite3.Cursor): A cursor object.
+        table_name (str): The name of the table to work with.
+        byte_offset (int): The byte offset after the last imported chunk.
+        line_no (int): The line number after the last imported chunk.
+        """
+        cur.execute("""INSERT OR REPLACE INTO import_checkpoints
+            (table_name, file_path, byte_offset, line_no, updated_at) VALUES (?, ?, ?, ?, ?)""",
+            (table_name, self.initial_words_file, byte_offset, line_no,
+             datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+    def save_failures(self, cur, table_name, failed_words, line_no):
+        """
+        Records the words of the initial words file that could not be added. The caller commits.
+
+        Parameters:
+        cur (sqlite3.Cursor): A cursor object.
+        table_name (str): The name of the table to work with.
+        failed_words (list): The words that could not be translated.
+        line_no (int): The line number after the chunk of the words.
+        """
+        failed_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        cur.executemany("""INSERT OR REPLACE INTO import_failures
+            (table_name, file_path, word, line_no, failed_at) VALUES (?, ?, ?, ?, ?)""",
+            [(table_name, self.initial_words_file, word, line_no, failed_at) for word in failed_words])
+
+    def retry_failures(self, cur, conn, table_name):
+        """
+        Tries again to add the words recorded by earlier imports of the initial words file.
 
         Parameters:
-        li_from_file (list): A list of words to add.
         cur (sqlite3.Cursor): A cursor object.
         conn (sqlite3.Connection): A connection object.
         table_name (str): The name of the table to work with.
+
+        Returns:
+        tuple: The number of rows added, and the words that failed again.
+        """
+        cur.execute("SELECT word, line_no FROM import_failures WHERE table_name = ? AND file_path = ?",
+                    (table_name, self.initial_words_file))
+        lines = dict(cur.fetchall())
+        if not lines:
+            return 0, []
+        rows, failed_words = self.prepare_rows(self.new_words_only(cur, table_name, list(lines)))
+        variants = self.make_media_variants(conn, rows)
+        added = self.write_rows(cur, table_name, rows)
+        media.add_variants(conn, variants)
+        cur.executemany("DELETE FROM import_failures WHERE table_name = ? AND file_path = ? AND word = ?",
+                        [(table_name, self.initial_words_file, word) for word in lines if word not in failed_words])
+        conn.commit()
+        print(f"{table_name}: {added} of {len(lines)} words of earlier runs added")
+        return added, failed_words
+
+    def import_words_file(self, cur, conn, table_name, chunk_size=None):
         """
-        # Get translations
-        translated_words = [translator.translate(word, dest="ru").text for word in li_from_file]
+        Imports the whole initial words file chunk by chunk and can resume after a stop.
+        Every chunk and its checkpoint are committed in one transaction. Words that could not
+        be translated (e.g. the daily limit is reached) are recorded in import_failures and
+        skipped, so they do not hold the checkpoint back; the next run tries them again first.
 
-        # Get audio
-        ru_sound_data_dict = {
-            li_from_file[i]: self.get_tts_audio(translated_words[i], lang='ru')
-            for i in range(len(translated_words))
-        }
+        Parameters:
+        cur (sqlite3.Cursor): A cursor object.
+        conn (sqlite3.Connection): A connection object.
+        table_name (str): The name of the table to work with.
+        chunk_size (int): The number of words per chunk (default is nmb_of_wrds).
 
-        en_sound_data_dict = {
-            word: self.get_tts_audio(word, lang='en')
-            for word in li_from_file
-        }
+        Returns:
+        int: The number of rows added.
+        """
+        chunk_size = chunk_size or self.nmb_of_wrds
+        self.create_table(cur, conn, table_name)
+        start_offset, start_line = self.load_checkpoint(cur, table_name)
+        if start_line:
+            print(f"Resuming {table_name} from line {start_line}")
+        added, failed = self.retry_failures(cur, conn, table_name)
+        for chunk, byte_offset, line_no in self.iter_word_chunks(chunk_size, start_offset, start_line):
+            rows, failed_words = self.prepare_rows(self.new_words_only(cur, table_name, chunk))
+            variants = self.make_media_variants(conn, rows)
+            added += self.write_rows(cur, table_name, rows)
+            media.add_variants(conn, variants)
+            self.save_failures(cur, table_name, failed_words, line_no)
+            self.save_checkpoint(cur, table_name, byte_offset, line_no)
+            conn.commit()
+            failed += failed_words
+            print(f"{table_name}: line {line_no}, {added} words added, {len(failed)} failed")
+        if failed:
+            print(f"{len(failed)} words could not be added, run again to retry them: {', '.join(failed)}")
+        return added
 
-        # Create table if not exists
+    def create_table(self, cur, conn, table_name):
+        """
+        Creates a word table if it does not exist, with its search index and the triggers
+        of the word cache, so the running trainer finds its words and sees their changes
+        without a restart.
+
+        Parameters:
+        cur (sqlite3.Cursor): A cursor object.
+        conn (sqlite3.Connection): A connection object.
+        table_name (str): The name of the table to create.
+        """
         cur.execute(f"""CREATE TABLE IF NOT EXISTS {table_name} (
             id_nr INTEGER PRIMARY KEY AUTOINCREMENT,
             words TEXT UNIQUE,
@@ -142,41 +291,140 @@ class db_sql:
             en_sounds BLOB,
             ru_sounds BLOB,
             image BLOB,
-            {user_name_1} TEXT, date_stamp_1 TEXT,
-            {user_name_2} TEXT, date_stamp_2 TEXT,
-            {user_name_3} TEXT, date_stamp_3 TEXT)""")
-
-        for en_word, ru_word in zip(li_from_file, translated_words):
-            # Skip if word already exists
-            cur.execute(f"SELECT 1 FROM {table_name} WHERE words = ?", (en_word,))
-            if cur.fetchone():
-                continue
+            {media.hash_columns_sql()})""")
+        # Tables created before the hash columns existed
+        media.ensure_hash_columns(conn, table_name)
+        search.ensure_index(conn, table_name)
+        word_cache.ensure_triggers(conn, table_name)
+
+    def new_words_only(self, cur, table_name, li_from_file, batch_size=500):
+        """
+        Drops the words that are already in the table (or repeated in the list) before
+        any translation or pronunciation is requested for them.
+
+        Parameters:
+        cur (sqlite3.Cursor): A cursor object.
+        table_name (str): The name of the table to work with.
+        li_from_file (list): A list of words to add.
+        batch_size (int): The number of words looked up per query.
+
+        Returns:
+        list: The words not in the table yet, in their original order.
+        """
+        unique_words = list(dict.fromkeys(li_from_file))
+        existing = set()
+        # One query per batch of words instead of one query per word
+        for start in range(0, len(unique_words), batch_size):
+            batch = unique_words[start:start + batch_size]
+            placeholders = ", ".join("?" * len(batch))
+            cur.execute(f"SELECT words FROM {table_name} WHERE words IN ({placeholders})", batch)
+            existing.update(row[0] for row in cur.fetchall())
+        return [word for word in unique_words if word not in existing]
+
+    def prepare_rows(self, li_from_file):
+        """
+        Translates and pronounces words and stores their media.
 
-            en_sound_data = en_sound_data_dict.get(en_word)
-            ru_sound_data = ru_sound_data_dict.get(en_word)
+        Parameters:
+        li_from_file (list): A list of words to add.
+
+        Returns:
+        tuple: The list of row values ready to insert, and the list of words that could not be translated.
+        """
+        # Get translations and audio, words are processed in parallel
+        results = get_pipeline().run(li_from_file)
+        for result in results:
+            for error in result.errors:
+                print(f"Error processing {result.word}: {error}")
+
+        rows = []
+        failed_words = []
+        for result in results:
+            if result.translation is None:
+                failed_words.append(result.word)  # left for the next run
+                continue
+            en_word = result.word
 
             image_path = f'images/{en_word}.png'
             image_data = self.convert_to_binary(image_path) if os.path.exists(image_path) else None
 
-            # Set user_input values ("c" * word length)
-            user_input = "c" * len(en_word)
+            # The media goes to the content-addressed store, the row keeps its hash
+            rows.append((en_word, result.translation,
+                         *media_store.put(result.en_sound), *media_store.put(result.ru_sound),
+                         *media_store.put(image_data)))
+        return rows, failed_words
+
+    def write_rows(self, cur, table_name, rows):
+        """
+        Inserts prepared rows, skipping words that are already in the table, and the learners'
+        progress rows of the new words. The caller commits.
+
+        Parameters:
+        cur (sqlite3.Cursor): A cursor object.
+        table_name (str): The name of the table to work with.
+        rows (list): The row values from prepare_rows.
+
+        Returns:
+        int: The number of rows added.
+        """
+        # A word added meanwhile by someone else is skipped by the UNIQUE constraint
+        cur.executemany(f"""INSERT INTO {table_name} (
+            words, native_lang,
+            en_sounds_hash, en_sounds_size, ru_sounds_hash, ru_sounds_size, image_hash, image_size
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(words) DO NOTHING""", rows)
+        # rowcount leaves out the rows written by the triggers of the table (content_version, search)
+        added = cur.rowcount
+        if added:
+            # The learners' progress rows of the new words, in the same transaction
+            for user_name in paths_info.users:
+                progress.ensure_user(cur.connection, table_name, user_name, commit=False)
+        return added
 
-            cur.execute(f"""INSERT INTO {table_name} (
-                words, native_lang, en_sounds, ru_sounds, image,
-                {user_name_1}, date_stamp_1,
-                {user_name_2}, date_stamp_2,
-                {user_name_3}, date_stamp_3
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (en_word, ru_word, en_sound_data, ru_sound_data, image_data,
-             user_input, currant_date,
-             user_input, currant_date,
-             user_input, currant_date))
+    def setup_table(self, li_from_file, cur, conn, table_name):
+        """
+        Adds new rows to the existing User table in the database.
 
+        Parameters:
+        li_from_file (list): A list of words to add.
+        cur (sqlite3.Cursor): A cursor object.
+        conn (sqlite3.Connection): A connection object.
+        table_name (str): The name of the table to work with.
+        """
+        # Create table if not exists
+        self.create_table(cur, conn, table_name)
+        # Known words cost no translation or pronunciation calls
+        rows, failed_words = self.prepare_rows(self.new_words_only(cur, table_name, li_from_file))
+        # ffmpeg and Pillow run before the rows are written, the write transaction stays short
+        variants = self.make_media_variants(conn, rows)
+        self.write_rows(cur, table_name, rows)
+        media.add_variants(conn, variants)
         conn.commit()
 
+    def make_media_variants(self, conn, rows):
+        """
+        Creates the compact Opus copies of the sounds and the resized copies of the pictures
+        of new rows in the media store, as enabled in paths_info. Nothing is written to the
+        data base: call it before the rows are written.
+
+        Parameters:
+        conn (sqlite3.Connection): A connection object.
+        rows (list): The row values from prepare_rows.
+
+        Returns:
+        list: The variants to record with media.add_variants.
+        """
+        variants = []
+        # en_sounds_hash, ru_sounds_hash and image_hash are the 3rd, 5th and 7th values of a row
+        if paths_info.audio_variants_enabled:
+            variants += audio_variants.make_missing(conn, [row[2] for row in rows] + [row[4] for row in rows])
+        if paths_info.image_variants_enabled:
+            variants += image_variants.make_missing(conn, [row[6] for row in rows])
+        return variants
+
     def get_tts_audio(self, word, lang='ru'):
         """
-        Generates audio pronunciation for a given word using gTTS.
+        Generates audio pronunciation for a given word using the pronunciation provider.
 
         Parameters:
         word (str): The word to generate pronunciation for.
@@ -186,10 +434,7 @@ class db_sql:
         bytes or None: The binary audio data or None if an error occurs.
         """
         try:
-            tts = gTTS(text=word, lang=lang)
-            mp3_fp = io.BytesIO()
-            tts.write_to_fp(mp3_fp)
-            return mp3_fp.getvalue()
+            return get_pipeline().synthesize(word, lang)
         except Exception as e:
             print(f"Error generating sound for {word}: {e}")
             return None
@@ -207,7 +452,27 @@ class db_sql:
         with open(filename, 'rb') as file:
             return file.read()
 
-    def change_ru_translation(self, conn, cur, table_name, wrd_id, new_native_lang_text):
+    def prepare_sounds(self, conn, sounds):
+        """
+        Stores pronunciations and their Opus copies in the media store. Nothing is written
+        to the data base, so ffmpeg never runs inside a write transaction.
+
+        Parameters:
+        conn (sqlite3.Connection): A connection object.
+        sounds (list): The pronunciations (None for a missing one).
+
+        Returns:
+        list: The content hash, size and variants of every pronunciation.
+        """
+        stored = [media_store.put(sound) for sound in sounds]
+        by_source = {}
+        if paths_info.audio_variants_enabled:
+            for variant in audio_variants.make_missing(conn, [content_hash for content_hash, size in stored]):
+                by_source.setdefault(variant[0], []).append(variant)
+        return [(content_hash, size, by_source.pop(content_hash, [])) for content_hash, size in stored]
+
+    def change_ru_translation(self, conn, cur, table_name, wrd_id, new_native_lang_text, audio=None, commit=True,
+                              prepared=None):
         """
         Replaces the Russian translation text and pronunciation in the database.
 
@@ -217,21 +482,54 @@ class db_sql:
         table_name (str): The name of the table to work with.
         wrd_id (int): The ID number of the word to update.
         new_native_lang_text (str): The new Russian translation text.
+        audio (bytes): The pronunciation if already generated (default is to generate it).
+        commit (bool): Commit at once (batch callers commit per batch).
+        prepared (tuple): The pronunciation from prepare_sounds (default is to prepare it here).
+
+        Returns:
+        bool: True if the word was changed.
         """
-        inp_wrd_text = self.get_tts_audio(new_native_lang_text, lang='ru')
         try:
+            media.ensure_hash_columns(conn, table_name)
+            if prepared is None:
+                inp_wrd_text = audio if audio is not None else self.get_tts_audio(new_native_lang_text, lang='ru')
+                prepared = self.prepare_sounds(conn, [inp_wrd_text])[0]
+            ru_sounds_hash, ru_sounds_size, variants = prepared
             cur.execute(f"""UPDATE {table_name}
-                SET native_lang = ?, ru_sounds = ?
+                SET native_lang = ?, ru_sounds = NULL, ru_sounds_hash = ?, ru_sounds_size = ?
                 WHERE id_nr = ?""",
-                (new_native_lang_text, inp_wrd_text, wrd_id))
+                (new_native_lang_text, ru_sounds_hash, ru_sounds_size, wrd_id))
+            media.add_variants(conn, variants)
 
-            conn.commit()
-            print(f'Ru words successfully changed')
+            if commit:
+                conn.commit()
+                print(f'Ru words successfully changed')
+            return True
         except Exception as e:
             print(f"Error changing text for word ID {wrd_id}: {e}")
-        return None
+        return False
+
+    def prepare_image(self, conn, filename):
+        """
+        Stores a new picture and its resized copies in the media store. Nothing is written
+        to the data base, so Pillow never runs inside a write transaction.
+
+        Parameters:
+        conn (sqlite3.Connection): A connection object.
+        filename (str): The filename of the new image.
+
+        Returns:
+        tuple or None: The content hash and size of the picture and its variants, or None if it failed.
+        """
+        try:
+            image_hash, image_size = media_store.put(self.convert_to_binary(f'images/{filename}.png'))
+            variants = image_variants.make_missing(conn, [image_hash]) if paths_info.image_variants_enabled else []
+            return image_hash, image_size, variants
+        except Exception as e:
+            print(f"Error storing picture {filename}: {e}")
+            return None
 
-    def change_image(self, conn, cur, table_name, wrd_id, filename):
+    def change_image(self, conn, cur, table_name, wrd_id, filename, commit=True, prepared=None):
         """
         Replaces the image for a given word ID in the database.
 
@@ -241,20 +539,30 @@ class db_sql:
         table_name (str): The name of the table to work with.
         wrd_id (int): The ID number of the word to update.
         filename (str): The filename of the new image.
+        commit (bool): Commit at once (batch callers commit per batch).
+        prepared (tuple): The result of prepare_image (default is to prepare the picture here).
+
+        Returns:
+        bool: True if the picture was replaced.
         """
-        image_path = f'images/{filename}.png'
-        with open(image_path, 'rb') as file:
-            val_file = file.read()
+        media.ensure_hash_columns(conn, table_name)
+        prepared = prepared or self.prepare_image(conn, filename)
+        if prepared is None:
+            return False
+        image_hash, image_size, variants = prepared
         try:
             cur.execute(f"""UPDATE {table_name}
-                SET image = ?
+                SET image = NULL, image_hash = ?, image_size = ?
                 WHERE id_nr = ?""",
-                (val_file, wrd_id))
-            conn.commit()
-            print(f'The picture successfully replaced for word ID {wrd_id}')
+                (image_hash, image_size, wrd_id))
+            media.add_variants(conn, variants)
+            if commit:
+                conn.commit()
+                print(f'The picture successfully replaced for word ID {wrd_id}')
+            return True
         except Exception as e:
             print(f"Error changing picture for word ID {wrd_id}: {e}")
-        return None
+        return False
 
     def drop_a_table(self, conn, cur, table_name):
         """
@@ -269,36 +577,47 @@ class db_sql:
         cur.execute(f"""DROP TABLE IF EXISTS {table_name}""")
         conn.commit()
 
-    def replace_change_en_pron(self, wrd_id, en_tran_new):
+    def replace_change_en_pron(self, conn, cur, table_name, wrd_id, en_tran_new, audio=None, commit=True,
+                               prepared=None):
         """
         Replaces the English pronunciation for a given word ID in the database.
 
         Parameters:
+        conn (sqlite3.Connection): A connection object.
+        cur (sqlite3.Cursor): A cursor object.
+        table_name (str): The name of the table to work with.
         wrd_id (int): The ID number of the word to update.
         en_tran_new (str): The new English pronunciation text.
+        audio (bytes): The pronunciation if already generated (default is to generate it).
+        commit (bool): Commit at once (batch callers commit per batch).
+        prepared (tuple): The pronunciation from prepare_sounds (default is to prepare it here).
         """
-        new_pron = self.get_tts_audio(en_tran_new, lang='en')
-        cur.execute(f"UPDATE {table_name} SET en_sounds = ? WHERE id_nr = ?", (new_pron, wrd_id))
-        conn.commit()
-
-# Initialization of the class 'db_sql'
-db_1 = db_sql(db_name, nmb_of_wrds)
-
-# Creation of the database if used for the first time
-path, cur, conn = db_1.setup_base()
-
-# -------------------------------------------------------
-# UNCOMMENT THIS BLOCK TO WRITE DOWN A NEW TABLE TO THE DB
-# Loading and clearing of number of rows from initial file
-# li_from_file = db_1.read_words_file(db_1.nmb_of_wrds)
-# Tables creation in db, adding ids, words, patterns
-# db_1.setup_table(li_from_file, cur, conn, table_name)
-# -------------------------------------------------------
+        media.ensure_hash_columns(conn, table_name)
+        if prepared is None:
+            new_pron = audio if audio is not None else self.get_tts_audio(en_tran_new, lang='en')
+            prepared = self.prepare_sounds(conn, [new_pron])[0]
+        en_sounds_hash, en_sounds_size, variants = prepared
+        cur.execute(f"UPDATE {table_name} SET en_sounds = NULL, en_sounds_hash = ?, en_sounds_size = ? WHERE id_nr = ?",
+                    (en_sounds_hash, en_sounds_size, wrd_id))
+        media.add_variants(conn, variants)
+        if commit:
+            conn.commit()
 
-def main():
+def main(db_1, cur, conn):
     """
     Main function to create the GUI and handle user interactions.
+
+    Parameters:
+    db_1 (db_sql): The database operations of the chosen table.
+    cur (sqlite3.Cursor): A cursor object.
+    conn (sqlite3.Connection): A connection object.
     """
+    # Tk is only needed by the GUI, the batch tools (admin_cli.py) run without a display
+    from tkinter import Tk, Label, Entry, Button, Listbox
+    import tkinter as tk
+
+    table_name = db_1.table_name
+
     def change_ru():
         """
         Changes the Russian translation text and pronunciation for a given word ID.
@@ -356,13 +675,34 @@ def main():
             print("Paste error:", e)
         return "break"
 
+    def find_words(event=None):
+        """
+        Lists the words whose text or translation matches the search text, typos included.
+        """
+        found = search.search(conn, db_1.table_name, search_input.get(), 20)
+        search_results.delete(0, tk.END)
+        found_ids.clear()
+        for result in found:
+            search_results.insert(tk.END, f"{result['id_nr']}: {result['words']} - {result['native_lang']}")
+            found_ids.append(result["id_nr"])
+        search_label.config(text=f"{len(found)} words found")
+
+    def pick_word(event):
+        """
+        Puts the ID of the word picked in the search results into the word ID field.
+        """
+        selection = search_results.curselection()
+        if selection:
+            wrd_id_input.delete(0, tk.END)
+            wrd_id_input.insert(0, str(found_ids[selection[0]]))
+
     def change_en_pron():
         """
         Changes the English pronunciation for a given word ID.
         """
         wrd_id = int(wrd_id_input.get())
         en_tran_new = en_tran_new_input.get()
-        db_1.replace_change_en_pron(wrd_id, en_tran_new)
+        db_1.replace_change_en_pron(conn, cur, db_1.table_name, wrd_id, en_tran_new)
         en_tran_new_label.config(text=f"EN pron changed to {en_tran_new}")
 
     # Create the main window
@@ -382,6 +722,24 @@ def main():
     wrd_id_label.grid(column=1, row=0)
     wrd_id_label.config(pady=10, padx=10)
 
+    # ----------------------find a word instead of typing its ID--------------------
+    search_input = Entry(width=30, font=("Arial", 16, "bold"))
+    search_input.grid(column=0, row=1)
+    search_input.bind("<Control-v>", paste)  #---------<<<<<<<<Control-v>
+    search_input.bind("<Return>", find_words)
+
+    search_label = Label(text="find a word or a translation", font=("Arial", 16, "bold"))
+    search_label.grid(column=1, row=1)
+    search_label.config(pady=10, padx=10)
+
+    search_button = Button(text="find", font=("Arial", 16, "bold"), command=find_words)
+    search_button.grid(column=3, row=1)
+
+    found_ids = []
+    search_results = Listbox(width=50, height=6, font=("Arial", 12))
+    search_results.grid(column=0, row=3, columnspan=4)
+    search_results.bind("<<ListboxSelect>>", pick_word)
+
     new_native_lang_text_input = Entry(width=30, font=("Arial", 16, "bold"))
     new_native_lang_text_input.grid(column=0, row=2)
     new_native_lang_text_input.bind("<Control-v>", paste)  #---------<<<<<<<<Control-v>
@@ -431,5 +789,25 @@ def main():
     # --This should be in the end
     window.mainloop()
 
-# UNCOMMENT THIS TO CORRECT A TABLE OF THE DB
-# main()
+if __name__ == "__main__":
+    # Select the table based on user input
+    table_name = pick_up_table()
+
+    # Initialization of the class 'db_sql'
+    db_1 = db_sql(db_name, nmb_of_wrds, table_name)
+
+    # Creation of the database if used for the first time
+    path, cur, conn = db_1.setup_base()
+
+    # -------------------------------------------------------
+    # UNCOMMENT THIS BLOCK TO WRITE DOWN A NEW TABLE TO THE DB
+    # Loading and clearing of number of rows from initial file
+    # li_from_file = db_1.read_words_file(db_1.nmb_of_wrds)
+    # Tables creation in db, adding ids, words, patterns
+    # db_1.setup_table(li_from_file, cur, conn, table_name)
+    # OR: import the whole file in chunks of nmb_of_wrds, resuming where the last run stopped
+    # db_1.import_words_file(cur, conn, table_name)
+    # -------------------------------------------------------
+
+    # UNCOMMENT THIS TO CORRECT A TABLE OF THE DB
+    # main(db_1, cur, conn)
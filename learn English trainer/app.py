@@ -1,12 +1,31 @@
-from flask import Flask, send_file, render_template, request, jsonify, redirect, url_for, session
+import startup
+startup.record_imports()  # import time per module, shown on /startup
+from flask import Flask, send_file, render_template, request, jsonify, redirect, url_for, session, g, Response
 import sqlite3
-import io
-from datetime import datetime, timedelta
-from pydub import AudioSegment
-import speech_recognition as sr
-import tempfile
-import os
+from datetime import datetime
+import json
+import logging
+import time
+import atexit
 import paths_info
+import db_pool
+import scheduler
+import patterns
+import progress
+import progress_stats
+import search
+import progress_writer
+import pron_jobs
+import media
+import media_store
+import metrics
+import word_cache
+import migrate
+startup.imports_done()
+
+# Subsystems only some requests need are loaded on first use (the media variant renderers)
+audio_variants = startup.lazy_import("audio_variants")
+image_variants = startup.lazy_import("image_variants")
 
 app = Flask(__name__)
 # Set the secret key for session management
@@ -15,23 +34,208 @@ app.secret_key = paths_info.secret_key
 # Database path
 db_path = paths_info.data_base_path
 
-# Map of users to their date stamps and background colors
-date_stamp_map = {
-    paths_info.user_1: {"date_stamp": "date_stamp_1", "color": "#ddddff"},  # light red
-    paths_info.user_2: {"date_stamp": "date_stamp_2", "color": "#ddffdd"},  # light green
-    paths_info.user_3: {"date_stamp": "date_stamp_3", "color": "#ffdddd"}  # light blue
-}
+# Per-process pool of tuned connections (pragmas are set in paths_info.db_pragmas),
+# their statements are timed for /metrics if paths_info.metrics_sql_timing is set
+pool = db_pool.ConnectionPool(
+    db_path, factory=metrics.MetricsConnection if paths_info.metrics_sql_timing else sqlite3.Connection)
+
+# Static word content (text, translation, media hashes), shared by the threads of this process
+word_content = word_cache.WordCache()
+
+# One JSON line per request, see log_request
+request_log = logging.getLogger("trainer.requests")
+
+# Routes that send media, their bytes and browser cache hits (304) are counted
+MEDIA_ENDPOINTS = {"get_image", "get_en_sound", "get_ru_sound"}
+
+# Pronunciation checks (the recognizer backend is set in paths_info.recognizer_backend),
+# created by the first request that needs them, in the worker process that serves it
+pron_queue = None
+
+def create_app():
+    """
+    App factory for prefork servers: import once, e.g. gunicorn "app:create_app()".
+    Nothing process-bound is created at import, the connection pool and the pronunciation
+    workers start lazily in each worker after the fork.
+
+    Returns:
+    Flask: The trainer app.
+    """
+    startup.mark("app_ready")
+    prepare_database()
+    if paths_info.request_log_enabled and not request_log.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        request_log.addHandler(handler)
+        request_log.setLevel(logging.INFO)
+        request_log.propagate = False
+    return app
+
+def prepare_database():
+    """
+    Brings the data base up to date (see migrate.py), once per process start instead of in the requests.
+    """
+    conn = pool.acquire()
+    try:
+        migrate.migrate(conn)
+    finally:
+        pool.release(conn)
+
+# Write-behind of the answers (paths_info.progress_write_behind), created on first use in each worker
+answer_writer = None
+
+def get_progress_writer():
+    """
+    Returns the progress writer of this process, started on first use, or None if answers are
+    written at once. The writer stores the waiting answers when the process exits.
+
+    Returns:
+    progress_writer.ProgressWriter or None: The writer.
+    """
+    global answer_writer
+    if answer_writer is None and paths_info.progress_write_behind:
+        answer_writer = progress_writer.ProgressWriter()
+        answer_writer.start()
+        atexit.register(answer_writer.close)
+    return answer_writer
+
+def pending_answers(table_name, user_name):
+    """
+    Returns the user's answers the progress writer has not stored yet, so reads see them.
+
+    Parameters:
+    table_name (str): The name of the word table.
+    user_name (str): The name of the user.
+
+    Returns:
+    dict: Word ID number -> (pattern, reviewed_at, due_at); empty if answers are written at once.
+    """
+    current_writer = get_progress_writer()
+    return current_writer.pending_for_user(table_name, user_name) if current_writer else {}
+
+def not_due_yet(waiting):
+    """
+    Picks the waiting answers that moved their word out of the due list.
+
+    Parameters:
+    waiting (dict): The result of pending_answers.
+
+    Returns:
+    set: The ID numbers of the words not due any more.
+    """
+    now = datetime.now().strftime(scheduler.DATE_FORMAT)
+    return {word_id for word_id, (pattern, reviewed_at, due_at) in waiting.items() if due_at > now}
+
+def get_pron_queue():
+    """
+    Returns the pronunciation check queue, created on first use.
+
+    Returns:
+    pron_jobs.JobQueue: The queue of this process.
+    """
+    global pron_queue
+    if pron_queue is None:
+        pron_queue = pron_jobs.JobQueue()
+    return pron_queue
+
+@app.before_request
+def note_first_request():
+    """
+    Records the time from (worker) start to the first request.
+    """
+    if "first_request" not in startup.milestones and startup.mark("first_request"):
+        app.logger.info("First request %.0f ms after start, slowest imports: %s",
+                        startup.milestones["first_request"], list(startup.report()["import_times"].items())[:5])
+
+@app.before_request
+def start_request_metrics():
+    """
+    Starts the latency clock and the SQL counters of the request.
+    """
+    g.request_started = time.perf_counter()
+    metrics.begin_request()
+
+@app.after_request
+def log_request(rv):
+    """
+    Records the latency, SQL statements and media bytes of the request and writes its log line.
+
+    Parameters:
+    rv (Response): The response.
+
+    Returns:
+    Response: The same response.
+    """
+    seconds = time.perf_counter() - g.pop("request_started", time.perf_counter())
+    sql_count, sql_seconds = metrics.end_request()
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.request_seconds.observe(seconds, route=route, method=request.method, status=rv.status_code)
+    metrics.request_sql_queries.observe(sql_count, route=route)
+    metrics.request_sql_seconds.observe(sql_seconds, route=route)
+    sent = rv.content_length or 0
+    if request.endpoint in MEDIA_ENDPOINTS:
+        metrics.media_responses.inc(route=route, status=rv.status_code)
+        metrics.media_bytes.inc(sent, route=route)
+    if paths_info.request_log_enabled:
+        request_log.info(json.dumps({
+            "route": route,
+            "method": request.method,
+            "status": rv.status_code,
+            "ms": round(seconds * 1000, 2),
+            "sql_queries": sql_count,
+            "sql_ms": round(sql_seconds * 1000, 2),
+            "bytes": sent,
+        }))
+    return rv
+
+@app.route("/metrics")
+def metrics_route():
+    """
+    Returns the metrics of this worker in the Prometheus text format.
+
+    Returns:
+    Response: The metrics.
+    """
+    metrics.cache_lookups.set(pool.reused, cache="db_pool", result="hit")
+    metrics.cache_lookups.set(pool.opened, cache="db_pool", result="miss")
+    if pron_queue is not None:
+        metrics.check_queue_depth.set(pron_queue.depth())
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/startup")
+def startup_report():
+    """
+    Returns the startup timings of the worker serving the request.
+
+    Returns:
+    json: The milestones and the import time per module in ms.
+    """
+    return jsonify(startup.report())
+
 
 def get_db_connection():
     """
-    Establishes a connection to the SQLite database.
+    Returns the connection of the current request, taken from the pool on first use.
+    The connection is given back to the pool on app context teardown, so helpers must not close it.
 
     Returns:
     sqlite3.Connection: A connection object to the database.
     """
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+    if "db_conn" not in g:
+        g.db_conn = pool.acquire()
+    return g.db_conn
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    """
+    Returns the request's connection to the pool.
+
+    Parameters:
+    exception (Exception or None): The exception that ended the request, if any.
+    """
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        pool.release(conn)
 
 def get_word_by_id_nr(id_nr):
     """
@@ -44,12 +248,8 @@ def get_word_by_id_nr(id_nr):
     str or None: The word corresponding to the ID number, or None if not found.
     """
     table_name = session.get("table_name", "general_words")  # default fallback
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(f"SELECT words FROM {table_name} WHERE id_nr = ?", (id_nr,))
-    row = cursor.fetchone()
-    conn.close()
-    return row[0] if row else None
+    content = word_content.get(get_db_connection(), table_name, id_nr)
+    return content[0] if content else None
 
 @app.route("/")
 def login():
@@ -59,7 +259,7 @@ def login():
     Returns:
     str: The HTML content of the login page.
     """
-    return render_template("login.html")
+    return render_template("login.html", users=paths_info.users)
 
 @app.route("/set_user", methods=["POST"])
 def set_user():
@@ -73,22 +273,80 @@ def set_user():
     table_name = request.form.get("table_name")  # NEW: get table choice
     start_id = int(request.form.get("start_id", 1))  # NEW: start from this ID
     max_id = int(request.form.get("max_id", 100))  # NEW: upper limit
+    order_mode = request.form.get("order_mode", "id")  # "id" - plain ID order, "due" - spaced repetition
+    query = request.form.get("search", "").strip()  # optional: train the words found instead of an ID range
 
-    if user not in date_stamp_map:
+    if user not in paths_info.users:
         return "Invalid user", 400
     if not table_name:  # safety check
         return "Table name not selected", 400
+    # The table name goes into SQL text: only the word tables of the data base are accepted
+    conn = get_db_connection()
+    if not media_store.is_word_table(conn, table_name):
+        return "Unknown table", 400
 
-    session["user_name_column"] = user
-    session["date_stamp"] = date_stamp_map[user]["date_stamp"]
-    session["bg_color"] = date_stamp_map[user]["color"]
+    session["user_name"] = user
     session["table_name"] = table_name  # NEW
     session["id_nr"] = start_id  # start point
+    session["id_lower_limit"] = start_id
     session["id_upper_limit"] = max_id  # limit
+    session["order_mode"] = order_mode
+
+    if query:
+        # The session is the list of words found, best match first
+        found = search.search(conn, table_name, query, paths_info.search_session_size)
+        if not found:
+            return f"No words found for '{query}'"
+        session["order_mode"] = "search"
+        session["search_ids"] = [result["id_nr"] for result in found]
+        return redirect(url_for("word_route", id_nr=session["search_ids"][0]))
+
+    if order_mode == "due":
+        # Start from the most overdue word of the range
+        first_id, word = get_next_word(None, user)
+        if not first_id:
+            return "Nothing is due for review 🎉"
+        return redirect(url_for("word_route", id_nr=first_id))
 
     # Redirect to training starting from chosen start_id
     return redirect(url_for("word_route", id_nr=start_id))
 
+@app.route("/stats")
+def stats_route():
+    """
+    Renders the progress of every learner of a table, or returns it as JSON (?format=json).
+    The counters are kept up to date on every answer, so the page reads one row per learner.
+
+    Returns:
+    str or json: The stats page or the counters.
+    """
+    table_name = request.args.get("table", session.get("table_name", "general_words"))
+    days = min(request.args.get("days", 14, type=int), 90)
+    conn = get_db_connection()
+    if not media_store.is_word_table(conn, table_name):
+        return "Unknown table", 404
+    summaries = [progress_stats.summary(conn, table_name, user_name, days) for user_name in paths_info.users]
+    if request.args.get("format") == "json":
+        return jsonify({"table_name": table_name, "users": summaries})
+    return render_template("stats.html", table_name=table_name, summaries=summaries, colors=paths_info.users,
+                           max_reviews=max([day["reviews"] for summary in summaries
+                                            for day in summary["reviews_per_day"]] + [1]))
+
+@app.route("/search")
+def search_route():
+    """
+    Finds the words of a table by their text or translation, typos included (?q=, ?table=, ?limit=).
+
+    Returns:
+    json: The matches, best first, with ID number, text, translation and score.
+    """
+    table_name = request.args.get("table", session.get("table_name", "general_words"))
+    limit = min(request.args.get("limit", 20, type=int), 100)
+    conn = get_db_connection()
+    if not media_store.is_word_table(conn, table_name):
+        return jsonify({"error": "Unknown table"}), 404
+    return jsonify({"results": search.search(conn, table_name, request.args.get("q", ""), limit)})
+
 @app.route("/word/<int:id_nr>")
 def word_route(id_nr):
     """
@@ -100,35 +358,272 @@ def word_route(id_nr):
     Returns:
     str: The HTML content of the word route page.
     """
-    user_name_column = session.get("user_name_column")
+    user_name = session.get("user_name")
     table_name = session.get("table_name", "general_words")
-    date_stamp = session.get("date_stamp")
 
-    next_id, word = get_next_word(id_nr - 1, user_name_column, date_stamp)
+    if session.get("order_mode") in ("due", "search"):
+        next_id = id_nr  # the scheduler or the search has already picked this word
+    else:
+        next_id, word = get_next_word(id_nr - 1, user_name)
 
-    # Map of users to their background colors
-    bg_map = {
-        paths_info.user_1: "#e8f5e9",  # light green
-        paths_info.user_2: "#e3f2fd",  # light blue
-        paths_info.user_3: "#fce4ec"  # pink
-    }
-    bg_color = bg_map.get(user_name_column, "#ffffff")  # default white
+    bg_color = paths_info.users.get(user_name, "#ffffff")  # default white
 
     if next_id:
-        word_text, pattern = get_word_and_pattern_by_id_nr(next_id, user_name_column)
+        word_text, pattern = get_word_and_pattern_by_id_nr(next_id, user_name)
         return render_template(
             "index.html",
             word_text=word_text,
             id_nr=next_id,
             pattern=pattern,
             table_name=table_name,
-            bg_color=bg_color
+            bg_color=bg_color,
+            media_urls=media_urls(next_id, get_media_hashes(next_id)),
+            deck_lookahead=paths_info.deck_lookahead
         )
 
+def get_media_hashes(id_nr):
+    """
+    Retrieves the content hashes of a word's media, used to version the media URLs.
+
+    Parameters:
+    id_nr (int): The ID number of the word.
+
+    Returns:
+    dict: Media column name -> content hash (None if there is no such media).
+    """
+    table_name = session.get("table_name", "general_words")
+    content = word_content.get(get_db_connection(), table_name, id_nr)
+    if not content:
+        return dict.fromkeys(media.MEDIA_COLUMNS)
+    return dict(content[2])
+
+def media_urls(id_nr, hashes):
+    """
+    Builds the media URLs of a word, versioned by the content hashes so browsers may cache them.
+    The card page and the deck window use the same URLs, so preloaded media is reused.
+
+    Parameters:
+    id_nr (int): The ID number of the word.
+    hashes (dict): Media column name -> content hash.
+
+    Returns:
+    dict: "image", "image_srcset", "en_sound" and "ru_sound" URLs.
+    """
+    image_hash = hashes.get("image") or None
+    return {
+        "image": url_for("get_image", id_nr=id_nr, v=image_hash),
+        # The browser picks the smallest picture that fills the displayed width
+        "image_srcset": ", ".join(
+            f"{url_for('get_image', id_nr=id_nr, v=image_hash, w=width)} {width}w"
+            for width in paths_info.image_widths
+        ) if image_hash else "",
+        "en_sound": url_for("get_en_sound", id_nr=id_nr, v=hashes.get("en_sounds") or None),
+        "ru_sound": url_for("get_ru_sound", id_nr=id_nr, v=hashes.get("ru_sounds") or None),
+    }
+
+@app.route("/deck/<int:id_nr>")
+def deck_window(id_nr):
+    """
+    Returns the current card and the next eligible cards in one query, so the page can preload them.
+
+    Parameters:
+    id_nr (int): The ID number of the current word.
+
+    Returns:
+    json: The list of cards (ID, text, translation, pattern, media hashes and URLs).
+    """
+    table_name = session.get("table_name", "general_words")
+    user_name = session.get("user_name")
+    if not user_name:
+        return jsonify({"error": "User not selected"}), 400
+    lookahead = min(request.args.get("n", paths_info.deck_lookahead, type=int), 20)
+    lower_id = session.get("id_lower_limit", 1)
+    upper_id = session.get("id_upper_limit", 20)
+
+    conn = get_db_connection()
+    waiting = pending_answers(table_name, user_name)
+    hash_columns = ", ".join(f"w.{column}_hash" for column in media.MEDIA_COLUMNS)
+    card_columns = f"w.id_nr, w.words, w.native_lang, p.pattern, {hash_columns}"
+    # The user's progress row of a word, if there is one
+    progress_join = "LEFT JOIN progress AS p ON p.table_name = ? AND p.user_name = ? AND p.word_id = w.id_nr"
+    if session.get("order_mode") == "due":
+        skipped = not_due_yet(waiting)
+        rows = conn.execute(f"""
+            SELECT {card_columns} FROM {table_name} AS w {progress_join} WHERE w.id_nr = ?
+            UNION ALL
+            SELECT * FROM (
+                SELECT {card_columns}
+                FROM progress AS p JOIN {table_name} AS w ON w.id_nr = p.word_id
+                WHERE p.table_name = ? AND p.user_name = ? AND p.due_at <= ?
+                  AND p.word_id BETWEEN ? AND ? AND p.word_id != ?
+                ORDER BY p.due_at, p.word_id
+                LIMIT ?
+            )
+        """, (table_name, user_name, id_nr, table_name, user_name, datetime.now().strftime(scheduler.DATE_FORMAT),
+              lower_id, upper_id, id_nr, lookahead + len(skipped))).fetchall()
+        # Words answered meanwhile may still look due in the data base
+        rows = rows[:1] + [row for row in rows[1:] if row[0] not in skipped][:lookahead]
+    elif session.get("order_mode") == "search":
+        deck_ids = [id_nr] + search_ids_after(id_nr, lookahead)
+        rows = conn.execute(f"""
+            SELECT {card_columns} FROM {table_name} AS w {progress_join}
+            WHERE w.id_nr IN ({", ".join("?" * len(deck_ids))})
+        """, (table_name, user_name, *deck_ids)).fetchall()
+        rows.sort(key=lambda row: deck_ids.index(row[0]))
+    else:
+        rows = conn.execute(f"""
+            SELECT {card_columns} FROM {table_name} AS w {progress_join}
+            WHERE w.id_nr >= ? AND w.id_nr <= ?
+            ORDER BY w.id_nr
+            LIMIT ?
+        """, (table_name, user_name, id_nr, upper_id, lookahead + 1)).fetchall()
+
+    cards = []
+    for row in rows:
+        hashes = dict(zip(media.MEDIA_COLUMNS, row[4:]))
+        cards.append({
+            "id_nr": row[0],
+            "word": row[1],
+            "native_lang": row[2],
+            "pattern": waiting[row[0]][0] if row[0] in waiting else patterns.decode(row[3]) or "",
+            "media_hashes": hashes,
+            "media_urls": media_urls(row[0], hashes),
+        })
+    return jsonify({"cards": cards})
+
+def set_media_cache_headers(rv, etag, version=None):
+    """
+    Sets the ETag and the Cache-Control header of a media response.
+
+    Parameters:
+    rv (Response): The media response.
+    etag (str): The content hash of the media sent.
+    version (str): The content hash the URL is versioned with (default is the ETag).
+    """
+    rv.set_etag(etag)
+    if request.args.get("v") == (version or etag):
+        # The URL carries the content hash, so it never changes
+        rv.cache_control.public = True
+        rv.cache_control.max_age = paths_info.media_max_age
+        rv.cache_control.immutable = True
+    else:
+        rv.cache_control.private = True
+        rv.cache_control.no_cache = True  # revalidate with the ETag
+
+def choose_media_variant(conn, source_hash, size, mimetype, variants):
+    """
+    Picks the smallest format of a media file that the browser accepts.
+    A "format" query parameter (a mimetype subtype, e.g. "mpeg") overrides the Accept header.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    source_hash (str): The content hash of the original media.
+    size (int): The size of the original media.
+    mimetype (str): The mimetype of the original media (None if not known yet).
+    variants (tuple): The variant names that may be sent instead.
+
+    Returns:
+    tuple: The content hash, size and mimetype to send (the original if nothing is smaller).
+    """
+    best = (source_hash, size, mimetype)
+    if not variants:
+        return best
+    requested_format = request.args.get("format")
+    accept = request.accept_mimetypes
+    for name, (variant_hash, variant_size, variant_mimetype) in media.get_variants(conn, source_hash).items():
+        if name not in variants or variant_size >= best[1] or not media_store.exists(variant_hash):
+            continue
+        if requested_format:
+            if variant_mimetype.split("/")[1] != requested_format:
+                continue
+        elif accept.provided and accept.quality(variant_mimetype) <= 0:
+            continue
+        best = (variant_hash, variant_size, variant_mimetype)
+    return best
+
+def send_media(id_nr, column, mimetype, not_found_message, variants=()):
+    """
+    Sends a media file with an ETag, cache headers and byte range support.
+    The ETag and size are read from the hash columns, so a 304 never touches the media itself.
+    Media in the content-addressed store is sent as a file (zero-copy where the server supports it);
+    media not migrated yet is read from its BLOB, only the requested bytes for a range request.
+    If variants are given, the smallest format the browser accepts is sent.
+
+    Parameters:
+    id_nr (int): The ID number of the word.
+    column (str): The media column name.
+    mimetype (str): The mimetype of the media (None - found from the first bytes of the media).
+    not_found_message (str): The message sent if there is no such media.
+    variants (tuple): The variant names that may be sent instead (see media.get_variants).
+
+    Returns:
+    Response: The media (200 or 206), 304 if the browser copy is valid, or an error message.
+    """
+    table_name = session.get("table_name", "general_words")
+    conn = get_db_connection()
+    row = conn.execute(
+        f"SELECT {column}_hash, {column}_size, {column} IS NOT NULL FROM {table_name} WHERE id_nr = ?",
+        (id_nr,)
+    ).fetchone()
+    if not row or not row[0]:
+        return not_found_message, 404
+    source_hash, size, has_blob = row[0], row[1], row[2]
+    etag, size, mimetype = choose_media_variant(conn, source_hash, size, mimetype, variants)
+
+    if request.if_none_match.contains(etag):
+        rv = Response(status=304)
+        set_media_cache_headers(rv, etag, source_hash)
+        if variants:
+            rv.vary.add("Accept")
+        return rv
+
+    if etag != source_hash or not has_blob:
+        if not media_store.exists(etag):
+            return not_found_message, 404
+        if mimetype is None:
+            with open(media_store.path_for(etag), "rb") as file:
+                mimetype = media.sniff_mimetype(file.read(16))
+        # send_file answers range requests itself and streams the file with wsgi.file_wrapper
+        rv = send_file(media_store.path_for(etag), mimetype=mimetype, conditional=True, etag=etag)
+        set_media_cache_headers(rv, etag, source_hash)
+        if variants:
+            rv.vary.add("Accept")
+        return rv
+
+    if mimetype is None:
+        with conn.blobopen(table_name, column, id_nr, readonly=True) as blob:
+            mimetype = media.sniff_mimetype(blob.read(16))
+    rv = Response(mimetype=mimetype)
+    set_media_cache_headers(rv, etag)
+    rv.accept_ranges = "bytes"
+    if variants:
+        rv.vary.add("Accept")
+
+    start, stop = 0, size
+    byte_range = request.range
+    if_range = request.if_range
+    if byte_range and len(byte_range.ranges) == 1 and (
+            (if_range.etag is None and if_range.date is None) or if_range.etag == etag):
+        requested = byte_range.range_for_length(size)
+        if requested is None:
+            rv.status_code = 416
+            rv.headers["Content-Range"] = f"bytes */{size}"
+            return rv
+        start, stop = requested
+        rv.status_code = 206
+        rv.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+
+    # id_nr is the rowid of the table, so the BLOB can be read incrementally
+    with conn.blobopen(table_name, column, id_nr, readonly=True) as blob:
+        blob.seek(start)
+        rv.set_data(blob.read(stop - start))
+    return rv
+
 @app.route("/image/<int:id_nr>")
 def get_image(id_nr):
     """
     Transfers an image to the rendering page index.html.
+    The "w" query parameter is the display width; a resized WebP/AVIF/PNG variant is sent if there is one.
 
     Parameters:
     id_nr (int): The ID number of the image to retrieve.
@@ -136,19 +631,9 @@ def get_image(id_nr):
     Returns:
     Response: The image file or an error message if the image is not found.
     """
-    conn = get_db_connection()
-    table_name = session.get("table_name", "general_words")
-    cursor = conn.execute(f"SELECT image FROM {table_name} WHERE id_nr = ?", (id_nr,))
-    row = cursor.fetchone()
-    conn.close()
-
-    if row and row["image"]:
-        return send_file(
-            io.BytesIO(row["image"]),
-            mimetype='image/png',  # Adjust if your image is JPEG or another format
-            as_attachment=False
-        )
-    return "Image not found", 404
+    # The real format is found from the image itself, so JPEG pictures are sent as JPEG
+    variants = image_variants.variant_names(request.args.get("w", type=int)) if "w" in request.args else ()
+    return send_media(id_nr, "image", None, "Image not found", variants=variants)
 
 @app.route("/sound/en/<int:id_nr>")
 def get_en_sound(id_nr):
@@ -161,19 +646,8 @@ def get_en_sound(id_nr):
     Returns:
     Response: The English sound file or an error message if the sound is not found.
     """
-    conn = get_db_connection()
-    table_name = session.get("table_name", "general_words")
-    cursor = conn.execute(f"SELECT en_sounds FROM {table_name} WHERE id_nr = ?", (id_nr,))
-    row = cursor.fetchone()
-    conn.close()
-
-    if row and row["en_sounds"]:
-        return send_file(
-            io.BytesIO(row["en_sounds"]),
-            mimetype='audio/mpeg',
-            as_attachment=False
-        )
-    return "English sound not found", 404
+    return send_media(id_nr, "en_sounds", "audio/mpeg", "English sound not found",
+                      variants=(audio_variants.OPUS_VARIANT,))
 
 @app.route("/sound/ru/<int:id_nr>")
 def get_ru_sound(id_nr):
@@ -186,19 +660,8 @@ def get_ru_sound(id_nr):
     Returns:
     Response: The Russian sound file or an error message if the sound is not found.
     """
-    conn = get_db_connection()
-    table_name = session.get("table_name", "general_words")
-    cursor = conn.execute(f"SELECT ru_sounds FROM {table_name} WHERE id_nr = ?", (id_nr,))
-    row = cursor.fetchone()
-    conn.close()
-
-    if row and row["ru_sounds"]:
-        return send_file(
-            io.BytesIO(row["ru_sounds"]),
-            mimetype='audio/mpeg',
-            as_attachment=False
-        )
-    return "Russian sound not found", 404
+    return send_media(id_nr, "ru_sounds", "audio/mpeg", "Russian sound not found",
+                      variants=(audio_variants.OPUS_VARIANT,))
 
 @app.route("/process", methods=["POST"])
 def process_text():
@@ -211,12 +674,11 @@ def process_text():
     usr_input = request.form["userText"]
     current_id = int(request.form["id_nr"])  # from frontend
     table_name = session.get("table_name", "general_words")
-    user_name_column = session.get("user_name_column")
-    date_stamp = session.get("date_stamp")
+    user_name = session.get("user_name")
 
-    result = chk_wrd_chng_pattern(current_id, usr_input, user_name_column, date_stamp)
+    result = chk_wrd_chng_pattern(current_id, usr_input, user_name)
 
-    next_id, next_word = get_next_word(current_id, user_name_column, date_stamp)
+    next_id, next_word = get_next_word(current_id, user_name)
     if not next_id:
         return jsonify({"message": "Training complete! 🎉", "next_id": None})
 
@@ -242,149 +704,183 @@ def check_pronunciation():
     # expected word from DB (hidden input in HTML)
     target_word = request.form.get("word", "").strip().lower()
 
-    try:
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as temp_input:
-            audio_file.save(temp_input.name)
-
-        # Convert to WAV (needed for speech_recognition)
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_wav:
-            AudioSegment.from_file(temp_input.name).export(temp_wav.name, format="wav")
+    # Decode in the decoding thread pool, then convert speech → text and compare with expected word
+    return jsonify(pron_jobs.check_audio(audio_file.read(), target_word, get_pron_queue().recognizer))
 
-            recognizer = sr.Recognizer()
-            with sr.AudioFile(temp_wav.name) as source:
-                audio = recognizer.record(source)
+@app.route("/check/jobs", methods=["POST"])
+def submit_pronunciation_check():
+    """
+    Queues a pronunciation check and returns its job ID at once.
 
-            # Convert speech → text
-            spoken_text = recognizer.recognize_google(audio).lower().strip()
+    Returns:
+    json: The job ID (202), or an error if there is no audio (400) or the queue is full (503).
+    """
+    if "audio_data" not in request.files:
+        return jsonify({"success": False, "error": "No audio uploaded"}), 400
 
-            # cleanup temp files
-            os.remove(temp_input.name)
-            os.remove(temp_wav.name)
+    target_word = request.form.get("word", "").strip().lower()
+    try:
+        job = get_pron_queue().submit(get_db_connection(), request.files["audio_data"].read(), target_word)
+    except pron_jobs.QueueFull as e:
+        response = jsonify({"success": False, "error": str(e)})
+        response.headers["Retry-After"] = "2"
+        return response, 503
+    return jsonify({"job_id": job.job_id, "status": job.status}), 202
+
+@app.route("/check/jobs/<job_id>")
+def get_pronunciation_check(job_id):
+    """
+    Returns the status of a pronunciation check, and its result once done.
+    Any worker process answers: the status is read from the data base.
 
-            # Compare with expected word
-            if spoken_text == target_word:
-                return jsonify({"success": True, "match": True, "spoken": spoken_text})
-            else:
-                return jsonify({"success": True, "match": False, "spoken": spoken_text})
+    Parameters:
+    job_id (str): The job ID.
 
-    except sr.UnknownValueError:
-        return jsonify({"success": False, "error": "Could not understand audio"})
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)})
+    Returns:
+    json: The job status and result, or an error if the job is unknown.
+    """
+    job = pron_jobs.load_job(get_db_connection(), job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Unknown check"}), 404
+    return jsonify(job)
 
-def get_next_word(current_id, user_name_column, date_stamp_column):
+def get_next_word(current_id, user_name):
     """
     Finds the next eligible word for this user based on training conditions.
+    One seek of the primary key per step (word_content.next_id), however sparse the IDs are.
 
     Parameters:
     current_id (int): The current ID number.
-    user_name_column (str): The column name for the user.
-    date_stamp_column (str): The column name for the date stamp.
+    user_name (str): The name of the user.
 
     Returns:
     tuple: A tuple containing the next ID number and the corresponding word, or (None, None) if no eligible words are left.
     """
+    if session.get("order_mode") == "due":
+        return get_next_due_word(current_id, user_name)
+
+    if session.get("order_mode") == "search":
+        following = search_ids_after(current_id, 1)
+        if following:
+            return following[0], get_word_by_id_nr(following[0])
+        return None, None
+
     table_name = session.get("table_name", "general_words")
     id_upper_limit = session.get("id_upper_limit", 20)
     conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Loop through IDs until we find a word that matches the training condition
-    for next_id in range(current_id + 1, id_upper_limit + 1):
-        cursor.execute(f"""
-            SELECT words, {user_name_column}, {date_stamp_column}
-            FROM {table_name}
-            WHERE id_nr = ?
-        """, (next_id,))
-        row = cursor.fetchone()
-        if not row:
-            continue
+    next_id = word_content.next_id(conn, table_name, current_id, id_upper_limit)
+    if next_id is not None:
+        return next_id, word_content.get(conn, table_name, next_id)[0]
+    return None, None  # no eligible words left
 
-        word, pattern, date_stamp_val = row[0], row[1], row[2]
-        conn.close()
-        return next_id, word
+def search_ids_after(current_id, count):
+    """
+    Returns the next words of a session built from a search query.
 
-    conn.close()
-    return None, None  # no eligible words left
+    Parameters:
+    current_id (int): The current ID number (None before the first word).
+    count (int): The number of ID numbers wanted.
 
-def get_word_and_pattern_by_id_nr(id_nr, user_name_column):
+    Returns:
+    list: The ID numbers following current_id in the session, at most count.
+    """
+    ids = session.get("search_ids", [])
+    start = ids.index(current_id) + 1 if current_id in ids else 0
+    return ids[start:start + count]
+
+def get_next_due_word(current_id, user_name):
+    """
+    Finds the most overdue word for this user in the session's ID range (spaced repetition mode).
+
+    Parameters:
+    current_id (int): The ID number just answered (skipped), or None.
+    user_name (str): The name of the user.
+
+    Returns:
+    tuple: A tuple containing the next ID number and the corresponding word, or (None, None) if nothing is due.
+    """
+    table_name = session.get("table_name", "general_words")
+    conn = get_db_connection()
+    next_id = scheduler.next_due_word(
+        conn, table_name, user_name,
+        session.get("id_lower_limit", 1), session.get("id_upper_limit", 20),
+        exclude_id=current_id, exclude_ids=not_due_yet(pending_answers(table_name, user_name))
+    )
+    if next_id is None:
+        return None, None
+    return next_id, get_word_by_id_nr(next_id)
+
+def get_word_and_pattern_by_id_nr(id_nr, user_name):
     """
     Retrieves a word and its user-specific pattern from the database by its ID number.
 
     Parameters:
     id_nr (int): The ID number of the word to retrieve.
-    user_name_column (str): The column name for the user.
+    user_name (str): The name of the user.
 
     Returns:
     tuple: A tuple containing the word and its pattern, or (None, None) if not found.
     """
     table_name = session.get("table_name", "general_words")
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(f"SELECT words, {user_name_column} FROM {table_name} WHERE id_nr = ?", (id_nr,))
-    row = cursor.fetchone()
-    conn.close()
-    if row:
-        return row[0], row[1] if row[1] else ""
+    content = word_content.get(conn, table_name, id_nr)
+    if content:
+        current_writer = get_progress_writer()
+        waiting = current_writer.pending(table_name, user_name, id_nr) if current_writer else None
+        if waiting:
+            return content[0], waiting[0]
+        # The text comes from the cache, only the learner's pattern is read
+        return content[0], progress.get_pattern(conn, table_name, user_name, id_nr) or ""
     return None, None
 
-def chk_wrd_chng_pattern(id_nr, usr_input, user_name_column, date_stamp):
+def chk_wrd_chng_pattern(id_nr, usr_input, user_name):
     """
     Checks the word input and updates the user-specific pattern in the database.
 
     Parameters:
     id_nr (int): The ID number of the word.
     usr_input (str): The user's input.
-    user_name_column (str): The column name for the user.
-    date_stamp (str): The date stamp column.
+    user_name (str): The name of the user.
 
     Returns:
     str: A message indicating the result of the update.
     """
     table_name = session.get("table_name", "general_words")
     word = get_word_by_id_nr(id_nr)
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute(f"SELECT {user_name_column} FROM {table_name} WHERE id_nr = ?", (id_nr,))
-    row = cursor.fetchone()
-    if not row:
-        conn.close()
+    if word is None:
         return f"No row with id_nr={id_nr}"
+    conn = get_db_connection()
+    current_writer = get_progress_writer()
 
-    pattern = row[0] if row[0] else ""
+    # The learner's own answer may still be waiting in the writer
+    waiting = current_writer.pending(table_name, user_name, id_nr) if current_writer else None
+    pattern = waiting[0] if waiting else progress.get_pattern(conn, table_name, user_name, id_nr)
+    # A word added after the user's last login has no progress yet: all letters still to learn
+    if pattern is None:
+        pattern = "c" * len(word)
 
     try:
-        checked_pattern = ""
-        for i in range(len(word)):
-            if i < len(usr_input) and word[i] == usr_input[i]:
-                if i < len(pattern) and pattern[i] == "b":
-                    checked_pattern += "a"
-                elif i < len(pattern) and pattern[i] == "c":
-                    checked_pattern += "b"
-                else:
-                    checked_pattern += "a"
-            else:
-                checked_pattern += "c"
-
-        cursor.execute(f"""
-            UPDATE {table_name}
-            SET {user_name_column} = ?, {date_stamp} = ?
-            WHERE id_nr = ?
-        """, (checked_pattern, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), id_nr))
-        conn.commit()
-        conn.close()
-        return f"Updated row {id_nr} for {user_name_column} with pattern {checked_pattern}"
+        checked_pattern = patterns.grade(word, usr_input, pattern)
+
+        if current_writer:
+            # Stored with other answers in the writer's next batch
+            current_writer.submit(table_name, user_name, id_nr, checked_pattern)
+        else:
+            # The pattern and its due date are one row, written in one statement
+            progress.record_review(conn, table_name, user_name, id_nr, checked_pattern)
+            conn.commit()
+        return f"Updated row {id_nr} for {user_name} with pattern {checked_pattern}"
 
     except Exception as e:
-        conn.close()
+        conn.rollback()
+        metrics.errors.inc(where="chk_wrd_chng_pattern")
+        app.logger.exception("Pattern update failed for word %s of %s", id_nr, user_name)
         return f"Incorrect input: {e}"
 
 # This line will run the script on a local device: uncomment to run locally.
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app().run(debug=True)
 
 # This line will run the script to be accessible through local WI-FI: uncomment to run publicly.
 # if __name__ == "__main__":
-#     app.run(host="0.0.0.0", port=5000, debug=True)
+#     create_app().run(host="0.0.0.0", port=5000, debug=True)
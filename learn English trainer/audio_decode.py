@@ -0,0 +1,95 @@
+# In-memory decoding of recorded pronunciations.
+# The browser upload (webm/ogg) is piped through ffmpeg and comes back as raw 16 kHz mono PCM,
+# so no temporary files are written. ffmpeg is a process of its own, so a small thread pool
+# only waits for it: at most audio_decode_workers decoders run at once, each with a timeout.
+
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import paths_info
+
+# Format of the decoded audio, as expected by speech_recognition.AudioData
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2  # bytes, signed 16-bit little-endian
+
+_executor = None
+_executor_lock = threading.Lock()
+# Recordings waiting or decoding at once; more are refused instead of queued without limit
+_slots = threading.BoundedSemaphore(paths_info.audio_decode_workers * 2)
+
+
+class AudioDecodeError(Exception):
+    """
+    Raised when a recording cannot be decoded in time.
+    """
+
+
+def decode_to_pcm(data, timeout=None):
+    """
+    Decodes and resamples audio through an ffmpeg pipe. Runs in a decoding thread.
+
+    Parameters:
+    data (bytes): The recorded audio in any format ffmpeg reads.
+    timeout (float): The time limit of ffmpeg in seconds.
+
+    Returns:
+    bytes: The raw mono PCM audio (SAMPLE_RATE, SAMPLE_WIDTH).
+    """
+    command = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-i", "pipe:0",
+        "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le",
+        "pipe:1",
+    ]
+    try:
+        result = subprocess.run(command, input=data, capture_output=True,
+                                timeout=timeout or paths_info.audio_decode_timeout)
+    except subprocess.TimeoutExpired:
+        raise AudioDecodeError("Decoding took too long")  # subprocess.run has killed ffmpeg
+    except FileNotFoundError:
+        raise AudioDecodeError("ffmpeg is not installed")
+    if result.returncode != 0:
+        raise AudioDecodeError(result.stderr.decode(errors="replace").strip() or "Could not decode audio")
+    return result.stdout
+
+
+def get_executor():
+    """
+    Creates the decoding thread pool on first use.
+
+    Returns:
+    ThreadPoolExecutor: The decoding thread pool.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=paths_info.audio_decode_workers,
+                                               thread_name_prefix="audio-decode")
+    return _executor
+
+
+def decode(data, timeout=None):
+    """
+    Decodes a recording in the thread pool.
+
+    Parameters:
+    data (bytes): The recorded audio.
+    timeout (float): The time limit in seconds (default is paths_info.audio_decode_timeout).
+
+    Returns:
+    bytes: The raw mono PCM audio (SAMPLE_RATE, SAMPLE_WIDTH).
+    """
+    timeout = timeout or paths_info.audio_decode_timeout
+    if not _slots.acquire(timeout=timeout):
+        raise AudioDecodeError("Too many recordings are being checked, try again")
+    try:
+        future = get_executor().submit(decode_to_pcm, data, timeout)
+        try:
+            # A little longer than ffmpeg's own limit, which stops the ffmpeg process
+            return future.result(timeout=timeout + 1)
+        except TimeoutError:
+            future.cancel()
+            raise AudioDecodeError("Decoding took too long")
+    finally:
+        _slots.release()
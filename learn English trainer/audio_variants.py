@@ -0,0 +1,163 @@
+# Compact Opus/WebM variants of the gTTS sounds: trimmed, loudness-normalized, mono, low bitrate.
+# They are stored in the media store next to the MP3 and chosen by the media routes
+# when the browser accepts them.
+#
+# Variants for the sounds already in a data base:
+#   python audio_variants.py backfill [--db PATH] [--table NAME] [--workers N]
+
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import paths_info
+import db_pool
+import media
+import media_store
+
+# Variant name and mimetype of the compact sounds
+OPUS_VARIANT = "opus"
+OPUS_MIMETYPE = "audio/webm"
+
+# Sound columns of the word tables
+SOUND_COLUMNS = ("en_sounds", "ru_sounds")
+
+# Trims the silence at both ends and evens out the loudness
+AUDIO_FILTER = ("silenceremove=start_periods=1:start_threshold=-50dB,areverse,"
+                "silenceremove=start_periods=1:start_threshold=-50dB,areverse,"
+                "loudnorm")
+
+
+def transcode_to_opus(data, timeout=30):
+    """
+    Converts a sound to a compact Opus/WebM file through an ffmpeg pipe.
+
+    Parameters:
+    data (bytes): The original sound (MP3).
+    timeout (float): The time limit of ffmpeg in seconds.
+
+    Returns:
+    bytes: The Opus/WebM data.
+    """
+    command = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-i", "pipe:0",
+        "-af", AUDIO_FILTER,
+        "-ac", "1", "-c:a", "libopus", "-b:a", paths_info.opus_bitrate,
+        "-f", "webm", "pipe:1",
+    ]
+    result = subprocess.run(command, input=data, capture_output=True, timeout=timeout)
+    if result.returncode != 0 or not result.stdout:
+        raise RuntimeError(result.stderr.decode(errors="replace").strip() or "ffmpeg failed")
+    return result.stdout
+
+
+def make_variant(source_hash):
+    """
+    Creates the Opus variant of a sound in the media store.
+
+    Parameters:
+    source_hash (str): The content hash of the original sound.
+
+    Returns:
+    tuple: The content hash and size of the variant, or (None, None) if it failed.
+    """
+    data = media_store.get(source_hash)
+    if data is None:
+        return None, None
+    try:
+        return media_store.put(transcode_to_opus(data))
+    except Exception as e:
+        print(f"Error transcoding {source_hash}: {e}")
+        return None, None
+
+
+def make_missing(conn, source_hashes, workers=None):
+    """
+    Creates the missing Opus variants of the given sounds in the media store, in parallel.
+    Nothing is written to the data base, so call it before a write transaction starts and
+    record the result with media.add_variants: the transaction does not wait for ffmpeg.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object (only read).
+    source_hashes (iterable): The content hashes of the original sounds.
+    workers (int): The number of ffmpeg processes at once (default is paths_info.ingest_workers).
+
+    Returns:
+    list: Tuples of source hash, variant name, content hash, size and mimetype.
+    """
+    todo = [source_hash for source_hash in dict.fromkeys(h for h in source_hashes if h)
+            if OPUS_VARIANT not in media.get_variants(conn, source_hash)]
+    if not todo:
+        return []
+    # ffmpeg runs in its own process, so threads are enough to use every core
+    with ThreadPoolExecutor(max_workers=workers or paths_info.ingest_workers) as executor:
+        return [(source_hash, OPUS_VARIANT, content_hash, size, OPUS_MIMETYPE)
+                for source_hash, (content_hash, size) in zip(todo, executor.map(make_variant, todo))
+                if content_hash is not None]
+
+
+def add_variants(conn, source_hashes, workers=None):
+    """
+    Creates and records the missing Opus variants of the given sounds. The caller commits.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    source_hashes (iterable): The content hashes of the original sounds.
+    workers (int): The number of ffmpeg processes at once (default is paths_info.ingest_workers).
+
+    Returns:
+    int: The number of variants created.
+    """
+    variants = make_missing(conn, source_hashes, workers)
+    media.add_variants(conn, variants)
+    return len(variants)
+
+
+def backfill(conn, tables=None, workers=None, batch_size=500):
+    """
+    Creates the Opus variants of every sound of the word tables that has none yet.
+    The sounds must be in the media store (see media_store.py migrate).
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    tables (list): The tables to process (default is every word table).
+    workers (int): The number of ffmpeg processes at once.
+    batch_size (int): The number of sounds committed at once.
+
+    Returns:
+    int: The number of variants created.
+    """
+    media.ensure_variants_table(conn)
+    created = 0
+    for table_name in tables or media_store.word_tables(conn):
+        media.ensure_hash_columns(conn, table_name)
+        for column in SOUND_COLUMNS:
+            hashes = [row[0] for row in conn.execute(f"""SELECT DISTINCT {column}_hash FROM {table_name}
+                WHERE {column}_hash IS NOT NULL AND {column}_hash NOT IN (
+                    SELECT source_hash FROM media_variants WHERE variant = ?)""", (OPUS_VARIANT,))]
+            for start in range(0, len(hashes), batch_size):
+                created += add_variants(conn, hashes[start:start + batch_size], workers)
+                conn.commit()
+            print(f"{table_name}.{column}: {len(hashes)} sounds processed")
+    return created
+
+
+def main():
+    """
+    Command line entry point of the audio variant tools.
+    """
+    parser = argparse.ArgumentParser(description="Compact Opus variants of the sounds")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="create the missing variants of a data base")
+    backfill_parser.add_argument("--db", default=paths_info.data_base_path, help="path to the data base")
+    backfill_parser.add_argument("--table", action="append", help="table to process (default is every word table)")
+    backfill_parser.add_argument("--workers", type=int, default=paths_info.ingest_workers,
+                                 help="ffmpeg processes at once")
+    args = parser.parse_args()
+
+    conn = db_pool.connect(args.db)
+    print(f"{backfill(conn, args.table, args.workers)} variants created")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+# Micro-benchmarks of the trainer's hot paths on a synthetic data base (see synthetic_db.py).
+# Runs offline: translator, pronunciation and recognizer are the local stubs.
+#   python bench.py --words 5000 --sparsity 0.2 --save-baseline bench_baseline.json
+#   python bench.py --words 5000 --sparsity 0.2 --baseline bench_baseline.json
+# Per hot path: latency percentiles, SQL statements per call and bytes read per call.
+
+import argparse
+import io
+import json
+import math
+import os
+import random
+import shutil
+import struct
+import tempfile
+import time
+import wave
+import paths_info
+
+
+class QueryCounter:
+    """
+    Counts the SQL statements run on the connections it is attached to.
+
+    Attributes:
+    count (int): The statements counted since the last reset.
+    """
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, statement):
+        self.count += 1
+
+    def attach(self, conn):
+        """
+        Counts the statements of a connection.
+
+        Parameters:
+        conn (sqlite3.Connection): A connection object.
+
+        Returns:
+        sqlite3.Connection: The same connection.
+        """
+        conn.set_trace_callback(self)
+        return conn
+
+
+def percentile(sorted_values, share):
+    """
+    Returns the value below which the given share of the sorted values lies.
+
+    Parameters:
+    sorted_values (list): The values in ascending order.
+    share (float): The share from 0.0 to 1.0, e.g. 0.95.
+
+    Returns:
+    float: The percentile (nearest rank).
+    """
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(share * len(sorted_values)) - 1))]
+
+
+def summarize(latencies, queries, bytes_read):
+    """
+    Builds the measurements of a hot path.
+
+    Parameters:
+    latencies (list): The latency of every call in ms.
+    queries (int): The SQL statements of all calls.
+    bytes_read (int): The bytes read by all calls.
+
+    Returns:
+    dict: The number of calls, p50/p95/p99/mean latency in ms, statements and bytes per call.
+    """
+    latencies = sorted(latencies)
+    calls = len(latencies)
+    return {
+        "calls": calls,
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "mean_ms": round(sum(latencies) / calls, 3),
+        "queries_per_call": round(queries / calls, 2),
+        "bytes_per_call": round(bytes_read / calls),
+    }
+
+
+def measure(call, iterations, counter):
+    """
+    Times a hot path.
+
+    Parameters:
+    call (callable): Runs the path once for an iteration number; returns the seconds
+        of the measured part and the number of bytes read.
+    iterations (int): The number of calls.
+    counter (QueryCounter): The statement counter of the connections the path uses.
+
+    Returns:
+    dict: The measurements (see summarize).
+    """
+    latencies = []
+    queries = 0
+    bytes_read = 0
+    for i in range(iterations):
+        counter.count = 0
+        seconds, nbytes = call(i)
+        latencies.append(seconds * 1000)
+        queries += counter.count
+        bytes_read += nbytes
+    return summarize(latencies, queries, bytes_read)
+
+
+def make_wav(seconds=0.5, rate=16000):
+    """
+    Builds a short mono WAV recording (a 440 Hz tone) for the pronunciation check.
+
+    Parameters:
+    seconds (float): The length of the recording.
+    rate (int): The sample rate.
+
+    Returns:
+    bytes: The WAV file.
+    """
+    frames = b"".join(struct.pack("<h", int(8000 * math.sin(2 * math.pi * 440 * n / rate)))
+                      for n in range(int(seconds * rate)))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(rate)
+        wav_file.writeframes(frames)
+    return buffer.getvalue()
+
+
+def configure(workdir):
+    """
+    Points the trainer at a data base and a media store in the work folder and selects
+    the local stubs for every external service. Must run before app and adminka are imported.
+
+    Parameters:
+    workdir (str): The work folder.
+    """
+    paths_info.data_base_path = os.path.join(workdir, "bench.db")
+    paths_info.media_store_path = os.path.join(workdir, "media")
+    paths_info.provider_cache_path = os.path.join(workdir, "provider_cache.db")
+    paths_info.translator_backend = "stub"
+    paths_info.tts_backend = "stub"
+    paths_info.recognizer_backend = "stub"
+    # Variants need ffmpeg and Pillow, they are not part of the measured paths
+    paths_info.audio_variants_enabled = False
+    paths_info.image_variants_enabled = False
+    unlimited = {"concurrency": 8, "rate_per_sec": 1e9, "attempts": 1}
+    paths_info.provider_limits = {"translate": unlimited, "tts": unlimited}
+
+
+def bench_helpers(trainer, ids, user_name, table_name, iterations, counter, rng):
+    """
+    Times the data base helpers of the app directly, without the HTTP layer.
+
+    Parameters:
+    trainer (module): The app module.
+    ids (list): The ID numbers of the synthetic words.
+    user_name (str): The learner.
+    table_name (str): The word table.
+    iterations (int): The number of calls per path.
+    counter (QueryCounter): The statement counter.
+    rng (random.Random): The random generator.
+
+    Returns:
+    dict: Path name -> measurements.
+    """
+    def in_request(order_mode, func):
+        def call(i):
+            id_nr = rng.choice(ids)
+            with trainer.app.test_request_context():
+                trainer.session.update({"table_name": table_name, "user_name": user_name, "order_mode": order_mode,
+                                        "id_lower_limit": ids[0], "id_upper_limit": ids[-1]})
+                counter.attach(trainer.get_db_connection())
+                counter.count = 0
+                begin = time.perf_counter()
+                func(id_nr)
+                return time.perf_counter() - begin, 0
+        return call
+
+    paths = {
+        "get_next_word": ("id", lambda id_nr: trainer.get_next_word(id_nr, user_name)),
+        "get_next_due_word": ("due", lambda id_nr: trainer.get_next_word(id_nr, user_name)),
+        # Every other answer is wrong in the last letter
+        "chk_wrd_chng_pattern": ("id", lambda id_nr: trainer.chk_wrd_chng_pattern(
+            id_nr, f"word{id_nr}" if id_nr % 2 else f"word{id_nr}"[:-1] + "x", user_name)),
+    }
+    return {name: measure(in_request(order_mode, func), iterations, counter)
+            for name, (order_mode, func) in paths.items()}
+
+
+def bench_routes(trainer, conn, ids, user_name, table_name, iterations, counter, rng):
+    """
+    Times the routes through the Flask test client (no network).
+
+    Parameters:
+    trainer (module): The app module.
+    conn (sqlite3.Connection): A connection to the synthetic data base.
+    ids (list): The ID numbers of the synthetic words.
+    user_name (str): The learner.
+    table_name (str): The word table.
+    iterations (int): The number of calls per path.
+    counter (QueryCounter): The statement counter.
+    rng (random.Random): The random generator.
+
+    Returns:
+    dict: Path name -> measurements.
+    """
+    # Every connection the app takes from the pool is counted
+    acquire = trainer.pool.acquire
+    trainer.pool.acquire = lambda: counter.attach(acquire())
+
+    client = trainer.app.test_client()
+    client.post("/set_user", data={"user": user_name, "table_name": table_name, "start_id": ids[0],
+                                   "max_id": ids[-1], "order_mode": "id"})
+    with_image = [row[0] for row in conn.execute(f"SELECT id_nr FROM {table_name} WHERE image_hash IS NOT NULL")]
+
+    def request(method, url_for_id, id_choices=ids, data=None):
+        def call(i):
+            id_nr = rng.choice(id_choices)
+            begin = time.perf_counter()
+            response = client.open(url_for_id(id_nr), method=method, data=data(id_nr) if data else None)
+            body = response.get_data()  # streamed files are read here
+            seconds = time.perf_counter() - begin
+            response.close()
+            if response.status_code >= 400:
+                raise RuntimeError(f"{method} {url_for_id(id_nr)}: {response.status_code}")
+            return seconds, len(body)
+        return call
+
+    paths = {
+        "route_word": request("GET", lambda id_nr: f"/word/{id_nr}"),
+        "route_deck": request("GET", lambda id_nr: f"/deck/{id_nr}"),
+        "route_process": request("POST", lambda id_nr: "/process",
+                                 data=lambda id_nr: {"userText": f"word{id_nr}", "id_nr": id_nr}),
+        "route_en_sound": request("GET", lambda id_nr: f"/sound/en/{id_nr}"),
+        "route_image": request("GET", lambda id_nr: f"/image/{id_nr}", id_choices=with_image or ids),
+    }
+    if shutil.which("ffmpeg"):
+        recording = make_wav()
+        import pron_jobs
+        trainer.pron_queue = pron_jobs.JobQueue(recognizer=pron_jobs.StubRecognizer(latency=0.0))
+        paths["route_check"] = request("POST", lambda id_nr: "/check", data=lambda id_nr: {
+            "audio_data": (io.BytesIO(recording), "speech.wav"), "id_nr": id_nr})
+    else:
+        print("ffmpeg not found, route_check is skipped")
+
+    results = {name: measure(call, iterations, counter) for name, call in paths.items()}
+    trainer.pool.acquire = acquire
+    return results
+
+
+def bench_ingest(conn, table_name, words, batch_size, counter):
+    """
+    Times adminka's setup_table with the stub providers, per batch of new words.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection to the synthetic data base.
+    table_name (str): The word table.
+    words (int): The number of new words.
+    batch_size (int): The number of words per setup_table call.
+    counter (QueryCounter): The statement counter.
+
+    Returns:
+    dict: "ingest_batch" -> measurements.
+    """
+    import adminka
+    db = adminka.db_sql(adminka.db_name, batch_size, table_name)
+    counter.attach(conn)
+    cur = conn.cursor()
+    batches = [[f"new{n}_{start}" for n in range(start, min(start + batch_size, words))]
+               for start in range(0, words, batch_size)]
+
+    def call(i):
+        begin = time.perf_counter()
+        db.setup_table(batches[i], cur, conn, table_name)
+        return time.perf_counter() - begin, 0
+
+    result = measure(call, len(batches), counter)
+    conn.set_trace_callback(None)
+    return {"ingest_batch": result}
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints the results next to a stored baseline.
+
+    Parameters:
+    results (dict): Path name -> measurements of this run.
+    baseline (dict): Path name -> measurements of the baseline run.
+    threshold (float): The p50 slowdown share reported as a regression, e.g. 0.1.
+
+    Returns:
+    list: The names of the paths that got slower than the threshold.
+    """
+    regressions = []
+    print(f"{'path':24} {'p50 ms':>9} {'base':>9} {'change':>8} {'p95 ms':>9} {'base':>9} {'queries':>8} {'base':>6}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            print(f"{name:24} {result['p50_ms']:9.3f} {'-':>9}")
+            continue
+        change = (result["p50_ms"] - base["p50_ms"]) / base["p50_ms"] if base["p50_ms"] else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  SLOWER"
+        print(f"{name:24} {result['p50_ms']:9.3f} {base['p50_ms']:9.3f} {change:+8.0%} "
+              f"{result['p95_ms']:9.3f} {base['p95_ms']:9.3f} {result['queries_per_call']:8} "
+              f"{base['queries_per_call']:6}{flag}")
+    return regressions
+
+
+def report(results):
+    """
+    Prints the results of a run.
+
+    Parameters:
+    results (dict): Path name -> measurements.
+    """
+    print(f"{'path':24} {'calls':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'bytes':>9}")
+    for name, result in results.items():
+        print(f"{name:24} {result['calls']:6} {result['p50_ms']:9.3f} {result['p95_ms']:9.3f} "
+              f"{result['p99_ms']:9.3f} {result['queries_per_call']:8} {result['bytes_per_call']:9}")
+
+
+def main():
+    """
+    Command line entry point of the benchmarks.
+    """
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the trainer's hot paths")
+    parser.add_argument("--words", type=int, default=2000, help="words in the synthetic table")
+    parser.add_argument("--sparsity", type=float, default=0.0, help="share of ID numbers left out")
+    parser.add_argument("--inline-blobs", action="store_true", help="keep the media in BLOB columns")
+    parser.add_argument("--iterations", type=int, default=500, help="calls per hot path")
+    parser.add_argument("--ingest-words", type=int, default=1000, help="new words for the ingestion benchmark")
+    parser.add_argument("--seed", type=int, default=1, help="random seed of the data and the calls")
+    parser.add_argument("--only", choices=["helpers", "routes", "ingest"], action="append",
+                        help="run only these groups (default is all)")
+    parser.add_argument("--workdir", help="folder for the synthetic data base (default is a temporary one)")
+    parser.add_argument("--baseline", help="compare with the results stored in this JSON file")
+    parser.add_argument("--save-baseline", help="store the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.1, help="p50 slowdown reported as a regression")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="trainer_bench_")
+    configure(workdir)
+    import db_pool
+    import synthetic_db
+
+    table_name = "general_words"
+    user_name = next(iter(paths_info.users))
+    conn = db_pool.connect(paths_info.data_base_path)
+    ids = synthetic_db.generate(conn, table_name, args.words, args.sparsity, inline_blobs=args.inline_blobs,
+                                users=(user_name,), seed=args.seed)
+    print(f"{len(ids)} words, ID numbers {ids[0]}-{ids[-1]}, data base in {workdir}")
+
+    groups = args.only or ["helpers", "routes", "ingest"]
+    counter = QueryCounter()
+    rng = random.Random(args.seed)
+    results = {}
+    if "helpers" in groups or "routes" in groups:
+        import app as trainer
+        trainer.prepare_database()  # what create_app does at the start of a worker
+        if "helpers" in groups:
+            results.update(bench_helpers(trainer, ids, user_name, table_name, args.iterations, counter, rng))
+        if "routes" in groups:
+            results.update(bench_routes(trainer, conn, ids, user_name, table_name, args.iterations, counter, rng))
+    if "ingest" in groups:
+        results.update(bench_ingest(conn, table_name, args.ingest_words, 100, counter))
+    conn.close()
+
+    report(results)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    raise SystemExit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# Pool of tuned SQLite connections shared by the trainer and the admin tools
+
+import sqlite3
+import os
+import threading
+import queue
+import paths_info
+
+
+def connect(db_path, pragmas=None, row_factory=None, factory=sqlite3.Connection):
+    """
+    Opens a new SQLite connection and applies the configured pragmas once.
+
+    Parameters:
+    db_path (str): The path to the database file.
+    pragmas (dict): PRAGMA name -> value (default is paths_info.db_pragmas).
+    row_factory (callable): Optional row factory for the connection.
+    factory (type): The connection class, a sqlite3.Connection subclass to instrument the connections.
+
+    Returns:
+    sqlite3.Connection: A connection object to the database.
+    """
+    # check_same_thread=False: a pooled connection may be handed to another thread,
+    # but it is only ever used by one request at a time
+    # cached_statements: the SQL text of every helper is stable, so compiled statements are reused
+    conn = sqlite3.connect(db_path, check_same_thread=False,
+                           cached_statements=paths_info.db_cached_statements, factory=factory)
+    if row_factory is not None:
+        conn.row_factory = row_factory
+    if pragmas is None:
+        pragmas = paths_info.db_pragmas
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of SQLite connections for one process.
+
+    Attributes:
+    db_path (str): The path to the database file.
+    max_idle (int): The number of idle connections kept open.
+    pragmas (dict): PRAGMA name -> value applied to every new connection.
+    row_factory (callable): The row factory of every new connection.
+    factory (type): The connection class of every new connection.
+    """
+    def __init__(self, db_path, max_idle=None, pragmas=None, row_factory=sqlite3.Row, factory=sqlite3.Connection):
+        self.db_path = db_path
+        self.max_idle = max_idle if max_idle is not None else paths_info.db_pool_size
+        self.pragmas = pragmas
+        self.row_factory = row_factory
+        self.factory = factory
+        self.reused = 0  # acquires served by an idle connection
+        self.opened = 0  # acquires that had to open a new one
+        self._idle = queue.LifoQueue()  # LIFO keeps the warmest connection in use
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _check_fork(self):
+        """
+        Drops connections inherited from a parent process (prefork servers).
+        """
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._idle = queue.LifoQueue()
+                    self._pid = pid
+
+    def acquire(self):
+        """
+        Takes an idle connection from the pool or opens a new one.
+
+        Returns:
+        sqlite3.Connection: A connection object to the database.
+        """
+        self._check_fork()
+        try:
+            conn = self._idle.get_nowait()
+            self.reused += 1
+            return conn
+        except queue.Empty:
+            self.opened += 1
+            return connect(self.db_path, self.pragmas, self.row_factory, self.factory)
+
+    def release(self, conn):
+        """
+        Returns a connection to the pool, closing it if the pool is full.
+
+        Parameters:
+        conn (sqlite3.Connection): The connection to return.
+        """
+        try:
+            if conn.in_transaction:
+                conn.rollback()  # never hand over a half-done transaction
+        except sqlite3.Error:
+            conn.close()
+            return
+        if self._idle.qsize() >= self.max_idle:
+            conn.close()
+            return
+        self._idle.put_nowait(conn)
+
+    def close_all(self):
+        """
+        Closes every idle connection of the pool.
+        """
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,217 @@
+# Size-bucketed variants of the card pictures: WebP (and AVIF where Pillow can write it)
+# with a PNG fallback for every width in paths_info.image_widths. The /image route picks
+# the bucket from the requested display width and the smallest format the browser accepts.
+#
+# Variants for the pictures already in a data base:
+#   python image_variants.py backfill [--db PATH] [--table NAME] [--workers N]
+
+import argparse
+import io
+from concurrent.futures import ThreadPoolExecutor
+import paths_info
+import db_pool
+import media
+import media_store
+
+# Output formats: name -> (Pillow format, mimetype)
+FORMATS = {
+    "avif": ("AVIF", "image/avif"),
+    "webp": ("WEBP", "image/webp"),
+    "png": ("PNG", "image/png"),
+}
+
+
+def available_formats():
+    """
+    Lists the output formats the installed Pillow can write.
+
+    Returns:
+    list: The format names, e.g. ["webp", "png"].
+    """
+    from PIL import Image  # Pillow is only needed to make variants
+    Image.init()
+    return [name for name, (pillow_format, mimetype) in FORMATS.items() if pillow_format in Image.SAVE]
+
+
+def width_bucket(width):
+    """
+    Finds the smallest configured width that covers a display width.
+
+    Parameters:
+    width (int): The display width in pixels (None - the largest bucket).
+
+    Returns:
+    int: The bucket width.
+    """
+    widths = sorted(paths_info.image_widths)
+    if width:
+        for bucket in widths:
+            if bucket >= width:
+                return bucket
+    return widths[-1]
+
+
+def variant_names(width):
+    """
+    Lists the variant names that may be sent for a display width.
+
+    Parameters:
+    width (int): The requested display width in pixels (None - the largest bucket).
+
+    Returns:
+    tuple: The variant names, e.g. ("avif-320", "webp-320", "png-320").
+    """
+    bucket = width_bucket(width)
+    return tuple(f"{name}-{bucket}" for name in FORMATS)
+
+
+def render_variants(data, formats):
+    """
+    Resizes a picture to every configured width and encodes it.
+    Widths larger than the picture keep its own size (pictures are never enlarged).
+
+    Parameters:
+    data (bytes): The original picture.
+    formats (list): The format names to encode.
+
+    Returns:
+    list: Tuples of variant name, encoded data and mimetype.
+    """
+    from PIL import Image
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+    variants = []
+    for bucket in paths_info.image_widths:
+        if image.width > bucket:
+            height = max(1, round(image.height * bucket / image.width))
+            resized = image.resize((bucket, height), Image.LANCZOS)
+        else:
+            resized = image
+        for name in formats:
+            pillow_format, mimetype = FORMATS[name]
+            output = io.BytesIO()
+            if pillow_format == "PNG":
+                resized.save(output, format=pillow_format, optimize=True)
+            else:
+                resized.save(output, format=pillow_format, quality=paths_info.image_quality)
+            variants.append((f"{name}-{bucket}", output.getvalue(), mimetype))
+    return variants
+
+
+def make_variants(source_hash, formats):
+    """
+    Creates the variants of a picture in the media store.
+
+    Parameters:
+    source_hash (str): The content hash of the original picture.
+    formats (list): The format names to encode.
+
+    Returns:
+    list: Tuples of variant name, content hash, size and mimetype (empty if it failed).
+    """
+    data = media_store.get(source_hash)
+    if data is None:
+        return []
+    try:
+        return [(name, *media_store.put(variant_data), mimetype)
+                for name, variant_data, mimetype in render_variants(data, formats)]
+    except Exception as e:
+        print(f"Error resizing {source_hash}: {e}")
+        return []
+
+
+def make_missing(conn, source_hashes, workers=None):
+    """
+    Creates the variants of the given pictures that have none yet in the media store, in parallel.
+    Nothing is written to the data base, so call it before a write transaction starts and
+    record the result with media.add_variants: the transaction does not wait for Pillow.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object (only read).
+    source_hashes (iterable): The content hashes of the original pictures.
+    workers (int): The number of pictures processed at once (default is paths_info.ingest_workers).
+
+    Returns:
+    list: Tuples of source hash, variant name, content hash, size and mimetype.
+    """
+    try:
+        formats = available_formats()
+    except ImportError:
+        print("Pillow is not installed, picture variants are skipped")
+        return []
+    todo = [source_hash for source_hash in dict.fromkeys(h for h in source_hashes if h)
+            if not media.get_variants(conn, source_hash)]
+    if not todo:
+        return []
+    # Pillow releases the GIL while it resizes and encodes
+    with ThreadPoolExecutor(max_workers=workers or paths_info.ingest_workers) as executor:
+        results = executor.map(lambda source_hash: make_variants(source_hash, formats), todo)
+        return [(source_hash, *variant) for source_hash, variants in zip(todo, results) for variant in variants]
+
+
+def add_variants(conn, source_hashes, workers=None):
+    """
+    Creates and records the variants of the given pictures that have none yet. The caller commits.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    source_hashes (iterable): The content hashes of the original pictures.
+    workers (int): The number of pictures processed at once (default is paths_info.ingest_workers).
+
+    Returns:
+    int: The number of pictures with new variants.
+    """
+    variants = make_missing(conn, source_hashes, workers)
+    media.add_variants(conn, variants)
+    return len({variant[0] for variant in variants})
+
+
+def backfill(conn, tables=None, workers=None, batch_size=200):
+    """
+    Creates the variants of every picture of the word tables that has none yet.
+    The pictures must be in the media store (see media_store.py migrate).
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    tables (list): The tables to process (default is every word table).
+    workers (int): The number of pictures processed at once.
+    batch_size (int): The number of pictures committed at once.
+
+    Returns:
+    int: The number of pictures processed.
+    """
+    media.ensure_variants_table(conn)
+    processed = 0
+    for table_name in tables or media_store.word_tables(conn):
+        media.ensure_hash_columns(conn, table_name)
+        hashes = [row[0] for row in conn.execute(f"""SELECT DISTINCT image_hash FROM {table_name}
+            WHERE image_hash IS NOT NULL AND image_hash NOT IN (SELECT source_hash FROM media_variants)""")]
+        for start in range(0, len(hashes), batch_size):
+            processed += add_variants(conn, hashes[start:start + batch_size], workers)
+            conn.commit()
+        print(f"{table_name}: {len(hashes)} pictures processed")
+    return processed
+
+
+def main():
+    """
+    Command line entry point of the picture variant tools.
+    """
+    parser = argparse.ArgumentParser(description="Resized WebP/PNG variants of the pictures")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="create the missing variants of a data base")
+    backfill_parser.add_argument("--db", default=paths_info.data_base_path, help="path to the data base")
+    backfill_parser.add_argument("--table", action="append", help="table to process (default is every word table)")
+    backfill_parser.add_argument("--workers", type=int, default=paths_info.ingest_workers,
+                                 help="pictures processed at once")
+    args = parser.parse_args()
+
+    conn = db_pool.connect(args.db)
+    print(f"{backfill(conn, args.table, args.workers)} pictures processed")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+# Concurrent translation and pronunciation pipeline for filling word tables.
+# Every provider call goes through a concurrency limit, a token bucket and retries with backoff;
+# a failing word never stops the rest of the batch.
+#
+# Offline benchmark against the local stand-ins:
+#   python ingest.py bench [--words 200] [--latency 0.2]
+
+import argparse
+import io
+import random
+import threading
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import paths_info
+
+
+class GoogleTranslateProvider:
+    """
+    Translation through googletrans.
+    """
+    name = "google"
+    options = {}
+
+    def __init__(self):
+        from googletrans import Translator  # imported only when the real service is used
+        self.translator = Translator()
+
+    def translate(self, text, dest):
+        """
+        Translates a text.
+
+        Parameters:
+        text (str): The text to translate.
+        dest (str): The language code of the translation.
+
+        Returns:
+        str: The translated text.
+        """
+        return self.translator.translate(text, dest=dest).text
+
+
+class GTTSProvider:
+    """
+    Pronunciation through gTTS.
+    """
+    name = "gtts"
+    options = {"tld": "com", "slow": False}  # voice options, part of the cache key
+
+    def synthesize(self, text, lang):
+        """
+        Generates the MP3 pronunciation of a text.
+
+        Parameters:
+        text (str): The text to pronounce.
+        lang (str): The language code of the pronunciation.
+
+        Returns:
+        bytes: The MP3 data.
+        """
+        from gtts import gTTS  # imported only when the real service is used
+        tts = gTTS(text=text, lang=lang, **self.options)
+        mp3_fp = io.BytesIO()
+        tts.write_to_fp(mp3_fp)
+        return mp3_fp.getvalue()
+
+
+class StubTranslateProvider:
+    """
+    Local stand-in for the translator: answers after a fixed latency, no network.
+
+    Attributes:
+    latency (float): The simulated duration of a call in seconds.
+    """
+    name = "stub"
+    options = {}
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def translate(self, text, dest):
+        """
+        Returns a predictable fake translation.
+
+        Parameters:
+        text (str): The text to translate.
+        dest (str): The language code of the translation.
+
+        Returns:
+        str: The fake translated text.
+        """
+        time.sleep(self.latency)
+        return f"{text} ({dest})"
+
+
+class StubTTSProvider:
+    """
+    Local stand-in for the pronunciation service: answers after a fixed latency, no network.
+
+    Attributes:
+    latency (float): The simulated duration of a call in seconds.
+    size (int): The size of the fake audio in bytes.
+    """
+    name = "stub"
+    options = {}
+
+    def __init__(self, latency=0.0, size=4096):
+        self.latency = latency
+        self.size = size
+
+    def synthesize(self, text, lang):
+        """
+        Returns predictable fake audio data.
+
+        Parameters:
+        text (str): The text to pronounce.
+        lang (str): The language code of the pronunciation.
+
+        Returns:
+        bytes: The fake audio data (unique per text and language).
+        """
+        time.sleep(self.latency)
+        seed = hashlib.sha256(f"{lang}:{text}".encode()).digest()
+        return (seed * (self.size // len(seed) + 1))[:self.size]
+
+
+def make_translator(backend=None):
+    """
+    Creates the translation provider chosen in paths_info.
+
+    Parameters:
+    backend (str): "google" or "stub" (default is paths_info.translator_backend).
+
+    Returns:
+    object: A provider with a translate(text, dest) method.
+    """
+    backend = backend or paths_info.translator_backend
+    if backend == "stub":
+        return StubTranslateProvider()
+    return GoogleTranslateProvider()
+
+
+def make_tts(backend=None):
+    """
+    Creates the pronunciation provider chosen in paths_info.
+
+    Parameters:
+    backend (str): "gtts" or "stub" (default is paths_info.tts_backend).
+
+    Returns:
+    object: A provider with a synthesize(text, lang) method.
+    """
+    backend = backend or paths_info.tts_backend
+    if backend == "stub":
+        return StubTTSProvider()
+    return GTTSProvider()
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket: allows bursts up to the capacity and the given average rate.
+
+    Attributes:
+    rate (float): The number of tokens added per second.
+    capacity (float): The maximum number of tokens.
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes one token, waiting until one is available.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class LimitedProvider:
+    """
+    Wraps a provider call with a concurrency limit, rate limiting and retries with backoff.
+
+    Attributes:
+    name (str): The name used in error messages.
+    concurrency (int): The maximum number of parallel calls.
+    attempts (int): The number of attempts per call.
+    base_delay (float): The first backoff delay in seconds, doubled on every retry.
+    """
+    def __init__(self, name, concurrency, rate_per_sec, attempts=4, base_delay=0.5):
+        self.name = name
+        self.concurrency = concurrency
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._bucket = TokenBucket(rate_per_sec)
+
+    def call(self, func, *args):
+        """
+        Calls a provider function within the limits, retrying on errors.
+
+        Parameters:
+        func (callable): The provider function.
+        *args: The arguments of the function.
+
+        Returns:
+        object: The result of the function.
+        """
+        for attempt in range(1, self.attempts + 1):
+            self._bucket.acquire()
+            try:
+                with self._slots:
+                    return func(*args)
+            except Exception:
+                if attempt == self.attempts:
+                    raise
+                # Exponential backoff with jitter, so retries of parallel calls do not collide
+                time.sleep(self.base_delay * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+
+class IngestResult:
+    """
+    The outcome of one word in the pipeline.
+
+    Attributes:
+    word (str): The English word.
+    translation (str): The Russian translation (None if the translation failed).
+    en_sound (bytes): The English pronunciation (None if it failed).
+    ru_sound (bytes): The Russian pronunciation (None if it failed).
+    errors (list): The error messages of the failed steps.
+    """
+    def __init__(self, word):
+        self.word = word
+        self.translation = None
+        self.en_sound = None
+        self.ru_sound = None
+        self.errors = []
+
+
+class IngestPipeline:
+    """
+    Translates and pronounces a batch of words in a bounded thread pool.
+
+    Attributes:
+    translator (object): A provider with a translate(text, dest) method.
+    tts (object): A provider with a synthesize(text, lang) method.
+    max_workers (int): The number of words processed in parallel.
+    cache (ProviderCache): The cache of provider results (None - every call goes to the provider).
+    """
+    def __init__(self, translator=None, tts=None, max_workers=None, limits=None, cache=None):
+        self.translator = translator if translator is not None else make_translator()
+        self.tts = tts if tts is not None else make_tts()
+        self.cache = cache
+        self.max_workers = max_workers or paths_info.ingest_workers
+        limits = limits or paths_info.provider_limits
+        self.translate_limit = LimitedProvider("translate", **limits["translate"])
+        self.tts_limit = LimitedProvider("tts", **limits["tts"])
+
+    def translate(self, text, dest="ru"):
+        """
+        Translates a text within the translator limits, or takes it from the cache.
+
+        Parameters:
+        text (str): The text to translate.
+        dest (str): The language code of the translation (default is 'ru').
+
+        Returns:
+        str: The translated text.
+        """
+        key = (self.translator.name, "translate", text, dest, self.translator.options)
+        if self.cache is not None:
+            cached = self.cache.get(*key)
+            if cached is not None:
+                return cached.decode("utf-8")
+        translation = self.translate_limit.call(self.translator.translate, text, dest)
+        if self.cache is not None:
+            self.cache.put(*key[:4], translation.encode("utf-8"), key[4])
+        return translation
+
+    def synthesize(self, text, lang):
+        """
+        Generates a pronunciation within the pronunciation service limits, or takes it from the cache.
+
+        Parameters:
+        text (str): The text to pronounce.
+        lang (str): The language code of the pronunciation.
+
+        Returns:
+        bytes: The audio data.
+        """
+        key = (self.tts.name, "tts", text, lang, self.tts.options)
+        if self.cache is not None:
+            cached = self.cache.get(*key)
+            if cached is not None:
+                return cached
+        sound = self.tts_limit.call(self.tts.synthesize, text, lang)
+        if self.cache is not None:
+            self.cache.put(*key[:4], sound, key[4])
+        return sound
+
+    def process_word(self, word):
+        """
+        Translates a word and generates both pronunciations; errors are recorded, not raised.
+
+        Parameters:
+        word (str): The English word.
+
+        Returns:
+        IngestResult: The outcome of the word.
+        """
+        result = IngestResult(word)
+        try:
+            result.en_sound = self.synthesize(word, "en")
+        except Exception as e:
+            result.errors.append(f"EN sound: {e}")
+        try:
+            result.translation = self.translate(word, "ru")
+        except Exception as e:
+            result.errors.append(f"translation: {e}")
+            return result
+        try:
+            result.ru_sound = self.synthesize(result.translation, "ru")
+        except Exception as e:
+            result.errors.append(f"RU sound: {e}")
+        return result
+
+    def run(self, words):
+        """
+        Processes a batch of words in parallel.
+
+        Parameters:
+        words (list): The English words.
+
+        Returns:
+        list: The IngestResult of every word, in the order of the input.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(self.process_word, words))
+
+
+def main():
+    """
+    Command line entry point: benchmarks the pipeline against the local stand-ins.
+    """
+    parser = argparse.ArgumentParser(description="Translation and pronunciation pipeline")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench_parser = subparsers.add_parser("bench", help="run the pipeline against local stand-ins")
+    bench_parser.add_argument("--words", type=int, default=200, help="number of words")
+    bench_parser.add_argument("--latency", type=float, default=0.2, help="simulated seconds per call")
+    bench_parser.add_argument("--workers", type=int, default=paths_info.ingest_workers, help="parallel words")
+    bench_parser.add_argument("--rate", type=float, help="calls per second per provider (default from paths_info)")
+    args = parser.parse_args()
+
+    words = [f"word{i}" for i in range(args.words)]
+    limits = {name: dict(limit) for name, limit in paths_info.provider_limits.items()}
+    if args.rate:
+        for limit in limits.values():
+            limit["rate_per_sec"] = args.rate
+    pipeline = IngestPipeline(
+        StubTranslateProvider(args.latency), StubTTSProvider(args.latency), max_workers=args.workers, limits=limits
+    )
+    started = time.perf_counter()
+    results = pipeline.run(words)
+    elapsed = time.perf_counter() - started
+    failed = sum(1 for result in results if result.errors)
+    sequential = args.words * 3 * args.latency
+    print(f"{args.words} words in {elapsed:.2f} s ({args.words / elapsed:.1f} words/s), {failed} failed; "
+          f"sequential estimate {sequential:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+# Load and soak test of the trainer: many learners going through
+# /set_user -> /word/<id> -> media -> /process -> now and then /check, with think time.
+# Without --url a local instance is started on a synthetic data base with the stub services:
+#   python load_test.py --sessions 50 --duration 120
+#   python load_test.py --url http://127.0.0.1:5000 --sessions 20 --duration 3600 --report-every 300
+# Reports throughput, p50/p95/p99 per route, error rates and (local instance) SQLite lock waits.
+
+import argparse
+import http.cookiejar
+import json
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+import paths_info
+import bench
+
+
+class LockWatch:
+    """
+    Counts the SQLite statements of the local instance that waited for the write lock
+    (took longer than the threshold) or gave up with "database is locked".
+
+    Attributes:
+    threshold (float): Seconds a write may take before it counts as a lock wait.
+    waits (int): The number of lock waits.
+    wait_seconds (float): The total time of the lock waits.
+    locked (int): The number of "database is locked" errors.
+    """
+    threshold = 0.02
+    waits = 0
+    wait_seconds = 0.0
+    locked = 0
+    _lock = threading.Lock()
+
+    @classmethod
+    def timed(cls, func, sql, *args):
+        """
+        Runs a statement and records a lock wait or a lock error.
+
+        Parameters:
+        func (callable): The execute/executemany/commit method to run.
+        sql (str): The statement (None for commit).
+        *args: The arguments of the call.
+
+        Returns:
+        object: What the call returned.
+        """
+        writes = sql is None or not sql.lstrip()[:6].upper().startswith(("SELECT", "PRAGMA"))
+        begin = time.perf_counter()
+        try:
+            return func(*args)
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e):
+                with cls._lock:
+                    cls.locked += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - begin
+            if writes and elapsed > cls.threshold:
+                with cls._lock:
+                    cls.waits += 1
+                    cls.wait_seconds += elapsed
+
+
+class LockWatchCursor(sqlite3.Cursor):
+    """
+    A cursor whose statements are watched by LockWatch.
+    """
+    def execute(self, sql, parameters=()):
+        return LockWatch.timed(super().execute, sql, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return LockWatch.timed(super().executemany, sql, sql, seq_of_parameters)
+
+
+class LockWatchConnection(sqlite3.Connection):
+    """
+    A connection whose statements and commits are watched by LockWatch.
+    """
+    def cursor(self, factory=LockWatchCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        return LockWatch.timed(super().commit, None)
+
+
+class Stats:
+    """
+    Latencies and errors per route, shared by all sessions.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.latencies = {}
+        self.errors = {}
+        self.lock_errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, route, seconds, error=None, locked=False):
+        """
+        Records one request.
+
+        Parameters:
+        route (str): The route pattern, e.g. "/word/<id>".
+        seconds (float): The latency.
+        error (str): The error, if the request failed.
+        locked (bool): The response reported "database is locked".
+        """
+        with self._lock:
+            self.latencies.setdefault(route, []).append(seconds * 1000)
+            if error:
+                self.errors.setdefault(route, {}).setdefault(error, 0)
+                self.errors[route][error] += 1
+            if locked:
+                self.lock_errors += 1
+
+    def report(self, title):
+        """
+        Prints throughput, latency percentiles and error rates per route.
+
+        Parameters:
+        title (str): The heading of the report.
+        """
+        with self._lock:
+            latencies = {route: sorted(values) for route, values in self.latencies.items()}
+            errors = {route: dict(counts) for route, counts in self.errors.items()}
+            lock_errors = self.lock_errors
+        elapsed = time.perf_counter() - self.started
+        total = sum(len(values) for values in latencies.values())
+        print(f"--- {title}: {total} requests in {elapsed:.0f}s, {total / max(elapsed, 1e-9):.1f} requests/s")
+        print(f"{'route':20} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7} {'rate':>7}")
+        for route, values in sorted(latencies.items()):
+            failed = sum(errors.get(route, {}).values())
+            print(f"{route:20} {len(values):7} {bench.percentile(values, 0.50):9.1f} "
+                  f"{bench.percentile(values, 0.95):9.1f} {bench.percentile(values, 0.99):9.1f} "
+                  f"{failed:7} {failed / len(values):7.2%}")
+            for error, count in errors.get(route, {}).items():
+                print(f"    {count} x {error}")
+        print(f"'database is locked' in responses: {lock_errors}")
+        if LockWatch.waits or LockWatch.locked:
+            print(f"server lock waits over {LockWatch.threshold * 1000:.0f} ms: {LockWatch.waits} "
+                  f"({LockWatch.wait_seconds:.1f}s in total), lock errors: {LockWatch.locked}")
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """
+    Leaves redirects to the session, so every route is timed on its own.
+    """
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+def multipart(fields, files):
+    """
+    Encodes a multipart/form-data body.
+
+    Parameters:
+    fields (dict): Field name -> text value.
+    files (dict): Field name -> (file name, bytes).
+
+    Returns:
+    tuple: The body and its Content-Type.
+    """
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode() + data + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class Session(threading.Thread):
+    """
+    One simulated learner.
+
+    Attributes:
+    number (int): The session number (also seeds its random choices).
+    options (argparse.Namespace): The load test options.
+    stats (Stats): The shared statistics.
+    deadline (float): When to stop (time.perf_counter()).
+    """
+    def __init__(self, number, options, user_name, ids, stats, deadline, recording):
+        super().__init__(name=f"learner-{number}", daemon=True)
+        self.options = options
+        self.user_name = user_name
+        self.ids = ids
+        self.stats = stats
+        self.deadline = deadline
+        self.recording = recording
+        self.rng = random.Random(options.seed * 100003 + number)
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect())
+
+    def call(self, route, path, data=None, content_type=None):
+        """
+        Sends one request and records it.
+
+        Parameters:
+        route (str): The route pattern for the report.
+        path (str): The path with the query string.
+        data (dict or bytes): Form fields, or an encoded body.
+        content_type (str): The Content-Type of an encoded body.
+
+        Returns:
+        bytes or None: The response body, or None if the request failed.
+        """
+        if isinstance(data, dict):
+            data = urllib.parse.urlencode(data).encode()
+        request = urllib.request.Request(self.options.url + path, data=data)
+        if content_type:
+            request.add_header("Content-Type", content_type)
+        begin = time.perf_counter()
+        error = None
+        body = b""
+        try:
+            with self.opener.open(request, timeout=self.options.timeout) as response:
+                body = response.read()
+        except urllib.error.HTTPError as e:
+            body = e.read()
+            if e.code >= 400 and not (e.code == 404 and route.startswith(("/image", "/sound"))):
+                error = f"HTTP {e.code}"  # a word without a picture or sound is not an error
+        except Exception as e:
+            error = type(e).__name__
+        self.stats.record(route, time.perf_counter() - begin, error, b"database is locked" in body)
+        return None if error else body
+
+    def think(self):
+        """
+        Waits like a learner reading the card or typing (exponential around the mean think time).
+        """
+        if self.options.think_time > 0:
+            time.sleep(min(self.rng.expovariate(1 / self.options.think_time), 5 * self.options.think_time))
+
+    def start_training(self):
+        """
+        Logs in for a random window of words.
+
+        Returns:
+        int: The first ID number of the window.
+        """
+        start = self.rng.randrange(max(1, len(self.ids) - self.options.window))
+        window = self.ids[start:start + self.options.window]
+        self.call("/set_user", "/set_user", {"user": self.user_name, "table_name": self.options.table,
+                                             "start_id": window[0], "max_id": window[-1], "order_mode": "id"})
+        return window[0]
+
+    def run(self):
+        id_nr = self.start_training()
+        while time.perf_counter() < self.deadline:
+            if self.call("/word/<id>", f"/word/{id_nr}") is None:
+                id_nr = self.start_training()
+                continue
+            if self.rng.random() < self.options.media_share:
+                self.call("/sound/en/<id>", f"/sound/en/{id_nr}")
+                self.call("/sound/ru/<id>", f"/sound/ru/{id_nr}")
+                self.call("/image/<id>", f"/image/{id_nr}")
+            self.think()
+            if self.recording and self.rng.random() < self.options.check_share:
+                body, content_type = multipart({"id_nr": id_nr}, {"audio_data": ("speech.wav", self.recording)})
+                self.call("/check", "/check", body, content_type)
+            # Most answers are right, some miss the last letter
+            answer = f"word{id_nr}" if self.rng.random() < 0.7 else f"word{id_nr}"[:-1]
+            body = self.call("/process", "/process", {"userText": answer, "id_nr": id_nr})
+            self.think()
+            next_id = json.loads(body).get("next_id") if body else None
+            id_nr = next_id if next_id else self.start_training()
+
+
+def start_local_instance(options):
+    """
+    Starts the trainer on a synthetic data base with the stub services, in this process.
+
+    Parameters:
+    options (argparse.Namespace): The load test options.
+
+    Returns:
+    tuple: The base URL, the ID numbers of the words and the learner names.
+    """
+    workdir = options.workdir or tempfile.mkdtemp(prefix="trainer_load_")
+    bench.configure(workdir)
+    users = [f"learner{n}" for n in range(options.sessions)]
+    paths_info.users = {user_name: "#ffffff" for user_name in users}
+    paths_info.pron_check_workers = options.check_workers
+    import db_pool
+    import synthetic_db
+    conn = db_pool.connect(paths_info.data_base_path)
+    ids = synthetic_db.generate(conn, options.table, options.words, options.sparsity, users=(), seed=options.seed)
+    conn.close()
+
+    import app as trainer
+    from werkzeug.serving import make_server
+    import pron_jobs
+    trainer.pool = db_pool.ConnectionPool(paths_info.data_base_path, factory=LockWatchConnection)
+    trainer.pron_queue = pron_jobs.JobQueue(recognizer=pron_jobs.StubRecognizer(latency=options.recognizer_latency))
+    server = make_server("127.0.0.1", 0, trainer.create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"local instance on port {server.server_port}, {len(ids)} words in {workdir}")
+    return f"http://127.0.0.1:{server.server_port}", ids, users
+
+
+def main():
+    """
+    Command line entry point of the load test.
+    """
+    parser = argparse.ArgumentParser(description="Concurrent learners load and soak test")
+    parser.add_argument("--url", help="a running instance (default is a local one on a synthetic data base)")
+    parser.add_argument("--sessions", type=int, default=20, help="simultaneous learners")
+    parser.add_argument("--duration", type=float, default=60, help="seconds to run")
+    parser.add_argument("--report-every", type=float, default=0, help="print an interim report every N seconds")
+    parser.add_argument("--think-time", type=float, default=1.0, help="mean seconds a learner thinks per step")
+    parser.add_argument("--media-share", type=float, default=1.0, help="share of cards whose media are fetched")
+    parser.add_argument("--check-share", type=float, default=0.1, help="share of cards checked by voice")
+    parser.add_argument("--window", type=int, default=50, help="words per training window")
+    parser.add_argument("--table", default="general_words", help="the word table")
+    parser.add_argument("--user", action="append", help="learner names of a running instance (default is paths_info.users)")
+    parser.add_argument("--start-id", type=int, default=1, help="first ID number of a running instance")
+    parser.add_argument("--max-id", type=int, default=1000, help="last ID number of a running instance")
+    parser.add_argument("--words", type=int, default=5000, help="words of the local synthetic data base")
+    parser.add_argument("--sparsity", type=float, default=0.0, help="share of ID numbers left out (local)")
+    parser.add_argument("--check-workers", type=int, default=4, help="pronunciation workers (local)")
+    parser.add_argument("--recognizer-latency", type=float, default=0.3, help="stub recognizer seconds (local)")
+    parser.add_argument("--lock-wait-ms", type=float, default=20, help="a write slower than this is a lock wait")
+    parser.add_argument("--timeout", type=float, default=30, help="request timeout in seconds")
+    parser.add_argument("--workdir", help="folder for the local data base (default is a temporary one)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    options = parser.parse_args()
+    LockWatch.threshold = options.lock_wait_ms / 1000
+
+    if options.url:
+        options.url = options.url.rstrip("/")
+        users = options.user or list(paths_info.users)
+        ids = list(range(options.start_id, options.max_id + 1))
+    else:
+        options.url, ids, users = start_local_instance(options)
+    recording = bench.make_wav() if options.check_share > 0 else None
+
+    stats = Stats()
+    deadline = time.perf_counter() + options.duration
+    sessions = [Session(n, options, users[n % len(users)], ids, stats, deadline, recording)
+                for n in range(options.sessions)]
+    for session in sessions:
+        session.start()
+    while any(session.is_alive() for session in sessions):
+        time.sleep(min(options.report_every or 1.0, max(0.1, deadline - time.perf_counter())))
+        if options.report_every and time.perf_counter() < deadline:
+            stats.report("interim")
+    stats.report(f"{options.sessions} learners")
+
+
+if __name__ == "__main__":
+    main()
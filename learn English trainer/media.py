@@ -0,0 +1,173 @@
+# Content hashes of the media BLOBs, stored next to them for HTTP validation
+
+import hashlib
+
+# BLOB columns of the word tables
+MEDIA_COLUMNS = ("en_sounds", "ru_sounds", "image")
+
+# Leading bytes of the media formats -> mimetype
+MAGIC_NUMBERS = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"ID3", "audio/mpeg"),
+    (b"\xff\xfb", "audio/mpeg"),
+    (b"\x1aE\xdf\xa3", "audio/webm"),
+)
+
+# Tables whose hash columns are known to exist in this process
+_ready_tables = set()
+
+
+def content_hash(data):
+    """
+    Calculates the content hash of a media file.
+
+    Parameters:
+    data (bytes): The binary data of the media.
+
+    Returns:
+    str or None: The hex SHA-256 of the data, or None if there is no data.
+    """
+    if not data:
+        return None
+    return hashlib.sha256(data).hexdigest()
+
+
+def media_fields(data):
+    """
+    Builds the hash and size values stored next to a BLOB.
+
+    Parameters:
+    data (bytes): The binary data of the media.
+
+    Returns:
+    tuple: The content hash and the size in bytes, or (None, None) if there is no data.
+    """
+    if not data:
+        return None, None
+    return content_hash(data), len(data)
+
+
+def hash_columns_sql():
+    """
+    Builds the column definitions of the hash and size columns for CREATE TABLE.
+
+    Returns:
+    str: The column definitions separated by commas.
+    """
+    return ",\n            ".join(
+        f"{column}_hash TEXT, {column}_size INTEGER" for column in MEDIA_COLUMNS
+    )
+
+
+def ensure_hash_columns(conn, table_name):
+    """
+    Adds the hash and size columns to a word table and fills them for the existing BLOBs.
+    Runs once per table and process.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    table_name (str): The name of the word table.
+    """
+    if table_name in _ready_tables:
+        return
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")}
+    if not existing:
+        return  # no such table
+    conn.create_function("media_hash", 1, content_hash, deterministic=True)
+    for column in MEDIA_COLUMNS:
+        if f"{column}_hash" not in existing:
+            conn.execute(f"ALTER TABLE {table_name} ADD COLUMN {column}_hash TEXT")
+            conn.execute(f"ALTER TABLE {table_name} ADD COLUMN {column}_size INTEGER")
+        conn.execute(f"""UPDATE {table_name}
+            SET {column}_hash = media_hash({column}), {column}_size = length({column})
+            WHERE {column} IS NOT NULL AND {column}_hash IS NULL""")
+    conn.commit()
+    _ready_tables.add(table_name)
+
+
+def ensure_variants_table(conn):
+    """
+    Creates the table of media variants (other formats and sizes of a media file) if it does not exist.
+    Variants are keyed by the hash of their source, so every table sharing a file shares its variants.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    """
+    conn.execute("""CREATE TABLE IF NOT EXISTS media_variants (
+        source_hash TEXT NOT NULL,
+        variant TEXT NOT NULL,
+        hash TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        mimetype TEXT NOT NULL,
+        PRIMARY KEY (source_hash, variant)) WITHOUT ROWID""")
+
+
+def add_variant(conn, source_hash, variant, content_hash, size, mimetype):
+    """
+    Records a variant of a media file, whose data is already in the media store. The caller commits.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    source_hash (str): The content hash of the original media.
+    variant (str): The variant name, e.g. "opus".
+    content_hash (str): The content hash of the variant.
+    size (int): The size of the variant in bytes.
+    mimetype (str): The mimetype of the variant.
+    """
+    ensure_variants_table(conn)
+    conn.execute("INSERT OR REPLACE INTO media_variants VALUES (?, ?, ?, ?, ?)",
+                 (source_hash, variant, content_hash, size, mimetype))
+
+
+def add_variants(conn, variants):
+    """
+    Records many variants at once, e.g. the ones made before a write transaction. The caller commits.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    variants (list): Tuples of source hash, variant name, content hash, size and mimetype.
+    """
+    if variants:
+        ensure_variants_table(conn)
+        conn.executemany("INSERT OR REPLACE INTO media_variants VALUES (?, ?, ?, ?, ?)", variants)
+
+
+def get_variants(conn, source_hash):
+    """
+    Lists the variants of a media file.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    source_hash (str): The content hash of the original media.
+
+    Returns:
+    dict: Variant name -> (content hash, size, mimetype).
+    """
+    ensure_variants_table(conn)
+    rows = conn.execute("SELECT variant, hash, size, mimetype FROM media_variants WHERE source_hash = ?",
+                        (source_hash,))
+    return {row[0]: (row[1], row[2], row[3]) for row in rows}
+
+
+def sniff_mimetype(data, default="application/octet-stream"):
+    """
+    Finds the real format of media from its first bytes.
+
+    Parameters:
+    data (bytes): The media, or at least its first 16 bytes.
+    default (str): The mimetype returned for an unknown format.
+
+    Returns:
+    str: The mimetype of the media.
+    """
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[4:12] in (b"ftypavif", b"ftypavis"):
+        return "image/avif"
+    for magic, mimetype in MAGIC_NUMBERS:
+        if data.startswith(magic):
+            return mimetype
+    return default
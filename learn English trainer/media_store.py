@@ -0,0 +1,196 @@
+# Content-addressed media store: sounds and pictures are files named by their SHA-256 hash.
+# The word tables only keep the hash ({column}_hash), so identical media is stored once
+# for every table, and the BLOBs stay out of the SQLite page cache.
+#
+# Migration of an existing data base (moves the BLOBs to the store):
+#   python media_store.py migrate [--db PATH] [--table NAME] [--vacuum]
+
+import argparse
+import os
+import tempfile
+import paths_info
+import db_pool
+import media
+
+
+def path_for(content_hash, root=None):
+    """
+    Builds the file path of a media file in the store.
+
+    Parameters:
+    content_hash (str): The hex SHA-256 of the media.
+    root (str): The store folder (default is paths_info.media_store_path).
+
+    Returns:
+    str: The path of the file (two-level fan-out by the first hash characters).
+    """
+    root = root or paths_info.media_store_path
+    return os.path.join(root, content_hash[:2], content_hash)
+
+
+def exists(content_hash, root=None):
+    """
+    Checks if a media file is in the store.
+
+    Parameters:
+    content_hash (str): The hex SHA-256 of the media.
+    root (str): The store folder (default is paths_info.media_store_path).
+
+    Returns:
+    bool: True if the file exists.
+    """
+    return bool(content_hash) and os.path.exists(path_for(content_hash, root))
+
+
+def put(data, root=None):
+    """
+    Adds media to the store; identical data is written only once.
+
+    Parameters:
+    data (bytes): The binary data of the media.
+    root (str): The store folder (default is paths_info.media_store_path).
+
+    Returns:
+    tuple: The content hash and the size in bytes, or (None, None) if there is no data.
+    """
+    content_hash, size = media.media_fields(data)
+    if content_hash is None:
+        return None, None
+    target = path_for(content_hash, root)
+    if not os.path.exists(target):
+        folder = os.path.dirname(target)
+        os.makedirs(folder, exist_ok=True)
+        # Write to a temporary file and rename, so readers never see a partial file
+        fd, temp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, target)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+    return content_hash, size
+
+
+def get(content_hash, root=None):
+    """
+    Reads media from the store.
+
+    Parameters:
+    content_hash (str): The hex SHA-256 of the media.
+    root (str): The store folder (default is paths_info.media_store_path).
+
+    Returns:
+    bytes or None: The binary data, or None if the file is not in the store.
+    """
+    try:
+        with open(path_for(content_hash, root), "rb") as file:
+            return file.read()
+    except (OSError, TypeError):
+        return None
+
+
+def word_tables(conn):
+    """
+    Lists the tables of the data base that have media columns.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+
+    Returns:
+    list: The names of the word tables.
+    """
+    # One query, whatever the number of tables (the search indexes add some per word table)
+    return [name for (name,) in conn.execute(f"""SELECT m.name FROM sqlite_master AS m, pragma_table_info(m.name) AS c
+        WHERE m.type = 'table' AND c.name IN ({", ".join("?" * len(media.MEDIA_COLUMNS))})
+        GROUP BY m.name
+        HAVING count(*) = ?
+        ORDER BY m.name""", (*media.MEDIA_COLUMNS, len(media.MEDIA_COLUMNS)))]
+
+
+def is_word_table(conn, table_name):
+    """
+    Checks that a name is the name of a word table, e.g. before it goes into SQL text.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    table_name (str): The name to check.
+
+    Returns:
+    bool: True if the table exists and has media columns.
+    """
+    return conn.execute(f"""SELECT count(*) FROM sqlite_master AS m, pragma_table_info(m.name) AS c
+        WHERE m.type = 'table' AND m.name = ? AND c.name IN ({", ".join("?" * len(media.MEDIA_COLUMNS))})""",
+        (table_name, *media.MEDIA_COLUMNS)).fetchone()[0] == len(media.MEDIA_COLUMNS)
+
+
+def migrate(conn, tables=None, root=None, batch_size=200):
+    """
+    Moves the media BLOBs of the word tables to the store and clears the BLOB columns.
+    Safe to re-run: rows already migrated have NULL BLOBs and are skipped.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    tables (list): The tables to migrate (default is every word table).
+    root (str): The store folder (default is paths_info.media_store_path).
+    batch_size (int): The number of rows moved per transaction.
+
+    Returns:
+    dict: Counters - rows moved, files written, duplicates found, bytes moved.
+    """
+    stats = {"rows": 0, "files": 0, "duplicates": 0, "bytes": 0}
+    for table_name in tables or word_tables(conn):
+        media.ensure_hash_columns(conn, table_name)
+        for column in media.MEDIA_COLUMNS:
+            while True:
+                rows = conn.execute(
+                    f"SELECT id_nr, {column} FROM {table_name} WHERE {column} IS NOT NULL LIMIT ?",
+                    (batch_size,)).fetchall()
+                if not rows:
+                    break
+                updates = []
+                for id_nr, data in rows:
+                    content_hash = media.content_hash(data)
+                    if exists(content_hash, root):
+                        stats["duplicates"] += 1
+                    else:
+                        put(data, root)
+                        stats["files"] += 1
+                    stats["bytes"] += len(data)
+                    updates.append((content_hash, len(data), id_nr))
+                # Files are written before the BLOBs are cleared, so a crash never loses media
+                conn.executemany(
+                    f"""UPDATE {table_name}
+                    SET {column} = NULL, {column}_hash = ?, {column}_size = ?
+                    WHERE id_nr = ?""", updates)
+                conn.commit()
+                stats["rows"] += len(updates)
+        print(f"{table_name}: migrated")
+    return stats
+
+
+def main():
+    """
+    Command line entry point of the media store tools.
+    """
+    parser = argparse.ArgumentParser(description="Content-addressed media store tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="move the media BLOBs of a data base to the store")
+    migrate_parser.add_argument("--db", default=paths_info.data_base_path, help="path to the data base")
+    migrate_parser.add_argument("--table", action="append", help="table to migrate (default is every word table)")
+    migrate_parser.add_argument("--store", default=paths_info.media_store_path, help="media store folder")
+    migrate_parser.add_argument("--vacuum", action="store_true", help="shrink the data base file afterwards")
+    args = parser.parse_args()
+
+    conn = db_pool.connect(args.db)
+    stats = migrate(conn, args.table, args.store)
+    print(f"{stats['rows']} rows migrated, {stats['files']} files written, "
+          f"{stats['duplicates']} duplicates, {stats['bytes']} bytes moved")
+    if args.vacuum:
+        conn.execute("VACUUM")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+# In-process metrics of the trainer: counters and latency histograms in the Prometheus
+# text format, and SQLite connections that time every statement.
+# The numbers are per process: with several workers every worker has its own /metrics.
+
+import contextvars
+import sqlite3
+import sys
+import threading
+import time
+
+# Latency buckets in seconds, from a cached lookup to a slow recognition call
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Buckets of the number of SQL statements of one request
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+def _labels_text(labelnames, values, extra=""):
+    """
+    Formats the labels of a sample, e.g. {route="/word/<int:id_nr>",le="0.1"}.
+    """
+    pairs = []
+    for name, value in zip(labelnames, values):
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """
+    A counter (or, with set(), a gauge) per combination of label values.
+
+    Attributes:
+    name (str): The metric name.
+    help (str): The description shown on /metrics.
+    labelnames (tuple): The label names.
+    kind (str): "counter" or "gauge".
+    """
+    def __init__(self, name, help, labelnames=(), kind="counter"):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """
+        Adds to the counter of the given label values.
+        """
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        """
+        Sets the value of the given label values (gauges).
+        """
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        """
+        Returns the metric in the Prometheus text format.
+
+        Returns:
+        list: The lines of the metric.
+        """
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels_text(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    A histogram of observed values per combination of label values.
+
+    Attributes:
+    name (str): The metric name.
+    help (str): The description shown on /metrics.
+    labelnames (tuple): The label names.
+    buckets (tuple): The upper bounds of the buckets.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """
+        Records a value for the given label values.
+        """
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        """
+        Returns the metric in the Prometheus text format (cumulative buckets).
+
+        Returns:
+        list: The lines of the metric.
+        """
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series_items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in series_items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, key, le)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels_text(self.labelnames, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels_text(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    """
+    The metrics of the process, in the order they are shown.
+    """
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        """
+        Adds a metric, or returns the one already registered under its name.
+
+        Parameters:
+        metric (Counter or Histogram): The metric.
+
+        Returns:
+        Counter or Histogram: The registered metric.
+        """
+        return self._metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        """
+        Returns every metric in the Prometheus text format.
+
+        Returns:
+        str: The exposition text.
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_seconds = registry.register(Histogram(
+    "trainer_request_seconds", "Request latency by route", ("route", "method", "status")))
+request_sql_queries = registry.register(Histogram(
+    "trainer_request_sql_queries", "SQL statements per request by route", ("route",), QUERY_BUCKETS))
+request_sql_seconds = registry.register(Histogram(
+    "trainer_request_sql_seconds", "Time spent in SQL per request by route", ("route",)))
+sql_seconds = registry.register(Counter(
+    "trainer_sql_seconds_total", "Time spent in SQL by calling function", ("caller",)))
+sql_queries = registry.register(Counter(
+    "trainer_sql_queries_total", "SQL statements by calling function", ("caller",)))
+media_bytes = registry.register(Counter(
+    "trainer_media_bytes_total", "Media bytes sent by route", ("route",)))
+media_responses = registry.register(Counter(
+    "trainer_media_responses_total", "Media responses by route and status (304 - browser cache hit)",
+    ("route", "status")))
+cache_lookups = registry.register(Counter(
+    "trainer_cache_lookups_total", "Lookups of the in-process caches", ("cache", "result")))
+check_seconds = registry.register(Histogram(
+    "trainer_check_seconds", "Pronunciation check latency by stage", ("stage",)))
+check_queue_depth = registry.register(Counter(
+    "trainer_check_queue_depth", "Pronunciation checks waiting", kind="gauge"))
+errors = registry.register(Counter(
+    "trainer_errors_total", "Errors handled inside the app by place", ("where",)))
+
+# SQL statements and time of the current request: [count, seconds], None outside requests
+_request_sql = contextvars.ContextVar("request_sql", default=None)
+
+
+def begin_request():
+    """
+    Starts counting the SQL statements of the current request.
+    """
+    _request_sql.set([0, 0.0])
+
+
+def end_request():
+    """
+    Stops counting and returns what the current request spent in SQL.
+
+    Returns:
+    tuple: The number of statements and the seconds.
+    """
+    totals = _request_sql.get() or [0, 0.0]
+    _request_sql.set(None)
+    return totals[0], totals[1]
+
+
+def _caller():
+    """
+    Returns the name of the function that ran the statement (the first frame outside this module).
+    """
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_globals.get("__name__") == __name__:
+        frame = frame.f_back
+    return frame.f_code.co_name if frame is not None else "?"
+
+
+def _timed(func, *args):
+    """
+    Runs a statement and adds its duration to the request and to its caller.
+    """
+    begin = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        elapsed = time.perf_counter() - begin
+        totals = _request_sql.get()
+        if totals is not None:
+            totals[0] += 1
+            totals[1] += elapsed
+        caller = _caller()
+        sql_queries.inc(caller=caller)
+        sql_seconds.inc(elapsed, caller=caller)
+
+
+class MetricsCursor(sqlite3.Cursor):
+    """
+    A cursor that times its statements.
+    """
+    def execute(self, sql, parameters=()):
+        return _timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return _timed(super().executemany, sql, seq_of_parameters)
+
+
+class MetricsConnection(sqlite3.Connection):
+    """
+    A connection whose statements are timed (use as db_pool factory).
+    """
+    def cursor(self, factory=MetricsCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
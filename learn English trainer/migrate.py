@@ -0,0 +1,57 @@
+# Brings a data base up to date in one place: the tables, indexes and triggers the requests
+# expect (the search index too), and the learners' progress rows of every word table. The app runs it once at start
+# (create_app), so no request runs DDL; after an upgrade it can also be run by hand first,
+# so the workers start on a data base that is ready:
+#   python migrate.py [--db PATH]
+
+import argparse
+import time
+import paths_info
+import db_pool
+import media
+import media_store
+import progress
+import progress_stats
+import pron_jobs
+import search
+import word_cache
+
+
+def migrate(conn):
+    """
+    Creates what is missing; on a data base already up to date it costs a few lookups.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    """
+    progress.ensure_schema(conn)
+    progress_stats.ensure_schema(conn)
+    pron_jobs.ensure_schema(conn)
+    for table_name in media_store.word_tables(conn):
+        # Hashes the BLOBs of a table from before the hash columns: slow once, not in a request
+        media.ensure_hash_columns(conn, table_name)
+        word_cache.ensure_triggers(conn, table_name)
+        search.ensure_index(conn, table_name)
+        # Copies the learners' old columns once, later only the words added since
+        for user_name in paths_info.users:
+            progress.ensure_user(conn, table_name, user_name)
+    conn.commit()
+
+
+def main():
+    """
+    Command line entry point of the migration.
+    """
+    parser = argparse.ArgumentParser(description="Bring the data base up to date")
+    parser.add_argument("--db", default=paths_info.data_base_path, help="path to the data base")
+    args = parser.parse_args()
+
+    conn = db_pool.connect(args.db)
+    begin = time.perf_counter()
+    migrate(conn)
+    conn.close()
+    print(f"Data base up to date in {time.perf_counter() - begin:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
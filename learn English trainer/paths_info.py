@@ -12,10 +12,109 @@ data_base_path = r"C:\Your_path\your_base_name.db"
 # IMAGES folder path
 images_folder_path = r"C:\Your_path\images"
 
+# JOURNAL folder of the progress answers not stored yet (write-behind mode)
+progress_journal_path = r"C:\Your_path\progress_journal"
+
 # TEXT folder path
 texts_folder_path = r"C:\Your_path\texts"
 
+# MEDIA store folder path (sounds and pictures stored as files named by their content hash)
+media_store_path = r"C:\Your_path\media"
+
+# CACHE of translations and pronunciations already received from the providers
+provider_cache_path = r"C:\Your_path\provider_cache.db"
+
 # User names
 user_1 = "your_user_1"
 user_2 = "your_user_2"
 user_3 = "your_user_3"
+
+# Learners and their background colors: add as many as needed, their progress is kept in the progress table
+users = {
+    user_1: "#e8f5e9",  # light green
+    user_2: "#e3f2fd",  # light blue
+    user_3: "#fce4ec"  # pink
+}
+
+# SQLite connection settings, applied once per connection of the pool
+# Number of idle connections kept open per process
+db_pool_size = 8
+
+# Number of compiled statements cached per connection
+db_cached_statements = 256
+
+# PRAGMA name -> value
+db_pragmas = {
+    "journal_mode": "WAL",  # readers do not block the writer
+    "synchronous": "NORMAL",  # safe with WAL, fsync only on checkpoint
+    "mmap_size": 268435456,  # 256 MB memory-mapped I/O
+    "cache_size": -65536,  # 64 MB page cache (negative value is KiB)
+    "busy_timeout": 5000,  # wait up to 5 s for a lock instead of failing
+}
+
+# Spaced repetition: review interval grows from the minimum (nothing mastered)
+# to the maximum (every letter mastered)
+srs_min_interval_minutes = 1
+srs_max_interval_days = 60
+
+# Browser cache lifetime of media URLs that carry their content hash (?v=...)
+media_max_age = 31536000  # one year
+
+# Number of upcoming cards sent with the current one, their media is preloaded by the browser
+deck_lookahead = 3
+
+# Translation and pronunciation providers used when words are added to a table
+# "google" / "gtts" - the real services, "stub" - local stand-ins for offline runs and benchmarks
+translator_backend = "google"
+tts_backend = "gtts"
+
+# Number of words processed in parallel while a table is filled
+ingest_workers = 8
+
+# Limits per provider: parallel calls, calls per second, attempts per call
+provider_limits = {
+    "translate": {"concurrency": 4, "rate_per_sec": 5.0, "attempts": 4},
+    "tts": {"concurrency": 4, "rate_per_sec": 5.0, "attempts": 4},
+}
+
+# Size limit of the provider cache, the least recently used results are evicted first
+provider_cache_max_bytes = 536870912  # 512 MB
+
+# Decoding of recorded pronunciations (ffmpeg must be on PATH)
+audio_decode_workers = 2  # ffmpeg processes at once
+audio_decode_timeout = 10  # seconds per recording
+
+# Pronunciation checks: "google" - the real recognizer, "stub" - a local stand-in for load tests
+recognizer_backend = "google"
+pron_check_workers = 4  # checks running at once
+pron_check_queue_depth = 32  # checks waiting, more are refused with 503
+pron_check_result_ttl = 300  # seconds a finished check can be polled
+
+# Compact Opus/WebM copies of the sounds, made when words are added (ffmpeg must be on PATH)
+audio_variants_enabled = True
+opus_bitrate = "24k"
+
+# Smaller WebP (and AVIF, if Pillow supports it) copies of the pictures with PNG fallbacks,
+# made when pictures are added (Pillow must be installed)
+image_variants_enabled = True
+image_widths = (160, 320, 640)  # pixels
+image_quality = 80
+
+# Metrics on /metrics: time every SQL statement (per request and per calling function)
+metrics_sql_timing = True
+# One JSON log line per request (route, status, latency, SQL statements and time, bytes)
+request_log_enabled = True
+
+# Write-behind of the learners' answers: one writer thread per process stores them in batches,
+# at the latest after progress_flush_ms or at once when progress_flush_max answers are waiting
+progress_write_behind = False
+progress_flush_ms = 200
+progress_flush_max = 100
+
+# Cache of the word texts, translations and media hashes per process;
+# an admin edit is seen after word_cache_check_ms at the latest
+word_cache_size = 20000  # words
+word_cache_check_ms = 500
+
+# Training session built from a search query on the login page: the best search_session_size matches
+search_session_size = 50  # words
@@ -0,0 +1,118 @@
+# Letter patterns packed 2 bits per letter: c - 00, b - 01, a - 10, four letters per byte.
+# The unused code 11 fills the rest of the last byte, so the length needs no header:
+# "abcab" -> 2 bytes instead of 5 characters. Text patterns are still read as they are.
+
+# 2-bit code of every letter of a pattern
+LETTER_CODES = {"c": 0, "b": 1, "a": 2}
+CODE_LETTERS = "cba"
+PAD = 3
+
+
+def _build_tables():
+    """
+    Builds the per-byte lookup tables: the letters of a byte and its counts of a, b and letters.
+    """
+    letters, counts = [], []
+    for byte in range(256):
+        codes = [(byte >> shift) & 3 for shift in (6, 4, 2, 0)]
+        text = "".join(CODE_LETTERS[code] for code in codes if code != PAD)
+        letters.append(text)
+        counts.append((text.count("a"), text.count("b"), len(text)))
+    return letters, counts
+
+
+# Byte -> its letters, and byte -> (mastered, almost, letters)
+BYTE_LETTERS, BYTE_COUNTS = _build_tables()
+
+
+def encode(pattern):
+    """
+    Packs an a/b/c pattern.
+
+    Parameters:
+    pattern (str): The pattern (letters other than a/b count as c).
+
+    Returns:
+    bytes or None: The packed pattern, or None for None.
+    """
+    if pattern is None:
+        return None
+    if isinstance(pattern, bytes):
+        return pattern  # packed already
+    codes = [LETTER_CODES.get(letter, 0) for letter in pattern]
+    codes += [PAD] * (-len(codes) % 4)
+    return bytes((codes[i] << 6) | (codes[i + 1] << 4) | (codes[i + 2] << 2) | codes[i + 3]
+                 for i in range(0, len(codes), 4))
+
+
+def decode(packed):
+    """
+    Unpacks a pattern; a text pattern (not migrated yet) is returned as it is.
+
+    Parameters:
+    packed (bytes or str): The packed pattern.
+
+    Returns:
+    str or None: The a/b/c pattern, or None for None.
+    """
+    if packed is None or isinstance(packed, str):
+        return packed
+    return "".join(BYTE_LETTERS[byte] for byte in packed)
+
+
+def new(length):
+    """
+    Packs the pattern of a word never answered: every letter still to learn.
+
+    Parameters:
+    length (int): The number of letters.
+
+    Returns:
+    bytes: The packed pattern.
+    """
+    return encode("c" * (length or 0))
+
+
+def counts(pattern):
+    """
+    Counts the mastered (a) and almost mastered (b) letters of a packed or text pattern.
+
+    Parameters:
+    pattern (bytes or str): The pattern.
+
+    Returns:
+    tuple: The number of a letters, b letters and all letters.
+    """
+    if not pattern:
+        return 0, 0, 0
+    if isinstance(pattern, str):
+        return pattern.count("a"), pattern.count("b"), len(pattern)
+    mastered = almost = letters = 0
+    for byte in pattern:
+        a, b, n = BYTE_COUNTS[byte]
+        mastered += a
+        almost += b
+        letters += n
+    return mastered, almost, letters
+
+
+def grade(word, usr_input, pattern):
+    """
+    Builds the new pattern of an answer: a right letter moves up one step (c -> b -> a),
+    a wrong or missing letter goes back to c.
+
+    Parameters:
+    word (str): The word.
+    usr_input (str): The learner's answer.
+    pattern (str): The current pattern ("" or shorter than the word: missing letters count as mastered).
+
+    Returns:
+    str: The new pattern.
+    """
+    letters = []
+    for i, letter in enumerate(word):
+        if i < len(usr_input) and letter == usr_input[i]:
+            letters.append("b" if i < len(pattern) and pattern[i] == "c" else "a")
+        else:
+            letters.append("c")
+    return "".join(letters)
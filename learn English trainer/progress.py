@@ -0,0 +1,257 @@
+# Per-user training progress in one narrow table: a small row per (table, user, word)
+# instead of fixed user_name_N / date_stamp_N columns on the word tables.
+#
+# Migration of the old columns of a data base (also done by migrate.py at the app's start):
+#   python progress.py migrate [--db PATH] [--drop-legacy]
+# Patterns are stored packed, 2 bits per letter (see patterns.py); text patterns of older
+# data bases are still read, and packed in place by:
+#   python progress.py pack [--db PATH]
+# Every row also keeps the letter counts of its pattern, summed up per learner by
+# progress_stats.py.
+
+import argparse
+from datetime import datetime
+import paths_info
+import db_pool
+import media_store
+import patterns
+import scheduler
+
+# Old progress columns on the word tables: user column -> date stamp column
+LEGACY_COLUMNS = {
+    paths_info.user_1: "date_stamp_1",
+    paths_info.user_2: "date_stamp_2",
+    paths_info.user_3: "date_stamp_3",
+}
+
+# SQL expression of a new word's pattern: "c" for every letter, packed
+NEW_PATTERN_SQL = "pattern_new(length(words))"
+
+# Letter counts kept next to the pattern: a letters, b letters and all letters
+COUNT_COLUMNS = ("mastered_count", "learning_count", "letter_count")
+
+
+def register_functions(conn):
+    """
+    Registers the SQL functions of the progress statements on a connection.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    """
+    conn.create_function("pattern_new", 1, patterns.new, deterministic=True)
+    conn.create_function("pattern_pack", 1, patterns.encode, deterministic=True)
+    for i, column in enumerate(COUNT_COLUMNS):
+        conn.create_function(f"pattern_{column}", 1, lambda pattern, i=i: patterns.counts(pattern)[i],
+                             deterministic=True)
+    conn.create_function("srs_due_at", 2, scheduler.compute_due_at, deterministic=True)
+
+
+def ensure_schema(conn):
+    """
+    Creates the progress tables and indexes if they do not exist.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    """
+    conn.execute("""CREATE TABLE IF NOT EXISTS progress (
+        table_name TEXT NOT NULL,
+        user_name TEXT NOT NULL,
+        word_id INTEGER NOT NULL,
+        pattern BLOB,
+        reviewed_at TEXT,
+        due_at TEXT NOT NULL,
+        mastered_count INTEGER,
+        learning_count INTEGER,
+        letter_count INTEGER,
+        PRIMARY KEY (table_name, user_name, word_id)) WITHOUT ROWID""")
+    # Data bases from before the letter counts: the counts are filled in by progress_stats.rebuild
+    columns = {column[1] for column in conn.execute("PRAGMA table_info(progress)")}
+    for column in COUNT_COLUMNS:
+        if column not in columns:
+            conn.execute(f"ALTER TABLE progress ADD COLUMN {column} INTEGER")
+    # Covers "next due word": seek by (table, user), read in due order, no table lookup
+    conn.execute("""CREATE INDEX IF NOT EXISTS idx_progress_due
+        ON progress (table_name, user_name, due_at, word_id)""")
+    # Covers "next due word" of a narrow ID range: seek to the range, no table lookup
+    conn.execute("""CREATE INDEX IF NOT EXISTS idx_progress_word
+        ON progress (table_name, user_name, word_id, due_at)""")
+    # The highest word ID already copied to progress, per table and user
+    conn.execute("""CREATE TABLE IF NOT EXISTS progress_seeded (
+        table_name TEXT NOT NULL,
+        user_name TEXT NOT NULL,
+        max_word_id INTEGER NOT NULL,
+        PRIMARY KEY (table_name, user_name)) WITHOUT ROWID""")
+    # The due dates used to live in their own queue, they are part of progress now
+    conn.execute("DROP TABLE IF EXISTS review_queue")
+
+
+def ensure_user(conn, table_name, user_name, commit=True):
+    """
+    Adds the progress rows of a user for the words not copied yet.
+    The first call takes the patterns from the user's old columns, if the table has them;
+    later calls only append the words added to the table since.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    table_name (str): The name of the word table.
+    user_name (str): The name of the user.
+    commit (bool): Commit at once (callers adding words commit them together).
+    """
+    ensure_schema(conn)
+    row = conn.execute("SELECT max_word_id FROM progress_seeded WHERE table_name = ? AND user_name = ?",
+                       (table_name, user_name)).fetchone()
+    seeded_max = row[0] if row else 0
+    table_max = conn.execute(f"SELECT max(id_nr) FROM {table_name}").fetchone()[0]
+    if table_max is None or seeded_max >= table_max:
+        return
+
+    columns = {column[1] for column in conn.execute(f"PRAGMA table_info({table_name})")}
+    if user_name in LEGACY_COLUMNS and user_name in columns:
+        pattern_sql = f"coalesce(pattern_pack({user_name}), {NEW_PATTERN_SQL})"
+        # The old date stamp was set to the import time with an all-c pattern: only a pattern
+        # with a letter learned shows that the stamp is a real review, the rest are new words
+        reviewed_sql = f"CASE WHEN {user_name} GLOB '*[ab]*' THEN {LEGACY_COLUMNS[user_name]} END"
+    else:
+        pattern_sql, reviewed_sql = NEW_PATTERN_SQL, "NULL"
+    register_functions(conn)
+    # OR IGNORE: words reviewed meanwhile keep their newer progress
+    count_sql = ", ".join(f"pattern_{column}({pattern_sql})" for column in COUNT_COLUMNS)
+    conn.execute(f"""INSERT OR IGNORE INTO progress (table_name, user_name, word_id, pattern, reviewed_at, due_at,
+                                            {", ".join(COUNT_COLUMNS)})
+        SELECT ?, ?, id_nr, {pattern_sql}, {reviewed_sql}, srs_due_at({pattern_sql}, {reviewed_sql}), {count_sql}
+        FROM {table_name}
+        WHERE id_nr > ?""", (table_name, user_name, seeded_max))
+    conn.execute("INSERT OR REPLACE INTO progress_seeded VALUES (?, ?, ?)", (table_name, user_name, table_max))
+    if commit:
+        conn.commit()
+
+
+def get_pattern(conn, table_name, user_name, word_id):
+    """
+    Retrieves a user's pattern of a word.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    table_name (str): The name of the word table.
+    user_name (str): The name of the user.
+    word_id (int): The ID number of the word.
+
+    Returns:
+    str or None: The a/b/c pattern, or None if the user has no progress on the word.
+    """
+    row = conn.execute("SELECT pattern FROM progress WHERE table_name = ? AND user_name = ? AND word_id = ?",
+                       (table_name, user_name, word_id)).fetchone()
+    return patterns.decode(row[0]) if row else None
+
+
+# Stores a review: the pattern, its due date and its letter counts
+UPSERT_SQL = f"""INSERT INTO progress (table_name, user_name, word_id, pattern, reviewed_at, due_at,
+                                      {", ".join(COUNT_COLUMNS)})
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (table_name, user_name, word_id) DO UPDATE SET
+        pattern = excluded.pattern, reviewed_at = excluded.reviewed_at, due_at = excluded.due_at,
+        {", ".join(f"{column} = excluded.{column}" for column in COUNT_COLUMNS)}"""
+
+
+def record_review(conn, table_name, user_name, word_id, pattern, reviewed_at=None):
+    """
+    Stores a user's new pattern of a word and its next due date. The caller commits.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    table_name (str): The name of the word table.
+    user_name (str): The name of the user.
+    word_id (int): The ID number of the word.
+    pattern (str): The new a/b/c pattern.
+    reviewed_at (str): The review date stamp (default is the current time).
+    """
+    if reviewed_at is None:
+        reviewed_at = datetime.now().strftime(scheduler.DATE_FORMAT)
+    conn.execute(UPSERT_SQL, (table_name, user_name, word_id, patterns.encode(pattern), reviewed_at,
+                              scheduler.compute_due_at(pattern, reviewed_at), *patterns.counts(pattern)))
+
+
+def record_reviews(conn, rows):
+    """
+    Stores many reviews in one statement; a review older than the stored one is ignored,
+    so a batch may be stored again (e.g. replayed after a crash). The caller commits.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    rows (list): (table_name, user_name, word_id, pattern, reviewed_at) tuples.
+    """
+    conn.executemany(UPSERT_SQL + " WHERE excluded.reviewed_at >= coalesce(progress.reviewed_at, '')",
+        [(*row[:3], patterns.encode(row[3]), row[4], scheduler.compute_due_at(row[3], row[4]),
+          *patterns.counts(row[3])) for row in rows])
+
+
+def migrate(conn, drop_legacy=False):
+    """
+    Copies the old per-user columns of every word table to the progress table.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    drop_legacy (bool): Drop the old columns afterwards (SQLite 3.35 or newer).
+    """
+    ensure_schema(conn)
+    for table_name in media_store.word_tables(conn):
+        columns = {column[1] for column in conn.execute(f"PRAGMA table_info({table_name})")}
+        for user_name, date_column in LEGACY_COLUMNS.items():
+            if user_name not in columns:
+                continue
+            ensure_user(conn, table_name, user_name)
+            if drop_legacy:
+                conn.execute(f"ALTER TABLE {table_name} DROP COLUMN {user_name}")
+                conn.execute(f"ALTER TABLE {table_name} DROP COLUMN {date_column}")
+                conn.commit()
+            print(f"{table_name}: {user_name} migrated")
+
+
+def pack(conn, batch_size=10000):
+    """
+    Packs the text patterns left by older versions, a batch per transaction.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    batch_size (int): The number of rows per transaction.
+
+    Returns:
+    int: The number of patterns packed.
+    """
+    ensure_schema(conn)
+    register_functions(conn)
+    packed = 0
+    while True:
+        cursor = conn.execute("""UPDATE progress SET pattern = pattern_pack(pattern)
+            WHERE (table_name, user_name, word_id) IN (
+                SELECT table_name, user_name, word_id FROM progress WHERE typeof(pattern) = 'text' LIMIT ?)""",
+            (batch_size,))
+        conn.commit()
+        packed += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            return packed
+
+
+def main():
+    """
+    Command line entry point of the progress tools.
+    """
+    parser = argparse.ArgumentParser(description="Per-user training progress")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="copy the old user columns to the progress table")
+    migrate_parser.add_argument("--db", default=paths_info.data_base_path, help="path to the data base")
+    migrate_parser.add_argument("--drop-legacy", action="store_true", help="drop the old columns afterwards")
+    pack_parser = subparsers.add_parser("pack", help="pack the text patterns, 2 bits per letter")
+    pack_parser.add_argument("--db", default=paths_info.data_base_path, help="path to the data base")
+    args = parser.parse_args()
+
+    conn = db_pool.connect(args.db)
+    if args.command == "migrate":
+        migrate(conn, args.drop_legacy)
+    else:
+        print(f"{pack(conn)} patterns packed")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+# Per (table, user) progress counters kept up to date by triggers on the progress table:
+# every stored review (from the trainer, the write-behind writer or a migration) adds the
+# difference of its row to the counters, so a dashboard reads one row per learner instead of
+# scanning the patterns. Reviews per day are counted the same way.
+#   python progress_stats.py rebuild [--db PATH] [--table general_words]
+# recounts everything from the progress rows and prints the counters that were off.
+
+import argparse
+from datetime import datetime, timedelta
+import paths_info
+import db_pool
+import patterns
+import progress
+import scoring
+
+# Counters of a (table, user)
+STATS_COLUMNS = ("words", "words_new", "words_mastered", "letters", "letters_mastered", "letters_learning")
+
+
+def _row_values(row):
+    """
+    Returns the SQL expressions of what one progress row adds to the counters.
+
+    Parameters:
+    row (str): The row alias, e.g. NEW, OLD or progress.
+
+    Returns:
+    list: One expression per counter of STATS_COLUMNS.
+    """
+    return [
+        "1",
+        f"({row}.reviewed_at IS NULL)",
+        # A word is mastered once every letter is: reviewed and all a
+        f"({row}.reviewed_at IS NOT NULL AND coalesce({row}.mastered_count = {row}.letter_count, 0))",
+        f"coalesce({row}.letter_count, 0)",
+        f"coalesce({row}.mastered_count, 0)",
+        f"coalesce({row}.learning_count, 0)",
+    ]
+
+
+def _add_sql(row, values):
+    """
+    Returns the upsert that adds values to the counters of the row's (table, user).
+    """
+    return f"""INSERT INTO progress_stats VALUES ({row}.table_name, {row}.user_name, {", ".join(values)})
+        ON CONFLICT (table_name, user_name) DO UPDATE SET
+        {", ".join(f"{column} = {column} + excluded.{column}" for column in STATS_COLUMNS)};"""
+
+
+def _review_sql(row):
+    """
+    Returns the upsert that counts the row's review on its day.
+    """
+    return f"""INSERT INTO progress_daily VALUES ({row}.table_name, {row}.user_name, substr({row}.reviewed_at, 1, 10), 1)
+        ON CONFLICT (table_name, user_name, day) DO UPDATE SET reviews = reviews + 1;"""
+
+
+def ensure_schema(conn):
+    """
+    Creates the counter tables and the triggers that keep them up to date. On a data base
+    without them yet, the counters are filled from the progress rows once.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    """
+    progress.ensure_schema(conn)
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'progress_stats_update'"
+                    ).fetchone():
+        return
+    conn.execute(f"""CREATE TABLE IF NOT EXISTS progress_stats (
+        table_name TEXT NOT NULL,
+        user_name TEXT NOT NULL,
+        {", ".join(f"{column} INTEGER NOT NULL" for column in STATS_COLUMNS)},
+        PRIMARY KEY (table_name, user_name)) WITHOUT ROWID""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS progress_daily (
+        table_name TEXT NOT NULL,
+        user_name TEXT NOT NULL,
+        day TEXT NOT NULL,
+        reviews INTEGER NOT NULL,
+        PRIMARY KEY (table_name, user_name, day)) WITHOUT ROWID""")
+    removed = [f"-{value}" for value in _row_values("OLD")]
+    changed = [f"{new} - {old}" for new, old in zip(_row_values("NEW"), _row_values("OLD"))]
+    conn.execute(f"""CREATE TRIGGER IF NOT EXISTS progress_stats_insert AFTER INSERT ON progress
+        BEGIN {_add_sql("NEW", _row_values("NEW"))} END""")
+    conn.execute(f"""CREATE TRIGGER IF NOT EXISTS progress_stats_delete AFTER DELETE ON progress
+        BEGIN {_add_sql("OLD", removed)} END""")
+    conn.execute(f"""CREATE TRIGGER IF NOT EXISTS progress_stats_update
+        AFTER UPDATE OF reviewed_at, {", ".join(progress.COUNT_COLUMNS)} ON progress
+        BEGIN {_add_sql("NEW", changed)} END""")
+    conn.execute(f"""CREATE TRIGGER IF NOT EXISTS progress_daily_insert AFTER INSERT ON progress
+        WHEN NEW.reviewed_at IS NOT NULL
+        BEGIN {_review_sql("NEW")} END""")
+    # A review stored again (e.g. replayed from the writer's journal) has the same date stamp
+    conn.execute(f"""CREATE TRIGGER IF NOT EXISTS progress_daily_update AFTER UPDATE OF reviewed_at ON progress
+        WHEN NEW.reviewed_at IS NOT NULL AND NEW.reviewed_at IS NOT OLD.reviewed_at
+        BEGIN {_review_sql("NEW")} END""")
+    # The history starts with the last review of every word, the only one progress has
+    conn.execute("""INSERT OR IGNORE INTO progress_daily
+        SELECT table_name, user_name, substr(reviewed_at, 1, 10), count(*) FROM progress
+        WHERE reviewed_at IS NOT NULL
+        GROUP BY table_name, user_name, substr(reviewed_at, 1, 10)""")
+    conn.commit()
+    rebuild(conn)
+
+
+def rebuild(conn, table_name=None):
+    """
+    Recounts the letters of every progress row and the counters of every (table, user).
+    The reviews per day are kept: progress only has the last review of a word.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    table_name (str): The name of the word table (default is every table).
+
+    Returns:
+    tuple: The number of rows whose letter counts were off, and a list of
+           (table_name, user_name, counter, stored value, counted value) of the counters that were off.
+    """
+    where, parameters = ("WHERE table_name = ?", (table_name,)) if table_name else ("", ())
+    rows = conn.execute(f"""SELECT table_name, user_name, word_id, pattern, {", ".join(progress.COUNT_COLUMNS)}
+        FROM progress {where}""", parameters).fetchall()
+    counted = zip(*scoring.letter_counts([patterns.encode(row[3]) or b"" for row in rows]))
+    fixed = [(*map(int, counts), *row[:3]) for row, counts in zip(rows, counted)
+             if tuple(row[4:]) != tuple(int(count) for count in counts)]
+    conn.executemany(f"""UPDATE progress SET {", ".join(f"{column} = ?" for column in progress.COUNT_COLUMNS)}
+        WHERE table_name = ? AND user_name = ? AND word_id = ?""", fixed)
+
+    stored = {tuple(row[:2]): row[2:] for row in conn.execute(f"SELECT * FROM progress_stats {where}", parameters)}
+    fresh = conn.execute(f"""SELECT table_name, user_name, {", ".join(f"sum({value})" for value in _row_values("progress"))}
+        FROM progress {where}
+        GROUP BY table_name, user_name""", parameters).fetchall()
+    wrong = []
+    for row in fresh:
+        old_values = stored.pop(tuple(row[:2]), (0,) * len(STATS_COLUMNS))
+        wrong += [(*row[:2], column, old, new)
+                  for column, old, new in zip(STATS_COLUMNS, old_values, row[2:]) if old != new]
+    for key, old_values in stored.items():  # counters of learners without progress rows left
+        wrong += [(*key, column, old, 0) for column, old in zip(STATS_COLUMNS, old_values) if old]
+    conn.execute(f"DELETE FROM progress_stats {where}", parameters)
+    conn.executemany(f"INSERT INTO progress_stats VALUES ({', '.join('?' * (len(STATS_COLUMNS) + 2))})", fresh)
+    conn.commit()
+    return len(fixed), wrong
+
+
+def summary(conn, table_name, user_name, days=14, today=None):
+    """
+    Reads the counters of a learner: one row and the last days, whatever the size of the table.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    table_name (str): The name of the word table.
+    user_name (str): The name of the user.
+    days (int): The number of days of the review history.
+    today (date): The last day of the history (default is today).
+
+    Returns:
+    dict: The word and letter counts (new, learning, mastered), the mastered share and the reviews per day.
+    """
+    row = conn.execute(f"SELECT {', '.join(STATS_COLUMNS)} FROM progress_stats WHERE table_name = ? AND user_name = ?",
+                       (table_name, user_name)).fetchone()
+    stats = dict(zip(STATS_COLUMNS, row or (0,) * len(STATS_COLUMNS)))
+    today = today or datetime.now().date()
+    first_day = today - timedelta(days=days - 1)
+    reviews = dict(conn.execute("""SELECT day, reviews FROM progress_daily
+        WHERE table_name = ? AND user_name = ? AND day BETWEEN ? AND ?""",
+        (table_name, user_name, first_day.isoformat(), today.isoformat())).fetchall())
+    return {
+        "table_name": table_name,
+        "user_name": user_name,
+        "words": {
+            "total": stats["words"],
+            "new": stats["words_new"],
+            "learning": stats["words"] - stats["words_new"] - stats["words_mastered"],
+            "mastered": stats["words_mastered"],
+        },
+        "letters": {
+            "total": stats["letters"],
+            "new": stats["letters"] - stats["letters_mastered"] - stats["letters_learning"],
+            "learning": stats["letters_learning"],
+            "mastered": stats["letters_mastered"],
+        },
+        "percent_mastered": round(100 * stats["letters_mastered"] / stats["letters"], 2) if stats["letters"] else 0.0,
+        "reviews_per_day": [{"day": day, "reviews": reviews.get(day, 0)}
+                            for day in ((first_day + timedelta(days=i)).isoformat() for i in range(days))],
+    }
+
+
+def main():
+    """
+    Command line entry point of the counters.
+    """
+    parser = argparse.ArgumentParser(description="Progress counters per table and learner")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subparsers.add_parser("rebuild", help="recount the counters and show what was off")
+    rebuild_parser.add_argument("--db", default=paths_info.data_base_path, help="path to the data base")
+    rebuild_parser.add_argument("--table", help="only this word table")
+    args = parser.parse_args()
+
+    conn = db_pool.connect(args.db)
+    ensure_schema(conn)
+    fixed, wrong = rebuild(conn, args.table)
+    conn.close()
+    for table_name, user_name, column, old, new in wrong:
+        print(f"{table_name} {user_name}: {column} was {old}, counted {new}")
+    print(f"{fixed} rows with wrong letter counts, {len(wrong)} wrong counters, all recounted")
+
+
+if __name__ == "__main__":
+    main()
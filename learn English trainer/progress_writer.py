@@ -0,0 +1,331 @@
+# Write-behind of the learners' progress: answers are queued in memory and one writer
+# thread per process stores them, many answers per transaction. Repeated answers to the
+# same word are coalesced. Every queued answer is first appended to a journal file and
+# synced to disk, so answers not yet stored survive a crash and are stored by the next start.
+# The journals are also how the other processes of the server see the answers not stored yet:
+# a journal only grows, and a flush starts a new one, so the others read only what was appended.
+# Enabled with paths_info.progress_write_behind.
+
+import glob
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+import paths_info
+import db_pool
+import metrics
+import progress
+import scheduler
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _try_lock(open_file):
+    """
+    Locks a journal file for its writer, without waiting.
+
+    Parameters:
+    open_file (file): The open journal file.
+
+    Returns:
+    bool: True if the lock was taken, False if another live writer holds it.
+    """
+    try:
+        if fcntl is not None:
+            fcntl.flock(open_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            open_file.seek(0)
+            msvcrt.locking(open_file.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def replay_journals(conn, folder):
+    """
+    Stores the answers left in the journals of writers that are gone (crashed or killed).
+    Journals still locked by a live writer are left alone.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    folder (str): The journal folder.
+
+    Returns:
+    int: The number of answers replayed.
+    """
+    replayed = 0
+    for path in sorted(glob.glob(os.path.join(folder, "progress-*.jsonl"))):
+        with open(path, "a+", encoding="utf-8") as open_file:
+            if not _try_lock(open_file):
+                continue
+            open_file.seek(0)
+            rows = {}
+            for line in open_file:
+                try:
+                    table_name, user_name, word_id, pattern, reviewed_at = json.loads(line)
+                except ValueError:
+                    continue  # a line cut by the crash
+                rows[(table_name, user_name, word_id)] = (pattern, reviewed_at)
+            progress.record_reviews(conn, [(*key, *value) for key, value in rows.items()])
+            conn.commit()
+            replayed += len(rows)
+        os.remove(path)
+    return replayed
+
+
+class JournalReader:
+    """
+    Follows the journals of every writer, i.e. of every process of the server, and keeps
+    the answers found in them. A call reads only the lines appended since the last one.
+
+    Attributes:
+    folder (str): The journal folder.
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        self._journals = {}  # path -> [bytes read, {(table, user): {word_id: (pattern, reviewed_at, due_at)}}]
+        self._lock = threading.Lock()
+
+    def _read_new_lines(self, path, journal):
+        """
+        Reads the complete lines appended to a journal since it was last read.
+        """
+        try:
+            size = os.path.getsize(path)
+            if size < journal[0]:  # not the file read before
+                journal[:] = [0, {}]
+            if size == journal[0]:
+                return
+            with open(path, "rb") as open_file:
+                open_file.seek(journal[0])
+                data = open_file.read(size - journal[0])
+        except OSError:
+            return  # removed by its writer meanwhile
+        data = data[:data.rfind(b"\n") + 1]  # a line being written is read next time
+        journal[0] += len(data)
+        for line in data.splitlines():
+            try:
+                table_name, user_name, word_id, pattern, reviewed_at = json.loads(line)
+            except ValueError:
+                continue
+            answers = journal[1].setdefault((table_name, user_name), {})
+            known = answers.get(word_id)
+            if known is None or reviewed_at >= known[1]:
+                answers[word_id] = (pattern, reviewed_at, scheduler.compute_due_at(pattern, reviewed_at))
+
+    def read(self, table_name, user_name, skip_path=None):
+        """
+        Returns the answers of a user not stored yet, from every journal.
+
+        Parameters:
+        table_name (str): The name of the word table.
+        user_name (str): The name of the user.
+        skip_path (str): A journal not to read (the caller's own, whose answers it has in memory).
+
+        Returns:
+        dict: Word ID number -> (pattern, reviewed_at, due_at), the newest answer of every word.
+        """
+        paths = set(glob.glob(os.path.join(self.folder, "progress-*.jsonl")))
+        paths.discard(skip_path)
+        answers = {}
+        with self._lock:
+            for path in set(self._journals) - paths:  # stored and removed by its writer
+                del self._journals[path]
+            for path in paths:
+                journal = self._journals.setdefault(path, [0, {}])
+                self._read_new_lines(path, journal)
+                for word_id, answer in journal[1].get((table_name, user_name), {}).items():
+                    known = answers.get(word_id)
+                    if known is None or answer[1] >= known[1]:
+                        answers[word_id] = answer
+        return answers
+
+
+class ProgressWriter:
+    """
+    Queues progress updates and stores them in batches from one writer thread.
+
+    Attributes:
+    db_path (str): The path to the database file.
+    flush_ms (int): The longest time an answer waits in memory.
+    max_batch (int): The number of waiting answers that triggers a flush at once.
+    journal_folder (str): The folder of the journal files.
+    """
+    def __init__(self, db_path=None, flush_ms=None, max_batch=None, journal_folder=None):
+        self.db_path = db_path or paths_info.data_base_path
+        self.flush_ms = flush_ms or paths_info.progress_flush_ms
+        self.max_batch = max_batch or paths_info.progress_flush_max
+        self.journal_folder = journal_folder or paths_info.progress_journal_path
+        self._pending = {}  # (table, user, word) -> (pattern, reviewed_at, due_at), newest answer only
+        self._flushing = {}  # the batch being stored
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+        self._journal = None
+        self._journals = JournalReader(self.journal_folder)
+        self._conn = None
+
+    def start(self):
+        """
+        Stores the answers left by writers that are gone, opens this writer's journal and starts the thread.
+        """
+        os.makedirs(self.journal_folder, exist_ok=True)
+        self._conn = db_pool.connect(self.db_path)
+        progress.ensure_schema(self._conn)
+        replayed = replay_journals(self._conn, self.journal_folder)
+        if replayed:
+            print(f"{replayed} answers replayed from the progress journals")
+        self._journal = self._open_journal()
+        self._thread = threading.Thread(target=self._run, name="progress-writer", daemon=True)
+        self._thread.start()
+
+    def _open_journal(self):
+        """
+        Opens a new journal of this writer, locked so that no other process replays it.
+        """
+        path = os.path.join(self.journal_folder, f"progress-{uuid.uuid4().hex}.jsonl")
+        journal = open(path, "a+", encoding="utf-8")
+        _try_lock(journal)
+        return journal
+
+    def submit(self, table_name, user_name, word_id, pattern, reviewed_at=None):
+        """
+        Queues an answer. It is in the journal when this returns and in the data base after the next flush.
+
+        Parameters:
+        table_name (str): The name of the word table.
+        user_name (str): The name of the user.
+        word_id (int): The ID number of the word.
+        pattern (str): The new a/b/c pattern.
+        reviewed_at (str): The review date stamp (default is the current time).
+        """
+        if reviewed_at is None:
+            reviewed_at = datetime.now().strftime(scheduler.DATE_FORMAT)
+        due_at = scheduler.compute_due_at(pattern, reviewed_at)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("The progress writer is closed")
+            journal = self._journal
+            journal.write(json.dumps([table_name, user_name, word_id, pattern, reviewed_at]) + "\n")
+            journal.flush()  # in the OS buffers: survives a crash of the process, seen by the others
+            self._pending[(table_name, user_name, word_id)] = (pattern, reviewed_at, due_at)
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify()
+        # On disk: survives a crash of the machine. Outside the lock, other answers are not held up
+        try:
+            os.fsync(journal.fileno())
+        except ValueError:
+            pass  # closed by a flush meanwhile, which synced the answer in the new journal
+
+    def pending(self, table_name, user_name, word_id):
+        """
+        Returns an answer not stored yet, so a learner always reads their own latest answer,
+        whichever process of the server took it.
+
+        Parameters:
+        table_name (str): The name of the word table.
+        user_name (str): The name of the user.
+        word_id (int): The ID number of the word.
+
+        Returns:
+        tuple or None: The pattern, review and due date stamps, or None if nothing is waiting.
+        """
+        return self.pending_for_user(table_name, user_name).get(word_id)
+
+    def pending_for_user(self, table_name, user_name):
+        """
+        Returns every answer of a user not stored yet: the ones waiting in this writer,
+        and the ones in the journals of the writers of the other processes.
+
+        Parameters:
+        table_name (str): The name of the word table.
+        user_name (str): The name of the user.
+
+        Returns:
+        dict: Word ID number -> (pattern, reviewed_at, due_at).
+        """
+        waiting = self._journals.read(table_name, user_name, self._journal.name)
+        with self._cond:
+            for key, value in (*self._flushing.items(), *self._pending.items()):
+                if key[0] == table_name and key[1] == user_name:
+                    known = waiting.get(key[2])
+                    if known is None or value[1] >= known[1]:
+                        waiting[key[2]] = value
+        return waiting
+
+    def flush(self):
+        """
+        Stores the waiting answers now, in the calling thread.
+
+        Returns:
+        int: The number of answers stored.
+        """
+        with self._cond:
+            if not self._pending or self._flushing:
+                return 0  # nothing to do, or the writer thread is storing a batch
+            self._flushing, self._pending = self._pending, {}
+            batch = self._flushing
+        stored = True
+        try:
+            progress.record_reviews(self._conn, [(*key, value[0], value[1]) for key, value in batch.items()])
+            self._conn.commit()
+        except sqlite3.Error as e:
+            self._conn.rollback()
+            stored = False
+            metrics.errors.inc(where="progress_writer")
+            print(f"Progress flush of {len(batch)} answers failed, retrying: {e}")
+        with self._cond:
+            if stored:
+                # A new journal with only the answers that arrived during the flush. The old one
+                # goes once the new one is on disk (after a crash between the two, replaying
+                # both is harmless: older reviews are ignored)
+                old_journal, self._journal = self._journal, self._open_journal()
+                for key, value in self._pending.items():
+                    self._journal.write(json.dumps([*key, value[0], value[1]]) + "\n")
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+                old_journal.close()
+                os.remove(old_journal.name)
+            else:
+                for key, value in batch.items():
+                    self._pending.setdefault(key, value)  # a newer answer wins
+            self._flushing = {}
+        return len(batch) if stored else 0
+
+    def close(self):
+        """
+        Stops the writer thread and stores every waiting answer (called on shutdown).
+        """
+        with self._cond:
+            if self._closed or self._thread is None:
+                self._closed = True
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self.flush()
+        if not self._pending:
+            path = self._journal.name
+            self._journal.close()
+            os.remove(path)
+        else:
+            self._journal.close()  # left for the next start to replay
+        self._conn.close()
+
+    def _run(self):
+        """
+        Writer loop: flushes every flush_ms, or at once when max_batch answers are waiting.
+        """
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed or len(self._pending) >= self.max_batch,
+                                    timeout=self.flush_ms / 1000)
+                if self._closed:
+                    return
+            self.flush()
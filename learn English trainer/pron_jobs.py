@@ -0,0 +1,278 @@
+# Pronunciation checks: the recognizer backends and a job queue, so a web worker
+# is not held while the recognizer answers. A check is submitted, gets a job ID at once,
+# and its result is polled by the browser. The status and result of every job are kept in
+# the pron_jobs table, so any worker process can answer a poll, not only the one running the job.
+
+import json
+import queue
+import threading
+import time
+import uuid
+import paths_info
+import db_pool
+import audio_decode
+import metrics
+
+
+class UnrecognizedSpeech(Exception):
+    """
+    Raised when the recognizer cannot make out any words.
+    """
+
+
+class QueueFull(Exception):
+    """
+    Raised when too many checks are waiting already.
+    """
+
+
+class GoogleRecognizer:
+    """
+    Speech recognition through speech_recognition's Google Web Speech API.
+    """
+    name = "google"
+
+    def recognize(self, pcm, target_word=None):
+        """
+        Converts decoded speech to text.
+
+        Parameters:
+        pcm (bytes): The raw mono PCM audio from audio_decode.
+        target_word (str): The expected word (not used).
+
+        Returns:
+        str: The recognized text.
+        """
+        import speech_recognition as sr  # imported only when the real service is used
+        audio = sr.AudioData(pcm, audio_decode.SAMPLE_RATE, audio_decode.SAMPLE_WIDTH)
+        try:
+            return sr.Recognizer().recognize_google(audio)
+        except sr.UnknownValueError:
+            raise UnrecognizedSpeech("Could not understand audio")
+
+
+class StubRecognizer:
+    """
+    Local stand-in for the recognizer: "hears" the expected word after a fixed latency.
+
+    Attributes:
+    latency (float): The simulated duration of a call in seconds.
+    """
+    name = "stub"
+
+    def __init__(self, latency=0.5):
+        self.latency = latency
+
+    def recognize(self, pcm, target_word=None):
+        """
+        Returns the expected word, or fails for empty audio.
+
+        Parameters:
+        pcm (bytes): The raw mono PCM audio.
+        target_word (str): The expected word.
+
+        Returns:
+        str: The "recognized" text.
+        """
+        time.sleep(self.latency)
+        if not pcm:
+            raise UnrecognizedSpeech("Could not understand audio")
+        return target_word or ""
+
+
+def make_recognizer(backend=None):
+    """
+    Creates the recognizer chosen in paths_info.
+
+    Parameters:
+    backend (str): "google" or "stub" (default is paths_info.recognizer_backend).
+
+    Returns:
+    object: A recognizer with a recognize(pcm, target_word) method.
+    """
+    backend = backend or paths_info.recognizer_backend
+    if backend == "stub":
+        return StubRecognizer()
+    return GoogleRecognizer()
+
+
+def check_audio(data, target_word, recognizer, decoder=None):
+    """
+    Decodes a recording, recognizes it and compares it with the expected word.
+
+    Parameters:
+    data (bytes): The recorded audio from the browser.
+    target_word (str): The expected word (lower case).
+    recognizer (object): A recognizer with a recognize(pcm, target_word) method.
+    decoder (callable): Turns the recording into PCM (default is audio_decode.decode).
+
+    Returns:
+    dict: {"success", "match", "spoken"} or {"success": False, "error"}.
+    """
+    decoder = decoder or audio_decode.decode
+    stage = "decode"
+    begin = time.perf_counter()
+    try:
+        pcm = decoder(data)
+        decoded = time.perf_counter()
+        metrics.check_seconds.observe(decoded - begin, stage="decode")
+        stage = "recognize"
+        spoken_text = recognizer.recognize(pcm, target_word).lower().strip()
+        metrics.check_seconds.observe(time.perf_counter() - decoded, stage="recognize")
+    except Exception as e:  # UnrecognizedSpeech, AudioDecodeError or a recognizer failure
+        metrics.errors.inc(where=f"check_{stage}")
+        return {"success": False, "error": str(e)}
+    return {"success": True, "match": spoken_text == target_word, "spoken": spoken_text}
+
+
+def ensure_schema(conn):
+    """
+    Creates the table of the jobs' status and results if it does not exist.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    """
+    conn.execute("""CREATE TABLE IF NOT EXISTS pron_jobs (
+        job_id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        result TEXT,
+        created_at REAL NOT NULL,
+        finished_at REAL) WITHOUT ROWID""")
+    conn.commit()
+
+
+def load_job(conn, job_id):
+    """
+    Reads the status of a job, whichever worker process runs it.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    job_id (str): The job ID.
+
+    Returns:
+    dict or None: The job ID, status and result (None until done), or None if the job is unknown or expired.
+    """
+    row = conn.execute("SELECT status, result FROM pron_jobs WHERE job_id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    return {"job_id": job_id, "status": row[0], "result": json.loads(row[1]) if row[1] else None}
+
+
+class Job:
+    """
+    One pronunciation check, while it waits in the queue of the process that received it.
+
+    Attributes:
+    job_id (str): The ID returned to the browser.
+    status (str): "queued", "running" or "done".
+    """
+    def __init__(self, data, target_word):
+        self.job_id = uuid.uuid4().hex
+        self.data = data
+        self.target_word = target_word
+        self.status = "queued"
+        self.queued_at = time.monotonic()
+
+
+class JobQueue:
+    """
+    A bounded queue of pronunciation checks served by a pool of worker threads.
+
+    Attributes:
+    recognizer (object): A recognizer with a recognize(pcm, target_word) method.
+    workers (int): The number of checks running at once.
+    max_depth (int): The number of checks allowed to wait.
+    result_ttl (float): Seconds a finished job is kept for polling.
+    db_path (str): The data base of the pron_jobs table.
+    """
+    def __init__(self, recognizer=None, workers=None, max_depth=None, result_ttl=None, decoder=None, db_path=None):
+        self.recognizer = recognizer if recognizer is not None else make_recognizer()
+        self.workers = workers or paths_info.pron_check_workers
+        self.max_depth = max_depth or paths_info.pron_check_queue_depth
+        self.result_ttl = result_ttl or paths_info.pron_check_result_ttl
+        self.decoder = decoder
+        self.db_path = db_path or paths_info.data_base_path
+        self._queue = queue.Queue(maxsize=self.max_depth)
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        """
+        Starts the worker threads (once).
+        """
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"pron-check-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def depth(self):
+        """
+        Returns the number of checks waiting.
+
+        Returns:
+        int: The queue depth.
+        """
+        return self._queue.qsize()
+
+    def submit(self, conn, data, target_word):
+        """
+        Queues a check; refuses it if the queue is full (backpressure).
+
+        Parameters:
+        conn (sqlite3.Connection): A connection object (the request's).
+        data (bytes): The recorded audio from the browser.
+        target_word (str): The expected word (lower case).
+
+        Returns:
+        Job: The queued job.
+        """
+        if self._queue.full():
+            raise QueueFull("Too many pronunciation checks are waiting, try again")
+        self.start()
+        job = Job(data, target_word)
+        now = time.time()
+        # Jobs older than the TTL are dropped, also those of a worker process that died meanwhile
+        conn.execute("DELETE FROM pron_jobs WHERE coalesce(finished_at, created_at) < ?", (now - self.result_ttl,))
+        conn.execute("INSERT INTO pron_jobs (job_id, status, created_at) VALUES (?, ?, ?)",
+                     (job.job_id, job.status, now))
+        conn.commit()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            conn.execute("DELETE FROM pron_jobs WHERE job_id = ?", (job.job_id,))
+            conn.commit()
+            raise QueueFull("Too many pronunciation checks are waiting, try again")
+        return job
+
+    def _work(self):
+        """
+        Worker loop: runs the queued checks one after another, storing their status.
+        """
+        conn = db_pool.connect(self.db_path)
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(conn, job)
+            except Exception:  # e.g. the data base stayed locked: the job expires unanswered
+                conn.rollback()
+                metrics.errors.inc(where="check_store")
+            finally:
+                job.data = None  # the recording is not needed any more
+                self._queue.task_done()
+
+    def _run(self, conn, job):
+        """
+        Runs one check and stores its status and result.
+        """
+        job.status = "running"
+        metrics.check_seconds.observe(time.monotonic() - job.queued_at, stage="queue")
+        conn.execute("UPDATE pron_jobs SET status = ? WHERE job_id = ?", (job.status, job.job_id))
+        conn.commit()
+        result = check_audio(job.data, job.target_word, self.recognizer, self.decoder)
+        job.status = "done"
+        conn.execute("UPDATE pron_jobs SET status = ?, result = ?, finished_at = ? WHERE job_id = ?",
+                     (job.status, json.dumps(result), time.time(), job.job_id))
+        conn.commit()
@@ -0,0 +1,238 @@
+# On-disk cache of translation and pronunciation results, keyed by
+# (provider, kind, text, language, voice options), with LRU eviction by total size.
+#
+#   python provider_cache.py warm [--db PATH]   fills the cache from the word tables of a data base
+#   python provider_cache.py stats              prints the size of the cache
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import paths_info
+import db_pool
+import media_store
+
+# Cache hits whose last use is written in one transaction
+TOUCH_BATCH = 500
+
+
+class ProviderCache:
+    """
+    A thread-safe, size-bounded cache of provider results in its own SQLite file.
+
+    Attributes:
+    path (str): The path to the cache file.
+    max_bytes (int): The size limit of the cached values.
+    hits (int): The number of lookups answered from the cache.
+    misses (int): The number of lookups not in the cache.
+    """
+    def __init__(self, path=None, max_bytes=None):
+        self.path = path or paths_info.provider_cache_path
+        self.max_bytes = max_bytes if max_bytes is not None else paths_info.provider_cache_max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Key -> time of the hits not written yet: a hit takes no write lock
+        self._touched = {}
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS provider_cache (
+            key TEXT PRIMARY KEY,
+            provider TEXT,
+            kind TEXT,
+            value BLOB,
+            size INTEGER,
+            last_used REAL)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_provider_cache_lru ON provider_cache (last_used)")
+        self._total = self._conn.execute("SELECT coalesce(sum(size), 0) FROM provider_cache").fetchone()[0]
+
+    @staticmethod
+    def make_key(provider, kind, text, lang, options=None):
+        """
+        Builds the cache key of a provider call.
+
+        Parameters:
+        provider (str): The provider name.
+        kind (str): "translate" or "tts".
+        text (str): The input text.
+        lang (str): The language code.
+        options (dict): The voice or translation options.
+
+        Returns:
+        str: The hex SHA-256 of the call.
+        """
+        raw = json.dumps([provider, kind, text, lang, options or {}], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, provider, kind, text, lang, options=None):
+        """
+        Looks up a provider result.
+
+        Parameters:
+        provider (str): The provider name.
+        kind (str): "translate" or "tts".
+        text (str): The input text.
+        lang (str): The language code.
+        options (dict): The voice or translation options.
+
+        Returns:
+        bytes or None: The cached value, or None on a miss.
+        """
+        key = self.make_key(provider, kind, text, lang, options)
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM provider_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= TOUCH_BATCH:
+                self._write_touched()
+                self._conn.commit()
+            return row[0]
+
+    def put(self, provider, kind, text, lang, value, options=None):
+        """
+        Stores a provider result and evicts the least recently used results above the size limit.
+
+        Parameters:
+        provider (str): The provider name.
+        kind (str): "translate" or "tts".
+        text (str): The input text.
+        lang (str): The language code.
+        value (bytes): The result to store.
+        options (dict): The voice or translation options.
+        """
+        if value is None:
+            return
+        key = self.make_key(provider, kind, text, lang, options)
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM provider_cache WHERE key = ?", (key,)).fetchone()
+            self._conn.execute("INSERT OR REPLACE INTO provider_cache VALUES (?, ?, ?, ?, ?, ?)",
+                               (key, provider, kind, value, len(value), time.time()))
+            self._total += len(value) - (old[0] if old else 0)
+            self._touched.pop(key, None)
+            # The eviction order needs the last uses of the hits
+            self._write_touched()
+            self._evict()
+            self._conn.commit()
+
+    def _write_touched(self):
+        """
+        Writes the last use of the hits kept in memory (the caller commits).
+        """
+        if self._touched:
+            self._conn.executemany("UPDATE provider_cache SET last_used = ? WHERE key = ?",
+                                   [(used, key) for key, used in self._touched.items()])
+            self._touched.clear()
+
+    def _evict(self):
+        """
+        Deletes the least recently used results until the cache fits its size limit.
+        """
+        while self._total > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM provider_cache ORDER BY last_used LIMIT 100").fetchall()
+            if not rows:
+                self._total = 0
+                return
+            evicted = []
+            for key, size in rows:
+                evicted.append((key,))
+                self._total -= size
+                if self._total <= self.max_bytes:
+                    break
+            self._conn.executemany("DELETE FROM provider_cache WHERE key = ?", evicted)
+
+    def stats(self):
+        """
+        Reports the counters of the cache.
+
+        Returns:
+        dict: Hits, misses, hit ratio, number of entries and total bytes.
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT count(*) FROM provider_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": self._total,
+        }
+
+    def close(self):
+        """
+        Writes the last uses kept in memory and closes the cache file.
+        """
+        with self._lock:
+            self._write_touched()
+            self._conn.commit()
+            self._conn.close()
+
+
+def warm_from_db(cache, conn, translator_name, tts_name, tts_options=None):
+    """
+    Fills the cache from the translations and sounds already stored in the word tables.
+
+    Parameters:
+    cache (ProviderCache): The cache to fill.
+    conn (sqlite3.Connection): A connection to the data base.
+    translator_name (str): The provider name the translations are stored under.
+    tts_name (str): The provider name the sounds are stored under.
+    tts_options (dict): The voice options the sounds are stored under.
+
+    Returns:
+    int: The number of results added.
+    """
+    added = 0
+    for table_name in media_store.word_tables(conn):
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")}
+        has_hashes = "en_sounds_hash" in columns
+        hash_columns = "en_sounds_hash, ru_sounds_hash" if has_hashes else "NULL, NULL"
+        rows = conn.execute(f"SELECT words, native_lang, en_sounds, ru_sounds, {hash_columns} FROM {table_name}")
+        for word, native_lang, en_sound, ru_sound, en_hash, ru_hash in rows:
+            if word and native_lang:
+                cache.put(translator_name, "translate", word, "ru", native_lang.encode("utf-8"))
+                added += 1
+            # Sounds are BLOBs, or files in the media store after the migration
+            en_sound = en_sound or (media_store.get(en_hash) if en_hash else None)
+            ru_sound = ru_sound or (media_store.get(ru_hash) if ru_hash else None)
+            if word and en_sound:
+                cache.put(tts_name, "tts", word, "en", en_sound, tts_options)
+                added += 1
+            if native_lang and ru_sound:
+                cache.put(tts_name, "tts", native_lang, "ru", ru_sound, tts_options)
+                added += 1
+    return added
+
+
+def main():
+    """
+    Command line entry point of the provider cache tools.
+    """
+    import ingest
+
+    parser = argparse.ArgumentParser(description="Translation and pronunciation cache tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    warm_parser = subparsers.add_parser("warm", help="fill the cache from an existing data base")
+    warm_parser.add_argument("--db", default=paths_info.data_base_path, help="path to the data base")
+    subparsers.add_parser("stats", help="print the size of the cache")
+    args = parser.parse_args()
+
+    cache = ProviderCache()
+    if args.command == "warm":
+        conn = db_pool.connect(args.db)
+        tts = ingest.GTTSProvider
+        added = warm_from_db(cache, conn, ingest.GoogleTranslateProvider.name, tts.name, tts.options)
+        conn.close()
+        print(f"{added} results added")
+    print(cache.stats())
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# Spaced-repetition scheduler: the due date of a (table, user, word) is kept in the
+# progress table (see progress.py) and indexed, so the next due word is one index seek
+
+from datetime import datetime, timedelta
+import paths_info
+import patterns
+
+# Format of the date stamps written by the trainer
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Letter weights of a pattern: a - mastered, b - almost, c - not yet
+LETTER_WEIGHTS = {"a": 1.0, "b": 0.5, "c": 0.0}
+
+# ID ranges up to this many words are read in word order and sorted (idx_progress_word);
+# wider ones are read in due order until a word of the range turns up (idx_progress_due)
+NARROW_RANGE = 2000
+
+
+def mastery(pattern):
+    """
+    Calculates the share of mastered letters of a pattern.
+
+    Parameters:
+    pattern (str or bytes): The a/b/c pattern of a word, as text or packed.
+
+    Returns:
+    float: The mastery from 0.0 (nothing) to 1.0 (every letter).
+    """
+    mastered, almost, letters = patterns.counts(pattern)
+    if not letters:
+        return 0.0
+    return (mastered * LETTER_WEIGHTS["a"] + almost * LETTER_WEIGHTS["b"]
+            + (letters - mastered - almost) * LETTER_WEIGHTS["c"]) / letters
+
+
+def compute_due_at(pattern, reviewed_at):
+    """
+    Calculates when a word is due again from its pattern and the last review time.
+    The interval grows exponentially with the mastery of the word.
+
+    Parameters:
+    pattern (str or bytes): The a/b/c pattern of a word, as text or packed.
+    reviewed_at (str): The last review date stamp (None if never reviewed).
+
+    Returns:
+    str: The due date stamp.
+    """
+    try:
+        reviewed = datetime.strptime(reviewed_at, DATE_FORMAT)
+    except (TypeError, ValueError):
+        reviewed = datetime(1970, 1, 1)  # never reviewed - due at once
+    min_interval = timedelta(minutes=paths_info.srs_min_interval_minutes)
+    max_interval = timedelta(days=paths_info.srs_max_interval_days)
+    ratio = max_interval / min_interval
+    interval = min_interval * ratio ** mastery(pattern)
+    return (reviewed + interval).strftime(DATE_FORMAT)
+
+
+def next_due_word(conn, table_name, user_name, lower_id, upper_id, exclude_id=None, now=None, exclude_ids=()):
+    """
+    Finds the most overdue word of a user in an ID range with one index seek.
+    A narrow range is read whole from the index on word IDs: in due order it could take
+    most of the user's overdue words to reach the first one of the range.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    table_name (str): The name of the word table.
+    user_name (str): The name of the user.
+    lower_id (int): The lowest ID number of the session.
+    upper_id (int): The highest ID number of the session.
+    exclude_id (int): The ID number to skip, usually the word just answered.
+    now (str): The current date stamp (default is the current time).
+    exclude_ids (set): More ID numbers to skip, e.g. answers not stored yet.
+
+    Returns:
+    int or None: The ID number of the due word, or None if nothing is due.
+    """
+    if now is None:
+        now = datetime.now().strftime(DATE_FORMAT)
+    skipped = ", ".join("?" * len(exclude_ids))
+    index_name = "idx_progress_word" if upper_id - lower_id <= NARROW_RANGE else "idx_progress_due"
+    row = conn.execute(f"""SELECT word_id FROM progress INDEXED BY {index_name}
+        WHERE table_name = ? AND user_name = ? AND due_at <= ?
+          AND word_id BETWEEN ? AND ? AND word_id != ?
+          {f"AND word_id NOT IN ({skipped})" if exclude_ids else ""}
+        ORDER BY due_at, word_id
+        LIMIT 1""",
+        (table_name, user_name, now, lower_id, upper_id,
+         exclude_id if exclude_id is not None else -1, *exclude_ids)).fetchone()
+    return row[0] if row else None
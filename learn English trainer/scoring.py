@@ -0,0 +1,207 @@
+# Whole-table scoring of the packed patterns (see patterns.py): the patterns of a table are
+# read as one byte array and counted with per-byte lookup tables, e.g. the share of mastered
+# letters of every learner, or the due dates of every word after the SRS intervals change.
+# NumPy does the counting when it is installed; without it the same numbers come from a loop.
+#   python scoring.py stats [--db PATH] [--table general_words]
+#   python scoring.py reschedule [--db PATH] [--table general_words] [--user user_1]
+
+import argparse
+import time
+import paths_info
+import db_pool
+import patterns
+import progress
+import scheduler
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+if numpy is not None:
+    # Byte -> number of a letters, b letters and all letters
+    BYTE_COUNTS = numpy.array(patterns.BYTE_COUNTS, dtype=numpy.int32)
+
+
+def load(conn, table_name, user_name=None):
+    """
+    Reads the progress rows of a table (or of one user of it).
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    table_name (str): The name of the word table.
+    user_name (str): The name of the user (default is every user).
+
+    Returns:
+    list: (user_name, word_id, pattern, reviewed_at) tuples, patterns packed.
+    """
+    progress.ensure_schema(conn)
+    sql = "SELECT user_name, word_id, pattern, reviewed_at FROM progress WHERE table_name = ?"
+    parameters = (table_name,)
+    if user_name is not None:
+        sql += " AND user_name = ?"
+        parameters += (user_name,)
+    # Text patterns of a data base not packed yet are packed on the way
+    return [(user, word_id, patterns.encode(pattern) or b"", reviewed_at)
+            for user, word_id, pattern, reviewed_at in conn.execute(sql, parameters)]
+
+
+def letter_counts(packed_patterns):
+    """
+    Counts the letters of many packed patterns at once.
+
+    Parameters:
+    packed_patterns (list): The packed patterns.
+
+    Returns:
+    tuple: Three sequences with the a letters, b letters and all letters of every pattern.
+    """
+    if numpy is None:
+        rows = [patterns.counts(packed) for packed in packed_patterns]
+        return [row[0] for row in rows], [row[1] for row in rows], [row[2] for row in rows]
+    if not packed_patterns:
+        empty = numpy.zeros(0, dtype=numpy.int64)
+        return empty, empty, empty
+    data = numpy.frombuffer(b"".join(packed_patterns), dtype=numpy.uint8)
+    lengths = numpy.fromiter((len(packed) for packed in packed_patterns), dtype=numpy.int64,
+                             count=len(packed_patterns))
+    per_byte = BYTE_COUNTS[data]
+    # Sums per pattern: cumulative sums read at the pattern boundaries (empty patterns give 0)
+    totals = numpy.zeros((len(per_byte) + 1, 3), dtype=numpy.int64)
+    numpy.cumsum(per_byte, axis=0, out=totals[1:])
+    ends = numpy.cumsum(lengths)
+    sums = totals[ends] - totals[ends - lengths]
+    return sums[:, 0], sums[:, 1], sums[:, 2]
+
+
+def total_counts(packed_patterns):
+    """
+    Counts the letters of many packed patterns together.
+
+    Parameters:
+    packed_patterns (list): The packed patterns.
+
+    Returns:
+    tuple: The number of a letters, b letters and all letters.
+    """
+    if numpy is None:
+        rows = [patterns.counts(packed) for packed in packed_patterns]
+        return tuple(sum(column) for column in zip(*rows)) if rows else (0, 0, 0)
+    # No pattern boundaries needed: every byte is counted on its own
+    data = numpy.frombuffer(b"".join(packed_patterns), dtype=numpy.uint8)
+    return tuple(int(total) for total in BYTE_COUNTS[data].sum(axis=0, dtype=numpy.int64))
+
+
+def mastery_by_user(conn, table_name):
+    """
+    Sums up the letters of every learner of a table.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    table_name (str): The name of the word table.
+
+    Returns:
+    dict: User name -> dict with words, letters, mastered (a), almost (b) and percent_mastered.
+    """
+    progress.ensure_schema(conn)
+    users = [row[0] for row in conn.execute(
+        "SELECT DISTINCT user_name FROM progress WHERE table_name = ? ORDER BY user_name", (table_name,))]
+    result = {}
+    for user in users:
+        # Text patterns of a data base not packed yet are packed on the way
+        packed_patterns = [pattern if isinstance(pattern, bytes) else patterns.encode(pattern or "")
+                           for (pattern,) in conn.execute(
+                               "SELECT pattern FROM progress WHERE table_name = ? AND user_name = ?",
+                               (table_name, user))]
+        mastered, almost, letters = total_counts(packed_patterns)
+        result[user] = {
+            "words": len(packed_patterns),
+            "letters": letters,
+            "mastered": mastered,
+            "almost": almost,
+            "percent_mastered": round(100 * mastered / letters, 2) if letters else 0.0,
+        }
+    return result
+
+
+def due_dates(rows):
+    """
+    Calculates the due dates of many progress rows at once, like scheduler.compute_due_at.
+
+    Parameters:
+    rows (list): (user_name, word_id, pattern, reviewed_at) tuples, patterns packed.
+
+    Returns:
+    list: The due date stamps, in the order of the rows.
+    """
+    if numpy is None or not rows:
+        return [scheduler.compute_due_at(row[2], row[3]) for row in rows]
+    mastered, almost, letters = letter_counts([row[2] for row in rows])
+    weights = scheduler.LETTER_WEIGHTS
+    score = (mastered * weights["a"] + almost * weights["b"] + (letters - mastered - almost) * weights["c"])
+    score = numpy.divide(score, letters, out=numpy.zeros(len(rows)), where=letters > 0)
+    min_seconds = paths_info.srs_min_interval_minutes * 60
+    ratio = paths_info.srs_max_interval_days * 86400 / min_seconds
+    interval = (min_seconds * ratio ** score * 1e6).astype("timedelta64[us]")
+    # A word never reviewed is due at once, like in compute_due_at
+    try:
+        reviewed = numpy.array([(row[3] or "1970-01-01 00:00:00").replace(" ", "T") for row in rows],
+                               dtype="datetime64[s]")
+    except ValueError:  # a date stamp in another format
+        return [scheduler.compute_due_at(row[2], row[3]) for row in rows]
+    due = (reviewed + interval).astype("datetime64[s]")
+    return [stamp.replace("T", " ") for stamp in numpy.datetime_as_string(due).tolist()]
+
+
+def reschedule(conn, table_name, user_name=None, batch_size=10000):
+    """
+    Calculates the due dates of a table again, e.g. after the SRS intervals in paths_info changed.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    table_name (str): The name of the word table.
+    user_name (str): The name of the user (default is every user).
+    batch_size (int): The number of rows per transaction.
+
+    Returns:
+    int: The number of rows updated.
+    """
+    rows = load(conn, table_name, user_name)
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        conn.executemany("""UPDATE progress SET due_at = ?
+            WHERE table_name = ? AND user_name = ? AND word_id = ?""",
+            [(due_at, table_name, row[0], row[1]) for row, due_at in zip(batch, due_dates(batch))])
+        conn.commit()
+    return len(rows)
+
+
+def main():
+    """
+    Command line entry point of the scorer.
+    """
+    parser = argparse.ArgumentParser(description="Whole-table scoring of the learners' patterns")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    stats_parser = subparsers.add_parser("stats", help="share of mastered letters per learner")
+    reschedule_parser = subparsers.add_parser("reschedule", help="calculate the due dates again")
+    reschedule_parser.add_argument("--user", help="only this learner")
+    for subparser in (stats_parser, reschedule_parser):
+        subparser.add_argument("--db", default=paths_info.data_base_path, help="path to the data base")
+        subparser.add_argument("--table", default="general_words", help="the word table")
+    args = parser.parse_args()
+
+    conn = db_pool.connect(args.db)
+    begin = time.perf_counter()
+    if args.command == "stats":
+        for user, stats in mastery_by_user(conn, args.table).items():
+            print(f"{user}: {stats['percent_mastered']}% of {stats['letters']} letters mastered "
+                  f"({stats['words']} words, {stats['almost']} letters almost)")
+    else:
+        print(f"{reschedule(conn, args.table, args.user)} due dates updated")
+    conn.close()
+    engine = "NumPy" if numpy is not None else "pure Python, NumPy is not installed"
+    print(f"{(time.perf_counter() - begin) * 1000:.1f} ms ({engine})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+# Search over the words and translations of a word table: an FTS5 trigram index per table
+# (<table>_fts), kept in sync by triggers whoever writes the table, so any part of a word
+# or a translation is found, also with one typo. Used by the Tk admin and by the trainer.
+# The index is built by migrate.py (or by the command below), never by a search.
+#   python search.py index [--db PATH] [--table general_words]
+#   python search.py query "recieve" [--db PATH] [--table general_words]
+
+import argparse
+import difflib
+import time
+import paths_info
+import db_pool
+import media_store
+
+# The number of matches re-ranked by similarity
+CANDIDATES = 100
+
+# Letters tried in place of a wrong or a missing letter, per alphabet of the query
+LATIN_LETTERS = "abcdefghijklmnopqrstuvwxyz"
+CYRILLIC_LETTERS = "абвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+
+# Longer queries are looked up with a typo in the trigram index only (see typo_query)
+TYPO_VARIANTS_MAX_LENGTH = 20
+
+# Tables whose index exists, per process
+_ready_tables = set()
+
+
+def ensure_index(conn, table_name):
+    """
+    Creates the search index of a word table, the triggers that keep it in sync and the
+    case-insensitive indexes on the words and the translations, and fills the search index
+    if it is new.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    table_name (str): The name of the word table.
+    """
+    if table_name in _ready_tables:
+        return
+    index_name = f"{table_name}_fts"
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (index_name,)).fetchone():
+        # External content: the index keeps only the trigrams, the text stays in the word table
+        conn.execute(f"""CREATE VIRTUAL TABLE {index_name} USING fts5(
+            words, native_lang, content='{table_name}', content_rowid='id_nr', tokenize='trigram')""")
+        conn.execute(f"INSERT INTO {index_name} ({index_name}) VALUES ('rebuild')")
+    add = f"INSERT INTO {index_name} (rowid, words, native_lang) VALUES (NEW.id_nr, NEW.words, NEW.native_lang);"
+    remove = (f"INSERT INTO {index_name} ({index_name}, rowid, words, native_lang) "
+              f"VALUES ('delete', OLD.id_nr, OLD.words, OLD.native_lang);")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS {index_name}_insert AFTER INSERT ON {table_name} BEGIN {add} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS {index_name}_delete AFTER DELETE ON {table_name} BEGIN {remove} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS {index_name}_update AFTER UPDATE OF words, native_lang "
+                 f"ON {table_name} BEGIN {remove} {add} END")
+    # Prefixes and whole texts one typo away are looked up here, "Apple" like "apple"
+    # (NOCASE folds the Latin letters; the translations are stored in lower case)
+    conn.execute(f"DROP INDEX IF EXISTS idx_{table_name}_native_lang")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_words_nocase ON {table_name} (words COLLATE NOCASE)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_native_lang_nocase "
+                 f"ON {table_name} (native_lang COLLATE NOCASE)")
+    conn.commit()
+    _ready_tables.add(table_name)
+
+
+def rebuild(conn, table_name):
+    """
+    Builds the search index of a word table again from its rows.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    table_name (str): The name of the word table.
+    """
+    ensure_index(conn, table_name)
+    conn.execute(f"INSERT INTO {table_name}_fts ({table_name}_fts) VALUES ('rebuild')")
+    conn.commit()
+
+
+def _quote(text):
+    """
+    Quotes a text as an FTS5 string, so that no character of it is taken as query syntax.
+    """
+    return '"' + text.replace('"', '""') + '"'
+
+
+def typo_query(query):
+    """
+    Builds the FTS5 query of the texts that contain the query with at most one typo:
+    the query itself, the query with a letter left out or two letters swapped, and the
+    parts before and after a letter (a wrong or an extra letter there).
+
+    Parameters:
+    query (str): The query, three letters or more.
+
+    Returns:
+    str: The FTS5 query.
+    """
+    terms = {_quote(query): None}
+    for i in range(len(query)):
+        left, right = query[:i], query[i + 1:]
+        if len(left + right) >= 3:
+            terms[_quote(left + right)] = None
+        if i < len(query) - 1:
+            terms[_quote(left + query[i + 1] + query[i] + query[i + 2:])] = None
+        if len(left) >= 3 and len(right) >= 3:
+            terms[f"({_quote(left)} AND {_quote(right)})"] = None
+    return " OR ".join(terms)
+
+
+def typo_variants(query):
+    """
+    Lists the texts one typo away from a query: a letter left out, two letters swapped,
+    a wrong letter or an extra one. Wrong and missing letters are tried from the alphabet
+    of the query, so short queries get them too, whose parts are too short for trigrams.
+
+    Parameters:
+    query (str): The query, in lower case.
+
+    Returns:
+    list: The texts, without the query itself.
+    """
+    letters = set(query)
+    if letters & set(CYRILLIC_LETTERS):
+        letters.update(CYRILLIC_LETTERS)
+    if letters & set(LATIN_LETTERS) or not letters & set(CYRILLIC_LETTERS):
+        letters.update(LATIN_LETTERS)
+    variants = set()
+    for i in range(len(query) + 1):
+        left, right = query[:i], query[i:]
+        variants.update(left + letter + right for letter in letters)  # a letter left out by the learner
+        if right:
+            variants.add(left + right[1:])  # an extra letter
+            variants.update(left + letter + right[1:] for letter in letters)  # a wrong letter
+        if len(right) > 1:
+            variants.add(left + right[1] + right[0] + right[2:])  # two letters swapped
+    variants.discard(query)
+    return sorted(variants)
+
+
+def similarity(matcher, query, text, typos=frozenset()):
+    """
+    Scores how well a word or a translation matches a query, typos included.
+
+    Parameters:
+    matcher (difflib.SequenceMatcher): A matcher whose second sequence is the query (it is analysed once).
+    query (str): The query, in lower case.
+    text (str): The word or the translation.
+    typos (set): The texts one typo away from the query (see typo_variants).
+
+    Returns:
+    float: The score, higher is better: 1.0 for the same text, more for a prefix, a part of it
+           or the whole text with one typo.
+    """
+    text = (text or "").lower()
+    matcher.set_seq1(text)
+    score = matcher.ratio()
+    if text.startswith(query):
+        score += 0.5
+    elif text in typos:
+        score += 0.4
+    elif query in text:
+        score += 0.25
+    return score
+
+
+def search(conn, table_name, query, limit=20):
+    """
+    Finds the words whose text or translation matches a query, best matches first.
+    Words starting with the query come from the indexes on words (and on translations for a
+    query shorter than three letters), in any case; a query of three letters or
+    more is also looked up with one typo in the trigram index, so "recieve" finds "receive",
+    and whole words and translations one typo away are looked up in their indexes, so
+    "frend" finds "friend". The index must exist (see ensure_index).
+    The matches are ranked by similarity in Python, which is cheaper than bm25 over the rows
+    of a frequent trigram.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    table_name (str): The name of the word table.
+    query (str): The text to find, in English or in the native language.
+    limit (int): The largest number of results.
+
+    Returns:
+    list: Dicts with id_nr, words, native_lang and score.
+    """
+    query = " ".join(query.lower().split())
+    if not query:
+        return []
+    typos = set()
+    # A range of the index on words: the best matches of a frequent query are not cut off
+    rows = conn.execute(f"""SELECT id_nr, words, native_lang FROM {table_name}
+        WHERE words >= ? COLLATE NOCASE AND words < ? COLLATE NOCASE
+        ORDER BY words COLLATE NOCASE
+        LIMIT ?""", (query, query + "\uffff", CANDIDATES if len(query) < 3 else limit)).fetchall()
+    if len(query) < 3:
+        # Shorter than a trigram: the translations that start with it too
+        rows += conn.execute(f"""SELECT id_nr, words, native_lang FROM {table_name}
+            WHERE native_lang >= ? COLLATE NOCASE AND native_lang < ? COLLATE NOCASE
+            ORDER BY native_lang COLLATE NOCASE
+            LIMIT ?""", (query, query + "\uffff", CANDIDATES)).fetchall()
+    else:
+        index_name = f"{table_name}_fts"
+        rows += conn.execute(f"""SELECT rowid, words, native_lang FROM {index_name}
+            WHERE {index_name} MATCH ?
+            LIMIT ?""", (typo_query(query), CANDIDATES)).fetchall()
+        if len(query) <= TYPO_VARIANTS_MAX_LENGTH:
+            # One index probe per variant, some hundreds of them: cheaper than reading every
+            # row that shares a trigram with a short query
+            variants = typo_variants(query)
+            typos = set(variants)
+            placeholders = ", ".join("?" * len(variants))
+            rows += conn.execute(f"""SELECT id_nr, words, native_lang FROM {table_name}
+                WHERE words COLLATE NOCASE IN ({placeholders})
+                UNION
+                SELECT id_nr, words, native_lang FROM {table_name}
+                WHERE native_lang COLLATE NOCASE IN ({placeholders})
+                LIMIT ?""", (*variants, *variants, CANDIDATES)).fetchall()
+    matcher = difflib.SequenceMatcher(None, "", query, autojunk=False)
+    results = {}
+    for id_nr, words, native_lang in rows:
+        if id_nr not in results:
+            score = max(similarity(matcher, query, words, typos), similarity(matcher, query, native_lang, typos))
+            results[id_nr] = {"id_nr": id_nr, "words": words, "native_lang": native_lang, "score": round(score, 3)}
+    return sorted(results.values(), key=lambda result: (-result["score"], result["id_nr"]))[:limit]
+
+
+def main():
+    """
+    Command line entry point of the search index.
+    """
+    parser = argparse.ArgumentParser(description="Search index over the words and translations")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    index_parser = subparsers.add_parser("index", help="build the index of every word table (or of --table)")
+    index_parser.add_argument("--table", help="only this word table")
+    query_parser = subparsers.add_parser("query", help="search a word table")
+    query_parser.add_argument("query", help="the text to find")
+    query_parser.add_argument("--table", default="general_words", help="the word table")
+    query_parser.add_argument("--limit", type=int, default=20, help="the largest number of results")
+    for subparser in (index_parser, query_parser):
+        subparser.add_argument("--db", default=paths_info.data_base_path, help="path to the data base")
+    args = parser.parse_args()
+
+    conn = db_pool.connect(args.db)
+    if args.command == "index":
+        for table_name in [args.table] if args.table else media_store.word_tables(conn):
+            begin = time.perf_counter()
+            rebuild(conn, table_name)
+            print(f"{table_name}: indexed in {time.perf_counter() - begin:.1f} s")
+    else:
+        begin = time.perf_counter()
+        results = search(conn, args.table, args.query, args.limit)
+        elapsed = (time.perf_counter() - begin) * 1000
+        for result in results:
+            print(f"{result['id_nr']:>6}  {result['words']}  -  {result['native_lang']}  ({result['score']})")
+        print(f"{len(results)} results in {elapsed:.1f} ms")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# Cold start of the trainer: lazy loading of heavy optional subsystems and
+# startup timings (import time per module, time to first request), shown on /startup.
+
+import builtins
+import importlib.util
+import os
+import sys
+import threading
+import time
+
+# When this process (or, for prefork servers, this worker) started
+started = time.perf_counter()
+
+# Import time per module in ms, of the modules imported while recording
+import_times = {}
+
+# Startup milestones in ms since start: "imports", "app_ready", "first_request"
+milestones = {}
+
+_original_import = builtins.__import__
+_depth = threading.local()
+_lock = threading.Lock()
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    """
+    builtins.__import__ that times the first import of every module done at the top level
+    of the recorded block (the time includes the modules it imports in turn).
+    """
+    depth = getattr(_depth, "value", 0)
+    if depth or level or name in sys.modules:
+        _depth.value = depth + 1
+        try:
+            return _original_import(name, globals, locals, fromlist, level)
+        finally:
+            _depth.value = depth
+    _depth.value = 1
+    begin = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _depth.value = 0
+        import_times[name] = round((time.perf_counter() - begin) * 1000, 2)
+
+
+def record_imports():
+    """
+    Starts timing the imports that follow, until imports_done() is called.
+    """
+    builtins.__import__ = _timed_import
+
+
+def imports_done():
+    """
+    Stops timing imports and records the "imports" milestone.
+    """
+    builtins.__import__ = _original_import
+    mark("imports")
+
+
+def lazy_import(name):
+    """
+    Returns a module that is only loaded when one of its attributes is first used,
+    so a subsystem that few requests need does not slow down every worker start.
+
+    Parameters:
+    name (str): The module name.
+
+    Returns:
+    module: The module (loaded already, or loading on first attribute access).
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def mark(milestone):
+    """
+    Records the time since start of a milestone (only the first time).
+
+    Parameters:
+    milestone (str): The milestone name.
+
+    Returns:
+    bool: True if the milestone was recorded now.
+    """
+    if milestone in milestones:
+        return False
+    with _lock:
+        if milestone in milestones:
+            return False
+        milestones[milestone] = round((time.perf_counter() - started) * 1000, 2)
+        return True
+
+
+def report():
+    """
+    Returns the startup timings of this process.
+
+    Returns:
+    dict: The process ID, the milestones and the import times (slowest first), in ms.
+    """
+    return {
+        "pid": os.getpid(),
+        "milestones": dict(milestones),
+        "import_times": dict(sorted(import_times.items(), key=lambda item: item[1], reverse=True)),
+    }
+
+
+def _after_fork():
+    """
+    Restarts the clock in a forked worker: its cold start begins at the fork.
+    """
+    global started
+    started = time.perf_counter()
+    milestones.pop("first_request", None)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
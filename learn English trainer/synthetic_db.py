@@ -0,0 +1,148 @@
+# Synthetic data bases for benchmarks and load tests: word tables of any size, with media
+# sizes drawn from log-normal distributions (like real recordings and pictures) and gaps in the IDs.
+#   python synthetic_db.py --db bench.db --store bench_media --words 5000 --sparsity 0.2
+
+import argparse
+import math
+import random
+from datetime import datetime, timedelta
+import paths_info
+import db_pool
+import media
+import media_store
+import progress
+import scheduler
+
+# Median size in bytes and spread (sigma of the log-normal) of each medium
+MEDIA_SIZES = {
+    "en_sounds": (6000, 0.5),  # a one-word gTTS mp3
+    "ru_sounds": (9000, 0.6),
+    "image": (40000, 0.8),
+}
+
+
+def draw_size(rng, median, sigma, limit=4 * 1024 * 1024):
+    """
+    Draws a media size from a log-normal distribution.
+
+    Parameters:
+    rng (random.Random): The random generator.
+    median (int): The median size in bytes.
+    sigma (float): The spread of the distribution.
+    limit (int): The largest size allowed.
+
+    Returns:
+    int: The size in bytes.
+    """
+    return max(1, min(limit, int(rng.lognormvariate(math.log(median), sigma))))
+
+
+def create_word_table(conn, table_name):
+    """
+    Creates a word table with the same columns as adminka's create_table.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    table_name (str): The name of the table.
+    """
+    conn.execute(f"""CREATE TABLE IF NOT EXISTS {table_name} (
+        id_nr INTEGER PRIMARY KEY AUTOINCREMENT,
+        words TEXT UNIQUE,
+        native_lang TEXT,
+        en_sounds BLOB,
+        ru_sounds BLOB,
+        image BLOB,
+        {media.hash_columns_sql()})""")
+
+
+def generate(conn, table_name="general_words", words=2000, sparsity=0.0, image_share=0.5, inline_blobs=False,
+             users=(), reviewed_share=0.5, store_root=None, seed=1, batch_size=500):
+    """
+    Fills a word table with synthetic words, media and learner progress.
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    table_name (str): The name of the table.
+    words (int): The number of words.
+    sparsity (float): The share of ID numbers left out (0.0 - consecutive IDs).
+    image_share (float): The share of words with a picture.
+    inline_blobs (bool): Keep the media in BLOB columns (data bases not migrated to the store).
+    users (tuple): The learners to create progress for.
+    reviewed_share (float): The share of words each learner has reviewed.
+    store_root (str): The media store folder (default is paths_info.media_store_path).
+    seed (int): The random seed, the same seed gives the same data base.
+    batch_size (int): The number of rows per transaction.
+
+    Returns:
+    list: The ID numbers of the words.
+    """
+    rng = random.Random(seed)
+    create_word_table(conn, table_name)
+    start = conn.execute(f"SELECT coalesce(max(id_nr), 0) FROM {table_name}").fetchone()[0]
+    ids = []
+    id_nr = start
+    rows = []
+    for n in range(words):
+        id_nr += 1
+        while sparsity and rng.random() < sparsity:
+            id_nr += 1  # a deleted word
+        ids.append(id_nr)
+        blobs = {}
+        for column, (median, sigma) in MEDIA_SIZES.items():
+            if column == "image" and rng.random() >= image_share:
+                blobs[column] = None
+            else:
+                blobs[column] = rng.randbytes(draw_size(rng, median, sigma))
+        values = [id_nr, f"word{id_nr}", f"слово{id_nr}"]
+        for column in media.MEDIA_COLUMNS:
+            data = blobs[column]
+            if inline_blobs:
+                values += [data, *media.media_fields(data)]
+            else:
+                values += [None, *media_store.put(data, store_root)]
+        rows.append(values)
+        if len(rows) >= batch_size or n == words - 1:
+            conn.executemany(f"""INSERT INTO {table_name} (id_nr, words, native_lang,
+                en_sounds, en_sounds_hash, en_sounds_size,
+                ru_sounds, ru_sounds_hash, ru_sounds_size,
+                image, image_hash, image_size) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+            conn.commit()
+            rows = []
+
+    now = datetime.now()
+    for user_name in users:
+        progress.ensure_user(conn, table_name, user_name)
+        for word_id in rng.sample(ids, int(len(ids) * reviewed_share)):
+            length = len(f"word{word_id}")
+            pattern = "".join(rng.choice("abc") for i in range(length))
+            reviewed_at = (now - timedelta(minutes=rng.randint(0, 60 * 24 * 30))).strftime(scheduler.DATE_FORMAT)
+            progress.record_review(conn, table_name, user_name, word_id, pattern, reviewed_at)
+        conn.commit()
+    return ids
+
+
+def main():
+    """
+    Command line entry point of the generator.
+    """
+    parser = argparse.ArgumentParser(description="Generate a synthetic trainer data base")
+    parser.add_argument("--db", required=True, help="path to the data base to create or extend")
+    parser.add_argument("--store", default=paths_info.media_store_path, help="media store folder")
+    parser.add_argument("--table", default="general_words", help="the word table")
+    parser.add_argument("--words", type=int, default=2000, help="number of words")
+    parser.add_argument("--sparsity", type=float, default=0.0, help="share of ID numbers left out")
+    parser.add_argument("--image-share", type=float, default=0.5, help="share of words with a picture")
+    parser.add_argument("--inline-blobs", action="store_true", help="keep the media in BLOB columns")
+    parser.add_argument("--reviewed-share", type=float, default=0.5, help="share of words reviewed per learner")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    args = parser.parse_args()
+
+    conn = db_pool.connect(args.db)
+    ids = generate(conn, args.table, args.words, args.sparsity, args.image_share, args.inline_blobs,
+                   tuple(paths_info.users), args.reviewed_share, args.store, args.seed)
+    conn.close()
+    print(f"{args.table}: {len(ids)} words, ID numbers {ids[0]}-{ids[-1]}")
+
+
+if __name__ == "__main__":
+    main()
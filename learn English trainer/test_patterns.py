@@ -0,0 +1,77 @@
+# Tests of the packed letter patterns: packing round-trips, counts and grading.
+#   python -m unittest test_patterns
+
+import itertools
+import random
+import sqlite3
+import unittest
+import patterns
+import progress
+import scoring
+
+
+class PatternsTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for length in range(10):
+            for letters in itertools.product("abc", repeat=min(length, 5)):
+                pattern = "".join(letters) + "c" * (length - len(letters))
+                packed = patterns.encode(pattern)
+                self.assertEqual(len(packed), (length + 3) // 4)
+                self.assertEqual(patterns.decode(packed), pattern)
+
+    def test_long_round_trip(self):
+        rng = random.Random(1)
+        for _ in range(100):
+            pattern = "".join(rng.choice("abc") for _ in range(rng.randrange(1, 40)))
+            self.assertEqual(patterns.decode(patterns.encode(pattern)), pattern)
+
+    def test_passes_through(self):
+        self.assertIsNone(patterns.encode(None))
+        self.assertIsNone(patterns.decode(None))
+        self.assertEqual(patterns.encode(b"\x9b"), b"\x9b")
+        self.assertEqual(patterns.decode("abc"), "abc")  # a text pattern not packed yet
+        self.assertEqual(patterns.decode(patterns.encode("axc")), "acc")  # other letters count as c
+
+    def test_new(self):
+        self.assertEqual(patterns.decode(patterns.new(6)), "cccccc")
+        self.assertEqual(patterns.new(0), b"")
+        self.assertEqual(patterns.new(None), b"")
+
+    def test_counts(self):
+        for pattern in ("", "a", "abcab", "bbbbbbbbb", "cacacacac"):
+            expected = (pattern.count("a"), pattern.count("b"), len(pattern))
+            self.assertEqual(patterns.counts(pattern), expected)
+            self.assertEqual(patterns.counts(patterns.encode(pattern)), expected)
+
+    def test_letter_counts_of_many(self):
+        rng = random.Random(2)
+        texts = ["".join(rng.choice("abc") for _ in range(rng.randrange(0, 20))) for _ in range(200)]
+        mastered, almost, letters = scoring.letter_counts([patterns.encode(text) for text in texts])
+        self.assertEqual([(int(a), int(b), int(n)) for a, b, n in zip(mastered, almost, letters)],
+                         [patterns.counts(text) for text in texts])
+        self.assertEqual(scoring.total_counts([patterns.encode(text) for text in texts]),
+                         tuple(map(sum, zip(*(patterns.counts(text) for text in texts)))))
+
+    def test_grade(self):
+        # A right letter goes c -> b -> a, a wrong one back to c
+        self.assertEqual(patterns.grade("house", "house", "ccccc"), "bbbbb")
+        self.assertEqual(patterns.grade("house", "house", "bbbcc"), "aaabb")
+        self.assertEqual(patterns.grade("house", "hoose", "aaaaa"), "aacaa")
+        # A short answer misses letters, a new pattern counts its letters as mastered
+        self.assertEqual(patterns.grade("house", "hou", "aaaaa"), "aaacc")
+        self.assertEqual(patterns.grade("house", "house", ""), "aaaaa")
+
+    def test_stored_packed(self):
+        conn = sqlite3.connect(":memory:")
+        progress.ensure_schema(conn)
+        progress.record_review(conn, "words", "user_1", 7, "abcabca", "2026-01-01 10:00:00")
+        stored = conn.execute("SELECT pattern, mastered_count, learning_count, letter_count FROM progress"
+                              ).fetchone()
+        self.assertEqual(stored, (patterns.encode("abcabca"), 3, 2, 7))
+        self.assertEqual(progress.get_pattern(conn, "words", "user_1", 7), "abcabca")
+        conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
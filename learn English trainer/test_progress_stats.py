@@ -0,0 +1,105 @@
+# Tests of the progress counters: what the triggers keep up to date matches a recount.
+#   python -m unittest test_progress_stats
+
+import random
+import sqlite3
+import unittest
+from datetime import date
+import paths_info
+import progress
+import progress_stats
+
+USER_1 = paths_info.user_1
+USER_2 = paths_info.user_2
+
+
+class ProgressStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        # Word table of an old data base: the first learner's progress is still in its columns
+        self.conn.execute(f"""CREATE TABLE words (
+            id_nr INTEGER PRIMARY KEY AUTOINCREMENT,
+            words TEXT UNIQUE, native_lang TEXT,
+            {USER_1} TEXT, {progress.LEGACY_COLUMNS[USER_1]} TEXT)""")
+        self.conn.executemany(f"INSERT INTO words (words, native_lang, {USER_1}, "
+                              f"{progress.LEGACY_COLUMNS[USER_1]}) VALUES (?, ?, ?, ?)", [
+            ("house", "дом", "ccccc", "2026-01-01 09:00:00"),  # imported, never answered
+            ("friend", "друг", "aabcca", "2026-01-02 09:00:00"),
+            ("cat", "кошка", "aaa", "2026-01-03 09:00:00"),
+            ("receive", "получать", None, None),
+        ])
+        self.conn.commit()
+        progress_stats.ensure_schema(self.conn)
+        for user_name in (USER_1, USER_2):
+            progress.ensure_user(self.conn, "words", user_name)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def counters(self):
+        return self.conn.execute("SELECT * FROM progress_stats ORDER BY table_name, user_name").fetchall()
+
+    def assert_counters_match_recount(self):
+        before = self.counters()
+        self.assertEqual(progress_stats.rebuild(self.conn), (0, []))
+        self.assertEqual(self.counters(), before)
+
+    def test_seeded_counters(self):
+        self.assert_counters_match_recount()
+        stats = progress_stats.summary(self.conn, "words", USER_1, days=3, today=date(2026, 1, 3))
+        self.assertEqual(stats["words"], {"total": 4, "new": 2, "learning": 1, "mastered": 1})
+        self.assertEqual(stats["letters"], {"total": 21, "new": 14, "learning": 1, "mastered": 6})
+        # Only the stamps of answered words are reviews
+        self.assertEqual([day["reviews"] for day in stats["reviews_per_day"]], [0, 1, 1])
+
+    def test_reviews_keep_counters(self):
+        progress.record_review(self.conn, "words", USER_1, 1, "bbbbb", "2026-01-05 10:00:00")
+        progress.record_review(self.conn, "words", USER_2, 2, "abcabc", "2026-01-05 11:00:00")
+        progress.record_reviews(self.conn, [("words", USER_2, 2, "aaaaaa", "2026-01-06 10:00:00"),
+                                            ("words", USER_2, 3, "aaa", "2026-01-06 10:00:00")])
+        self.conn.commit()
+        self.assert_counters_match_recount()
+        stats = progress_stats.summary(self.conn, "words", USER_2, days=2, today=date(2026, 1, 6))
+        self.assertEqual(stats["words"]["mastered"], 2)
+        self.assertEqual(stats["reviews_per_day"], [{"day": "2026-01-05", "reviews": 1},
+                                                    {"day": "2026-01-06", "reviews": 2}])
+
+    def test_replayed_review_is_counted_once(self):
+        review = ("words", USER_2, 1, "abcab", "2026-01-05 10:00:00")
+        progress.record_reviews(self.conn, [review])
+        progress.record_reviews(self.conn, [review])  # e.g. replayed from a journal
+        self.conn.commit()
+        stats = progress_stats.summary(self.conn, "words", USER_2, days=1, today=date(2026, 1, 5))
+        self.assertEqual(stats["reviews_per_day"], [{"day": "2026-01-05", "reviews": 1}])
+        self.assert_counters_match_recount()
+
+    def test_random_changes(self):
+        rng = random.Random(3)
+        self.conn.executemany("INSERT INTO words (words, native_lang) VALUES (?, ?)",
+                              [(f"word{i}", f"слово{i}") for i in range(50)])
+        for user_name in (USER_1, USER_2):
+            progress.ensure_user(self.conn, "words", user_name)
+        lengths = dict(self.conn.execute("SELECT id_nr, length(words) FROM words"))
+        for minute in range(300):
+            word_id = rng.choice(list(lengths))
+            pattern = "".join(rng.choice("abc") for _ in range(lengths[word_id]))
+            progress.record_review(self.conn, "words", rng.choice((USER_1, USER_2)), word_id, pattern,
+                                   f"2026-02-{minute // 60 + 1:02d} 10:{minute % 60:02d}:00")
+        self.conn.execute("DELETE FROM progress WHERE word_id % 7 = 0")
+        self.conn.commit()
+        self.assert_counters_match_recount()
+
+    def test_rebuild_fixes_wrong_counters(self):
+        self.conn.execute("UPDATE progress_stats SET words_mastered = words_mastered + 5 WHERE user_name = ?",
+                          (USER_1,))
+        self.conn.execute("UPDATE progress SET letter_count = 0 WHERE user_name = ? AND word_id = 2", (USER_2,))
+        self.conn.commit()
+        fixed, wrong = progress_stats.rebuild(self.conn)
+        self.assertEqual(fixed, 1)
+        self.assertIn(("words", USER_1, "words_mastered", 6, 1), wrong)
+        self.assert_counters_match_recount()
+
+
+if __name__ == "__main__":
+    unittest.main()
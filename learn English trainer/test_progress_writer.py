@@ -0,0 +1,139 @@
+# Tests of the write-behind progress writer: coalescing, flushes, replay after a crash
+# and the answers of the other processes seen through their journals.
+#   python -m unittest test_progress_writer
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import patterns
+import progress
+import progress_writer
+
+
+class ProgressWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.folder, "progress.db")
+        self.journal_folder = os.path.join(self.folder, "journals")
+        conn = sqlite3.connect(self.db_path)
+        progress.ensure_schema(conn)
+        conn.commit()
+        conn.close()
+        self.writers = []
+
+    def tearDown(self):
+        for writer in self.writers:
+            writer.close()
+        shutil.rmtree(self.folder)
+
+    def start_writer(self):
+        # No flush by time or size: the tests flush themselves
+        writer = progress_writer.ProgressWriter(self.db_path, flush_ms=10 ** 7, max_batch=10 ** 7,
+                                                journal_folder=self.journal_folder)
+        writer.start()
+        self.writers.append(writer)
+        return writer
+
+    def crash(self, writer):
+        """
+        Stops a writer like a killed process: the thread ends, nothing is flushed, the journal stays.
+        """
+        with writer._cond:
+            writer._closed = True
+            writer._cond.notify()
+        writer._thread.join()
+        writer._journal.close()  # the lock goes with the process
+        writer._conn.close()
+        self.writers.remove(writer)
+
+    def stored(self, user_name="user_1"):
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute("SELECT word_id, pattern, reviewed_at FROM progress WHERE user_name = ? ORDER BY word_id",
+                            (user_name,)).fetchall()
+        conn.close()
+        return [(word_id, patterns.decode(pattern), reviewed_at) for word_id, pattern, reviewed_at in rows]
+
+    def journals(self):
+        return sorted(os.listdir(self.journal_folder))
+
+    def test_flush_coalesces(self):
+        writer = self.start_writer()
+        writer.submit("words", "user_1", 1, "cc", "2026-01-01 10:00:00")
+        writer.submit("words", "user_1", 1, "bb", "2026-01-01 10:00:05")
+        writer.submit("words", "user_1", 2, "a", "2026-01-01 10:00:06")
+        self.assertEqual(self.stored(), [])
+        self.assertEqual(writer.pending("words", "user_1", 1)[:2], ("bb", "2026-01-01 10:00:05"))
+        self.assertEqual(writer.flush(), 2)
+        self.assertEqual(self.stored(), [(1, "bb", "2026-01-01 10:00:05"), (2, "a", "2026-01-01 10:00:06")])
+        self.assertIsNone(writer.pending("words", "user_1", 1))
+        self.assertEqual(writer.flush(), 0)
+
+    def test_close_stores_and_removes_journal(self):
+        writer = self.start_writer()
+        writer.submit("words", "user_1", 1, "ab", "2026-01-01 10:00:00")
+        writer.close()
+        self.writers.remove(writer)
+        self.assertEqual(self.stored(), [(1, "ab", "2026-01-01 10:00:00")])
+        self.assertEqual(self.journals(), [])
+
+    def test_replay_after_crash(self):
+        writer = self.start_writer()
+        writer.submit("words", "user_1", 1, "cc", "2026-01-01 10:00:00")
+        writer.submit("words", "user_1", 1, "ba", "2026-01-01 10:00:05")
+        writer.submit("words", "user_1", 3, "abc", "2026-01-01 10:00:06")
+        journal = writer._journal.name
+        self.crash(writer)
+        with open(journal, "a", encoding="utf-8") as open_file:
+            open_file.write('["words", "user_1", 4, "a')  # a line cut by the crash
+        self.assertEqual(self.stored(), [])
+
+        self.start_writer()
+        self.assertEqual(self.stored(), [(1, "ba", "2026-01-01 10:00:05"), (3, "abc", "2026-01-01 10:00:06")])
+        self.assertFalse(os.path.exists(journal))
+
+    def test_replay_keeps_newer_review(self):
+        writer = self.start_writer()
+        writer.submit("words", "user_1", 1, "cc", "2026-01-01 10:00:00")
+        self.crash(writer)
+        conn = sqlite3.connect(self.db_path)
+        progress.record_review(conn, "words", "user_1", 1, "aa", "2026-01-02 10:00:00")
+        conn.commit()
+        conn.close()
+        self.start_writer()
+        self.assertEqual(self.stored(), [(1, "aa", "2026-01-02 10:00:00")])
+
+    def test_live_journal_is_not_replayed(self):
+        first = self.start_writer()
+        first.submit("words", "user_1", 1, "ab", "2026-01-01 10:00:00")
+        self.start_writer()
+        self.assertEqual(self.stored(), [])
+        self.assertEqual(len(self.journals()), 2)
+
+    def test_answers_of_other_writers(self):
+        first = self.start_writer()
+        second = self.start_writer()
+        first.submit("words", "user_1", 1, "cc", "2026-01-01 10:00:00")
+        first.submit("words", "user_2", 1, "aa", "2026-01-01 10:00:00")
+        self.assertEqual(second.pending("words", "user_1", 1)[:2], ("cc", "2026-01-01 10:00:00"))
+        self.assertEqual(set(second.pending_for_user("words", "user_2")), {1})
+
+        # Appended lines are read, the newest answer of a word wins whichever writer has it
+        second.submit("words", "user_1", 1, "bb", "2026-01-01 10:00:10")
+        first.submit("words", "user_1", 2, "a", "2026-01-01 10:00:20")
+        waiting = second.pending_for_user("words", "user_1")
+        self.assertEqual({word_id: answer[:2] for word_id, answer in waiting.items()},
+                         {1: ("bb", "2026-01-01 10:00:10"), 2: ("a", "2026-01-01 10:00:20")})
+
+        # Once stored, the answers of the first writer are read from the data base
+        self.assertEqual(first.flush(), 3)
+        self.assertEqual(set(second.pending_for_user("words", "user_1")), {1})
+        self.assertEqual(second.pending_for_user("words", "user_2"), {})
+        first.submit("words", "user_2", 5, "b", "2026-01-01 10:00:30")
+        self.assertEqual(set(second.pending_for_user("words", "user_2")), {5})
+
+
+if __name__ == "__main__":
+    unittest.main()
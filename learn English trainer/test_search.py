@@ -0,0 +1,88 @@
+# Tests of the word search: one typo of every kind is found, in short words too.
+#   python -m unittest test_search
+
+import sqlite3
+import unittest
+import media
+import search
+
+WORDS = [
+    ("receive", "получать"),
+    ("friend", "друг"),
+    ("house", "дом"),
+    ("because", "потому что"),
+    ("cause", "причина"),
+    ("mouse", "мышь"),
+    ("London", "лондон"),
+    ("Apple", "яблоко"),
+]
+
+
+class SearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute(f"""CREATE TABLE words (
+            id_nr INTEGER PRIMARY KEY AUTOINCREMENT,
+            words TEXT UNIQUE, native_lang TEXT, en_sounds BLOB, ru_sounds BLOB, image BLOB,
+            {media.hash_columns_sql()})""")
+        self.conn.executemany("INSERT INTO words (words, native_lang) VALUES (?, ?)", WORDS)
+        self.conn.commit()
+        search._ready_tables.discard("words")
+        search.ensure_index(self.conn, "words")
+
+    def tearDown(self):
+        self.conn.close()
+
+    def best(self, query):
+        results = search.search(self.conn, "words", query)
+        return results[0]["words"] if results else None
+
+    def test_exact_and_prefix(self):
+        self.assertEqual(self.best("house"), "house")
+        self.assertEqual(self.best("frie"), "friend")
+
+    def test_missing_letter(self):
+        self.assertEqual(self.best("recive"), "receive")
+        self.assertEqual(self.best("frend"), "friend")
+
+    def test_wrong_letter(self):
+        self.assertEqual(self.best("hause"), "house")
+        self.assertEqual(self.best("receiwe"), "receive")
+
+    def test_swapped_letters(self):
+        self.assertEqual(self.best("recieve"), "receive")
+        self.assertEqual(self.best("hosue"), "house")
+
+    def test_extra_letter(self):
+        self.assertEqual(self.best("hoouse"), "house")
+        self.assertEqual(self.best("friennd"), "friend")
+
+    def test_translation(self):
+        self.assertEqual(self.best("друк"), "friend")
+        self.assertEqual(self.best("потому"), "because")
+
+    def test_any_case(self):
+        self.assertEqual(self.best("london"), "London")
+        self.assertEqual(self.best("aple"), "Apple")
+        self.assertEqual(self.best("LONDN"), "London")
+
+    def test_short_query(self):
+        self.assertEqual(self.best("lo"), "London")
+        self.assertEqual(self.best("яб"), "Apple")
+        self.assertEqual(self.best("z"), None)
+
+    def test_new_words_are_indexed(self):
+        self.conn.execute("INSERT INTO words (words, native_lang) VALUES ('receipt', 'квитанция')")
+        self.conn.commit()
+        self.assertEqual(self.best("reciept"), "receipt")
+
+    def test_typo_variants(self):
+        variants = search.typo_variants("abc")
+        self.assertNotIn("abc", variants)
+        for variant in ("bc", "bac", "abd", "abcd", "xabc"):
+            self.assertIn(variant, variants)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+# Process-level cache of the static content of the word tables: text, translation and media
+# hashes. Triggers bump a per-table counter in content_version on every
+# change of that content (adminka, admin_cli, imports, migrations - whoever writes), and the
+# cache reads the counter at most every paths_info.word_cache_check_ms to drop stale entries.
+
+import threading
+import time
+from collections import OrderedDict
+import paths_info
+import media
+import metrics
+
+# Columns whose change makes the cached content stale
+CONTENT_COLUMNS = ("words", "native_lang") + tuple(f"{column}_hash" for column in media.MEDIA_COLUMNS)
+
+# Tables whose triggers exist, per process
+_ready_tables = set()
+
+
+def ensure_triggers(conn, table_name):
+    """
+    Creates the content_version table and the triggers of a word table that bump it
+    (run by migrate.py after the hash columns, the cache only reads the counter).
+
+    Parameters:
+    conn (sqlite3.Connection): A connection object.
+    table_name (str): The name of the word table.
+    """
+    if table_name in _ready_tables:
+        return
+    bump = f"""INSERT INTO content_version VALUES ('{table_name}', 1)
+        ON CONFLICT (table_name) DO UPDATE SET version = version + 1;"""
+    conn.execute("""CREATE TABLE IF NOT EXISTS content_version (
+        table_name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL) WITHOUT ROWID""")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS {table_name}_content_insert AFTER INSERT ON {table_name} "
+                 f"BEGIN {bump} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS {table_name}_content_update "
+                 f"AFTER UPDATE OF {', '.join(CONTENT_COLUMNS)} ON {table_name} BEGIN {bump} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS {table_name}_content_delete AFTER DELETE ON {table_name} "
+                 f"BEGIN {bump} END")
+    conn.commit()
+    _ready_tables.add(table_name)
+
+
+class WordCache:
+    """
+    A bounded LRU cache of word rows, shared by the threads of a process.
+
+    Attributes:
+    max_words (int): The number of words kept (of all tables together).
+    check_ms (int): How often the content counters are read, i.e. how stale an admin edit may be seen.
+    """
+    def __init__(self, max_words=None, check_ms=None):
+        self.max_words = max_words or paths_info.word_cache_size
+        self.check_ms = check_ms if check_ms is not None else paths_info.word_cache_check_ms
+        self._words = OrderedDict()  # (table, id_nr) -> (version, words, native_lang, hashes)
+        self._versions = {}  # table -> (version, checked at)
+        self._lock = threading.Lock()
+
+    def version(self, conn, table_name):
+        """
+        Returns the content counter of a table, read again if the last read is older than check_ms.
+
+        Parameters:
+        conn (sqlite3.Connection): A connection object.
+        table_name (str): The name of the word table.
+
+        Returns:
+        int: The content version.
+        """
+        now = time.monotonic()
+        known = self._versions.get(table_name)
+        if known and now - known[1] < self.check_ms / 1000:
+            return known[0]
+        row = conn.execute("SELECT version FROM content_version WHERE table_name = ?", (table_name,)).fetchone()
+        version = row[0] if row else 0
+        self._versions[table_name] = (version, now)
+        return version
+
+    def get(self, conn, table_name, id_nr):
+        """
+        Returns the static content of a word.
+
+        Parameters:
+        conn (sqlite3.Connection): A connection object.
+        table_name (str): The name of the word table.
+        id_nr (int): The ID number of the word.
+
+        Returns:
+        tuple or None: The word, its translation and its media hashes (dict), or None if there is no such word.
+        """
+        version = self.version(conn, table_name)
+        key = (table_name, id_nr)
+        with self._lock:
+            entry = self._words.get(key)
+            if entry is not None and entry[0] == version:
+                self._words.move_to_end(key)
+                metrics.cache_lookups.inc(cache="word_cache", result="hit")
+                return entry[1:]
+        metrics.cache_lookups.inc(cache="word_cache", result="miss")
+        hash_columns = ", ".join(f"{column}_hash" for column in media.MEDIA_COLUMNS)
+        row = conn.execute(f"SELECT words, native_lang, {hash_columns} FROM {table_name} WHERE id_nr = ?",
+                           (id_nr,)).fetchone()
+        if row is None:
+            return None
+        entry = (version, row[0], row[1], dict(zip(media.MEDIA_COLUMNS, row[2:])))
+        with self._lock:
+            self._words[key] = entry
+            self._words.move_to_end(key)
+            while len(self._words) > self.max_words:
+                self._words.popitem(last=False)
+        return entry[1:]
+
+    def next_id(self, conn, table_name, current_id, upper_id):
+        """
+        Finds the first ID number after current_id, up to upper_id. It is one seek of the
+        primary key, so the IDs are not cached: a table of any size costs no memory here.
+
+        Parameters:
+        conn (sqlite3.Connection): A connection object.
+        table_name (str): The name of the word table.
+        current_id (int): The current ID number.
+        upper_id (int): The highest ID number allowed.
+
+        Returns:
+        int or None: The next ID number, or None if there is none in the range.
+        """
+        row = conn.execute(f"""SELECT id_nr FROM {table_name}
+            WHERE id_nr > ? AND id_nr <= ?
+            ORDER BY id_nr
+            LIMIT 1""", (current_id, upper_id)).fetchone()
+        return row[0] if row else None